@@ -0,0 +1,303 @@
+# LitS3.Commander
+# End-to-end benchmark for the command-line interface to LitS3
+#
+# The MIT License
+#
+# Copyright (c) 2008, Nick Farina
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Runs s3cmd commands against the local stand-in server (s3local) over a
+generated workload of many small files under deep prefixes and a few huge
+ones, and reports the wall time, throughput and request latencies of each.
+Every command runs in a new process, as it would from the shell, with
+--stats-json so that the requests it made are counted and timed too.
+
+The results can be saved as a baseline and later runs compared with it, so
+that a change that makes a command slower shows up without an AWS account.
+
+Usage:
+
+  s3bench [OPTIONS] [SCENARIO ...]
+
+where OPTIONS are:
+
+  --runs N                Run each scenario N times and keep the median (3)
+  --small N               Number of small files (1000)
+  --small-size BYTES      Size of each small file (4K)
+  --depth N               Levels of prefixes the small files are spread
+                          over, four ways at each level (4)
+  --huge N                Number of huge files (2)
+  --huge-size BYTES       Size of each huge file (64M)
+  --latency MS            Delay the server adds to every request (0)
+  --jitter MS             Random delay the server adds on top (0)
+  --error-rate FRACTION   Fraction of requests the server fails (0)
+  --page-size N           Keys per listing page the server returns (1000)
+  --save FILE             Save the results as a baseline
+  --compare FILE          Compare the results with a saved baseline and
+                          fail if a scenario got slower than allowed
+  --tolerance FACTOR      How much slower is allowed (1.25)
+  --keep                  Keep the generated files and server data
+
+and each SCENARIO is one of the names listed by the report; all of them
+run by default.
+"""
+
+import sys, re
+
+from System import Environment, Random, Guid, Byte, Array
+from System.IO import Path, File, Directory
+from System.Diagnostics import Process, ProcessStartInfo, Stopwatch
+
+from startupbench import is_windows
+from s3local import LocalS3
+
+BUCKET = 'bench'
+SIZE_UNITS = { '': 1, 'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024 }
+
+def parse_size(arg):
+    match = re.match(r'^(\d+)([KMG]?)B?$', arg.upper())
+    if not match:
+        raise Exception('Invalid size: %s' % arg)
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+class Workload(object):
+    """Generates the local files the scenarios upload and a directory for
+    what they download."""
+
+    def __init__(self, root, small, small_size, depth, huge, huge_size):
+        self.root = root
+        self.small_dir = Path.Combine(root, 'small')
+        self.down_dir = Path.Combine(root, 'down')
+        self.manifest = Path.Combine(root, 'manifest.txt')
+        self.small_bytes = small * small_size
+        self.huge_size = huge_size
+        self.huge_files = []
+        self.deep_prefix = ''.join(['d0/' for level in range(depth)])
+        random = Random(1)
+        buffer = Array.CreateInstance(Byte, small_size)
+        keys = []
+        for i in range(small):
+            dirs = [self.small_dir] + ['d%d' % ((i >> (2 * level)) % 4) for level in range(depth)]
+            dpath = reduce(Path.Combine, dirs)
+            Directory.CreateDirectory(dpath)
+            random.NextBytes(buffer)
+            File.WriteAllBytes(Path.Combine(dpath, 'file%05d.bin' % i), buffer)
+            keys.append('/'.join(dirs[1:] + ['file%05d.bin' % i]))
+        File.WriteAllText(self.manifest, '\n'.join(keys))
+        chunk = Array.CreateInstance(Byte, 1024 * 1024)
+        for i in range(huge):
+            fpath = Path.Combine(root, 'huge%d.bin' % i)
+            stream = File.Create(fpath)
+            try:
+                left = huge_size
+                while left > 0:
+                    random.NextBytes(chunk)
+                    count = min(left, chunk.Length)
+                    stream.Write(chunk, 0, count)
+                    left -= count
+            finally:
+                stream.Close()
+            self.huge_files.append(fpath)
+        Directory.CreateDirectory(self.down_dir)
+
+    def clear_down(self):
+        Directory.Delete(self.down_dir, True)
+        Directory.CreateDirectory(self.down_dir)
+
+def scenarios(w):
+    """Lists the scenarios as tuples of name, what to do before every run
+    (command lines and/or a function), the command lines that are timed
+    and how many bytes of content they move."""
+    small = 's3://%s/small/' % BUCKET
+    copy = 's3://%s/copy/' % BUCKET
+    huge = ['s3://%s/huge/%s' % (BUCKET, Path.GetFileName(f)) for f in w.huge_files]
+    huge_bytes = w.huge_size * len(huge)
+    return [
+        ('put-small', ['rm %s --recursive --workers 8' % small],
+            ['sync "%s" %s' % (w.small_dir, small)], w.small_bytes),
+        ('sync-unchanged', [], ['sync "%s" %s' % (w.small_dir, small)], 0),
+        ('get-small', [w.clear_down], ['sync %s "%s"' % (small, w.down_dir)], w.small_bytes),
+        ('list-all', [], ['authurl %s --recursive' % small], 0),
+        ('ls-deep', [], ['ls %s%s' % (small, w.deep_prefix)], 0),
+        ('ls-parallel', [], ['ls %s%s --parallel 8' % (small, w.deep_prefix[:3])], 0),
+        ('du', [], ['du %s --depth 2 --workers 8' % small], 0),
+        ('find', [], ['find %s --path "d0/*/d1/*.bin"' % small], 0),
+        ('put-huge', [], ['put s3://%s/huge/ "%s"' % (BUCKET, f) for f in w.huge_files], huge_bytes),
+        ('put-huge-parallel', [],
+            ['put s3://%s/huge/ "%s" --parallel 4' % (BUCKET, f) for f in w.huge_files], huge_bytes),
+        ('get-huge', [w.clear_down],
+            ['get %s "%s"' % (uri, Path.Combine(w.down_dir, uri.split('/')[-1])) for uri in huge], huge_bytes),
+        ('get-huge-parallel', [w.clear_down],
+            ['get %s "%s" --parallel 4' % (uri, Path.Combine(w.down_dir, uri.split('/')[-1])) for uri in huge], huge_bytes),
+        ('cp-small', ['rm %s --recursive --workers 8' % copy],
+            ['cp %s %s --recursive --workers 8' % (small, copy)], 0),
+        ('rm-small', ['cp %s %s --recursive --workers 8' % (small, copy)],
+            ['rm %s --recursive --workers 8' % copy], 0),
+        ('exists', [], ['exists %s' % uri for uri in huge], 0),
+        ('stat-small', [], ['stat %s --from-file "%s" --window 32' % (small, w.manifest)], 0),
+    ]
+
+def s3cmd(command_line, endpoint):
+    """Runs s3cmd once against the endpoint and returns how long it took in
+    milliseconds along with what it wrote to standard error."""
+    home = Path.GetDirectoryName(Path.GetFullPath(sys.argv[0]))
+    command_line = '%s --endpoint %s --aws-key-id X --aws-secret-key Y --stats-json' % (command_line, endpoint)
+    if is_windows():
+        info = ProcessStartInfo(Environment.GetEnvironmentVariable('COMSPEC'),
+                                '/c "%s" %s' % (Path.Combine(home, 's3cmd.cmd'), command_line))
+    else:
+        info = ProcessStartInfo('/bin/bash', '"%s" %s' % (Path.Combine(home, 's3cmd'), command_line))
+    info.UseShellExecute = False
+    info.RedirectStandardOutput = True
+    info.RedirectStandardError = True
+    stopwatch = Stopwatch.StartNew()
+    process = Process.Start(info)
+    process.StandardOutput.ReadToEnd()
+    error = process.StandardError.ReadToEnd()
+    process.WaitForExit()
+    elapsed = stopwatch.Elapsed.TotalMilliseconds
+    if process.ExitCode != 0:
+        raise Exception('s3cmd %s failed: %s' % (command_line, error.strip()))
+    return elapsed, error
+
+def read_stats(stderr):
+    """Picks the request count and latency percentiles out of the line of
+    JSON that --stats-json prints."""
+    stats = { 'requests': 0, 'p50': 0.0, 'p99': 0.0 }
+    for line in stderr.splitlines():
+        if not line.startswith('{'):
+            continue
+        match = re.search(r'"requests": (\d+)', line)
+        if match:
+            stats['requests'] += int(match.group(1))
+        match = re.search(r'"latency_ms": \{[^}]*"p50": ([\d.]+), "p90": [\d.]+, "p99": ([\d.]+)', line)
+        if match:
+            stats['p50'] = max(stats['p50'], float(match.group(1)))
+            stats['p99'] = max(stats['p99'], float(match.group(2)))
+    return stats
+
+def run_scenario(scenario, endpoint, runs):
+    name, prepare, commands, bytes = scenario
+    results = []
+    for i in range(runs):
+        for step in prepare:
+            if callable(step):
+                step()
+            else:
+                s3cmd(step, endpoint)
+        elapsed, stderr = 0.0, ''
+        for command_line in commands:
+            ms, error = s3cmd(command_line, endpoint)
+            elapsed += ms
+            stderr += error
+        stats = read_stats(stderr)
+        stats['ms'] = elapsed
+        results.append(stats)
+    results.sort(lambda a, b: cmp(a['ms'], b['ms']))
+    median = results[len(results) // 2]
+    median['min_ms'] = results[0]['ms']
+    median['bytes_per_sec'] = median['ms'] and bytes * 1000.0 / median['ms'] or 0.0
+    return median
+
+def load_baseline(fpath):
+    baseline = {}
+    for line in File.ReadAllLines(fpath):
+        fields = line.split('\t')
+        if len(fields) >= 2 and line[0] != '#':
+            baseline[fields[0]] = float(fields[1])
+    return baseline
+
+def save_baseline(fpath, results):
+    lines = ['# scenario\tmedian ms\tbytes/sec\trequests\tp50 ms\tp99 ms']
+    for name, r in results:
+        lines.append('%s\t%.1f\t%.0f\t%d\t%.1f\t%.1f' % (name, r['ms'], r['bytes_per_sec'], r['requests'], r['p50'], r['p99']))
+    File.WriteAllText(fpath, '\n'.join(lines) + '\n')
+
+def main(args):
+    options = {}
+    flags = ('keep', )
+    names = []
+    while args:
+        arg = args.pop(0)
+        if arg[:2] != '--':
+            names.append(arg)
+        elif arg[2:] in flags:
+            options[arg[2:]] = True
+        elif args:
+            options[arg[2:]] = args.pop(0)
+        else:
+            raise Exception('Missing argument value: %s' % arg[2:])
+    runs = int(options.get('runs', 3))
+    tolerance = float(options.get('tolerance', 1.25))
+    baseline = options.get('compare') and load_baseline(options['compare']) or {}
+
+    root = Path.Combine(Path.GetTempPath(), 's3bench-' + Guid.NewGuid().ToString('N'))
+    server_root = Path.Combine(root, 'server')
+    Directory.CreateDirectory(server_root)
+    print >> sys.stderr, 'Generating workload in %s...' % root
+    workload = Workload(Path.Combine(root, 'local'),
+        int(options.get('small', 1000)), parse_size(options.get('small-size', '4K')), int(options.get('depth', 4)),
+        int(options.get('huge', 2)), parse_size(options.get('huge-size', '64M')))
+    server = LocalS3(server_root, 0, int(options.get('latency', 0)), int(options.get('jitter', 0)),
+        float(options.get('error-rate', 0)), page_size = int(options.get('page-size', 1000))).start()
+    regressions = []
+    try:
+        endpoint = server.endpoint
+        all = scenarios(workload)
+        unknown = [name for name in names if name not in [s[0] for s in all]]
+        if unknown:
+            raise Exception('Unknown scenario(s): %s' % ', '.join(unknown))
+        print >> sys.stderr, 'Uploading workload to %s...' % endpoint
+        s3cmd('mkbkt %s' % BUCKET, endpoint)
+        s3cmd('sync "%s" s3://%s/small/' % (workload.small_dir, BUCKET), endpoint)
+        for fpath in workload.huge_files:
+            s3cmd('put s3://%s/huge/ "%s"' % (BUCKET, fpath), endpoint)
+        print '%-18s %10s %10s %12s %9s %9s %9s' % ('', 'median ms', 'min ms', 'MB/sec', 'requests', 'p50 ms', 'p99 ms')
+        results = []
+        for scenario in all:
+            name = scenario[0]
+            if names and name not in names:
+                continue
+            r = run_scenario(scenario, endpoint, runs)
+            results.append((name, r))
+            note = ''
+            if name in baseline and baseline[name] > 0:
+                ratio = r['ms'] / baseline[name]
+                note = '%+.0f%%' % ((ratio - 1) * 100)
+                if ratio > tolerance:
+                    note += ' REGRESSION'
+                    regressions.append(name)
+            print '%-18s %10.0f %10.0f %12.2f %9d %9.1f %9.1f  %s' % (name, r['ms'], r['min_ms'],
+                r['bytes_per_sec'] / (1024 * 1024), r['requests'], r['p50'], r['p99'], note)
+        if options.get('save'):
+            save_baseline(options['save'], results)
+    finally:
+        server.stop()
+        if not options.get('keep', False):
+            Directory.Delete(root, True)
+    if regressions:
+        raise Exception('Slower than the baseline allows: %s' % ', '.join(regressions))
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1:])
+    except Exception, e:
+        print >> sys.stderr, e
+        sys.exit(1)
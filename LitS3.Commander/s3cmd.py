@@ -32,257 +32,1415 @@
 import sys, clr, re
 
 from System import \
-    DateTime, Int64, Byte, Array, Enum, Convert, Environment, PlatformID, \
-    Uri, UriFormat, UriComponents, UriParser, GenericUriParser, GenericUriParserOptions
-from System.IO import Path, FileInfo, Directory, MemoryStream, File
+    DateTime, DateTimeKind, TimeSpan, Random, Int64, Byte, Char, String, Array, Enum, Convert, Environment, BitConverter, Object, \
+    Uri, UriFormat, UriComponents, Console, Int32, AsyncCallback, Action, Guid
+from System.IO import Path, FileInfo, Directory, MemoryStream, File, SearchOption, IOException, \
+    FileStream, FileMode, FileAccess, FileShare, SeekOrigin, Stream
 from System.Text import Encoding
+from System.Globalization import NumberStyles
+from System.Threading import Thread, ThreadStart, Monitor, Timer, TimerCallback, Timeout
+from System.Net import ServicePointManager, WebException, BindIPEndPoint
+from System.Diagnostics import Stopwatch
 from System.Environment import GetEnvironmentVariable
 
-clr.AddReference("System.Security")
-from System.Security.Cryptography import ProtectedData, DataProtectionScope, RNGCryptoServiceProvider
+from System.Security.Cryptography import MD5
 
 clr.AddReferenceToFile('LitS3.dll')
 from LitS3 import *
 
-MIME_MAP = {
-    '.323'    : 'text/h323',
-    '.asx'    : 'video/x-ms-asf',
-    '.acx'    : 'application/internet-property-stream',
-    '.ai'     : 'application/postscript',
-    '.aif'    : 'audio/x-aiff',
-    '.aiff'   : 'audio/aiff',
-    '.axs'    : 'application/olescript',
-    '.aifc'   : 'audio/aiff',
-    '.asr'    : 'video/x-ms-asf',
-    '.avi'    : 'video/x-msvideo',
-    '.asf'    : 'video/x-ms-asf',
-    '.au'     : 'audio/basic',
-    '.bin'    : 'application/octet-stream',
-    '.bas'    : 'text/plain',
-    '.bcpio'  : 'application/x-bcpio',
-    '.bmp'    : 'image/bmp',
-    '.cdf'    : 'application/x-cdf',
-    '.cat'    : 'application/vndms-pkiseccat',
-    '.crt'    : 'application/x-x509-ca-cert',
-    '.c'      : 'text/plain',
-    '.css'    : 'text/css',
-    '.cer'    : 'application/x-x509-ca-cert',
-    '.crl'    : 'application/pkix-crl',
-    '.cmx'    : 'image/x-cmx',
-    '.csh'    : 'application/x-csh',
-    '.cod'    : 'image/cis-cod',
-    '.cpio'   : 'application/x-cpio',
-    '.clp'    : 'application/x-msclip',
-    '.crd'    : 'application/x-mscardfile',
-    '.dll'    : 'application/x-msdownload',
-    '.dot'    : 'application/msword',
-    '.doc'    : 'application/msword',
-    '.dvi'    : 'application/x-dvi',
-    '.dir'    : 'application/x-director',
-    '.dxr'    : 'application/x-director',
-    '.der'    : 'application/x-x509-ca-cert',
-    '.dib'    : 'image/bmp',
-    '.dcr'    : 'application/x-director',
-    '.disco'  : 'text/xml',
-    '.exe'    : 'application/octet-stream',
-    '.etx'    : 'text/x-setext',
-    '.evy'    : 'application/envoy',
-    '.eml'    : 'message/rfc822',
-    '.eps'    : 'application/postscript',
-    '.flr'    : 'x-world/x-vrml',
-    '.fif'    : 'application/fractals',
-    '.gtar'   : 'application/x-gtar',
-    '.gif'    : 'image/gif',
-    '.gz'     : 'application/x-gzip',
-    '.hta'    : 'application/hta',
-    '.htc'    : 'text/x-component',
-    '.htt'    : 'text/webviewhtml',
-    '.h'      : 'text/plain',
-    '.hdf'    : 'application/x-hdf',
-    '.hlp'    : 'application/winhlp',
-    '.html'   : 'text/html',
-    '.htm'    : 'text/html',
-    '.hqx'    : 'application/mac-binhex40',
-    '.isp'    : 'application/x-internet-signup',
-    '.iii'    : 'application/x-iphone',
-    '.ief'    : 'image/ief',
-    '.ivf'    : 'video/x-ivf',
-    '.ins'    : 'application/x-internet-signup',
-    '.ico'    : 'image/x-icon',
-    '.jpg'    : 'image/jpeg',
-    '.jfif'   : 'image/pjpeg',
-    '.jpe'    : 'image/jpeg',
-    '.jpeg'   : 'image/jpeg',
-    '.js'     : 'application/x-javascript',
-    '.lsx'    : 'video/x-la-asf',
-    '.latex'  : 'application/x-latex',
-    '.lsf'    : 'video/x-la-asf',
-    '.mhtml'  : 'message/rfc822',
-    '.mny'    : 'application/x-msmoney',
-    '.mht'    : 'message/rfc822',
-    '.mid'    : 'audio/mid',
-    '.mpv2'   : 'video/mpeg',
-    '.man'    : 'application/x-troff-man',
-    '.mvb'    : 'application/x-msmediaview',
-    '.mpeg'   : 'video/mpeg',
-    '.m3u'    : 'audio/x-mpegurl',
-    '.mdb'    : 'application/x-msaccess',
-    '.mpp'    : 'application/vnd.ms-project',
-    '.m1v'    : 'video/mpeg',
-    '.mpa'    : 'video/mpeg',
-    '.me'     : 'application/x-troff-me',
-    '.m13'    : 'application/x-msmediaview',
-    '.movie'  : 'video/x-sgi-movie',
-    '.m14'    : 'application/x-msmediaview',
-    '.mpe'    : 'video/mpeg',
-    '.mp2'    : 'video/mpeg',
-    '.mov'    : 'video/quicktime',
-    '.mp3'    : 'audio/mpeg',
-    '.mpg'    : 'video/mpeg',
-    '.ms'     : 'application/x-troff-ms',
-    '.nc'     : 'application/x-netcdf',
-    '.nws'    : 'message/rfc822',
-    '.oda'    : 'application/oda',
-    '.ods'    : 'application/oleobject',
-    '.pmc'    : 'application/x-perfmon',
-    '.p7r'    : 'application/x-pkcs7-certreqresp',
-    '.p7b'    : 'application/x-pkcs7-certificates',
-    '.p7s'    : 'application/pkcs7-signature',
-    '.pmw'    : 'application/x-perfmon',
-    '.ps'     : 'application/postscript',
-    '.p7c'    : 'application/pkcs7-mime',
-    '.pbm'    : 'image/x-portable-bitmap',
-    '.ppm'    : 'image/x-portable-pixmap',
-    '.pub'    : 'application/x-mspublisher',
-    '.png'    : 'image/png',
-    '.pnm'    : 'image/x-portable-anymap',
-    '.pml'    : 'application/x-perfmon',
-    '.p10'    : 'application/pkcs10',
-    '.pfx'    : 'application/x-pkcs12',
-    '.p12'    : 'application/x-pkcs12',
-    '.pdf'    : 'application/pdf',
-    '.pps'    : 'application/vnd.ms-powerpoint',
-    '.p7m'    : 'application/pkcs7-mime',
-    '.pko'    : 'application/vndms-pkipko',
-    '.ppt'    : 'application/vnd.ms-powerpoint',
-    '.pmr'    : 'application/x-perfmon',
-    '.pma'    : 'application/x-perfmon',
-    '.pot'    : 'application/vnd.ms-powerpoint',
-    '.prf'    : 'application/pics-rules',
-    '.pgm'    : 'image/x-portable-graymap',
-    '.qt'     : 'video/quicktime',
-    '.ra'     : 'audio/x-pn-realaudio',
-    '.rgb'    : 'image/x-rgb',
-    '.ram'    : 'audio/x-pn-realaudio',
-    '.rmi'    : 'audio/mid',
-    '.ras'    : 'image/x-cmu-raster',
-    '.roff'   : 'application/x-troff',
-    '.rtf'    : 'application/rtf',
-    '.rtx'    : 'text/richtext',
-    '.sv4crc' : 'application/x-sv4crc',
-    '.spc'    : 'application/x-pkcs7-certificates',
-    '.setreg' : 'application/set-registration-initiation',
-    '.snd'    : 'audio/basic',
-    '.stl'    : 'application/vndms-pkistl',
-    '.setpay' : 'application/set-payment-initiation',
-    '.stm'    : 'text/html',
-    '.shar'   : 'application/x-shar',
-    '.sh'     : 'application/x-sh',
-    '.sit'    : 'application/x-stuffit',
-    '.spl'    : 'application/futuresplash',
-    '.sct'    : 'text/scriptlet',
-    '.scd'    : 'application/x-msschedule',
-    '.sst'    : 'application/vndms-pkicertstore',
-    '.src'    : 'application/x-wais-source',
-    '.sv4cpio': 'application/x-sv4cpio',
-    '.tex'    : 'application/x-tex',
-    '.tgz'    : 'application/x-compressed',
-    '.t'      : 'application/x-troff',
-    '.tar'    : 'application/x-tar',
-    '.tr'     : 'application/x-troff',
-    '.tif'    : 'image/tiff',
-    '.txt'    : 'text/plain',
-    '.texinfo': 'application/x-texinfo',
-    '.trm'    : 'application/x-msterminal',
-    '.tiff'   : 'image/tiff',
-    '.tcl'    : 'application/x-tcl',
-    '.texi'   : 'application/x-texinfo',
-    '.tsv'    : 'text/tab-separated-values',
-    '.ustar'  : 'application/x-ustar',
-    '.uls'    : 'text/iuls',
-    '.vcf'    : 'text/x-vcard',
-    '.wps'    : 'application/vnd.ms-works',
-    '.wav'    : 'audio/wav',
-    '.wrz'    : 'x-world/x-vrml',
-    '.wri'    : 'application/x-mswrite',
-    '.wks'    : 'application/vnd.ms-works',
-    '.wmf'    : 'application/x-msmetafile',
-    '.wcm'    : 'application/vnd.ms-works',
-    '.wrl'    : 'x-world/x-vrml',
-    '.wdb'    : 'application/vnd.ms-works',
-    '.wsdl'   : 'text/xml',
-    '.xml'    : 'text/xml',
-    '.xlm'    : 'application/vnd.ms-excel',
-    '.xaf'    : 'x-world/x-vrml',
-    '.xla'    : 'application/vnd.ms-excel',
-    '.xls'    : 'application/vnd.ms-excel',
-    '.xof'    : 'x-world/x-vrml',
-    '.xlt'    : 'application/vnd.ms-excel',
-    '.xlc'    : 'application/vnd.ms-excel',
-    '.xsl'    : 'text/xml',
-    '.xbm'    : 'image/x-xbitmap',
-    '.xlw'    : 'application/vnd.ms-excel',
-    '.xpm'    : 'image/x-xpixmap',
-    '.xwd'    : 'image/x-xwindowdump',
-    '.xsd'    : 'text/xml',
-    '.z'      : 'application/x-compress',
-    '.zip'    : 'application/x-zip-compressed',
-    '.*'      : 'application/octet-stream',
-    # Office 2007 MIME types
-    # http://www.bram.us/2007/05/25/office-2007-mime-types-for-iis/
-    'docm'    : 'application/vnd.ms-word.document.macroEnabled.12',
-    'docx'    : 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-    'dotm'    : 'application/vnd.ms-word.template.macroEnabled.12',
-    'dotx'    : 'application/vnd.openxmlformats-officedocument.wordprocessingml.template',
-    'potm'    : 'application/vnd.ms-powerpoint.template.macroEnabled.12',
-    'potx'    : 'application/vnd.openxmlformats-officedocument.presentationml.template',
-    'ppam'    : 'application/vnd.ms-powerpoint.addin.macroEnabled.12',
-    'ppsm'    : 'application/vnd.ms-powerpoint.slideshow.macroEnabled.12',
-    'ppsx'    : 'application/vnd.openxmlformats-officedocument.presentationml.slideshow',
-    'pptm'    : 'application/vnd.ms-powerpoint.presentation.macroEnabled.12',
-    'pptx'    : 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-    'xlam'    : 'application/vnd.ms-excel.addin.macroEnabled.12',
-    'xlsb'    : 'application/vnd.ms-excel.sheet.binary.macroEnabled.12',
-    'xlsm'    : 'application/vnd.ms-excel.sheet.macroEnabled.12',
-    'xlsx'    : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    'xltm'    : 'application/vnd.ms-excel.template.macroEnabled.12',
-    'xltx'    : 'application/vnd.openxmlformats-officedocument.spreadsheetml.template',
-}
-
-UriParser.Register(
-    GenericUriParser(GenericUriParserOptions.NoQuery 
-                     | GenericUriParserOptions.NoPort 
-                     | GenericUriParserOptions.NoFragment 
-                     | GenericUriParserOptions.NoUserInfo), 
-    's3', 0)
+# Extensions and their MIME types, one per line. Comment lines start with 
+# a hash. The map is only built from this on the first lookup so that 
+# commands which never need it do not pay for it on start-up.
+
+MIME_TYPES = """
+.323      text/h323
+.asx      video/x-ms-asf
+.acx      application/internet-property-stream
+.ai       application/postscript
+.aif      audio/x-aiff
+.aiff     audio/aiff
+.axs      application/olescript
+.aifc     audio/aiff
+.asr      video/x-ms-asf
+.avi      video/x-msvideo
+.asf      video/x-ms-asf
+.au       audio/basic
+.bin      application/octet-stream
+.bas      text/plain
+.bcpio    application/x-bcpio
+.bmp      image/bmp
+.cdf      application/x-cdf
+.cat      application/vndms-pkiseccat
+.crt      application/x-x509-ca-cert
+.c        text/plain
+.css      text/css
+.cer      application/x-x509-ca-cert
+.crl      application/pkix-crl
+.cmx      image/x-cmx
+.csh      application/x-csh
+.cod      image/cis-cod
+.cpio     application/x-cpio
+.clp      application/x-msclip
+.crd      application/x-mscardfile
+.dll      application/x-msdownload
+.dot      application/msword
+.doc      application/msword
+.dvi      application/x-dvi
+.dir      application/x-director
+.dxr      application/x-director
+.der      application/x-x509-ca-cert
+.dib      image/bmp
+.dcr      application/x-director
+.disco    text/xml
+.exe      application/octet-stream
+.etx      text/x-setext
+.evy      application/envoy
+.eml      message/rfc822
+.eps      application/postscript
+.flr      x-world/x-vrml
+.fif      application/fractals
+.gtar     application/x-gtar
+.gif      image/gif
+.gz       application/x-gzip
+.hta      application/hta
+.htc      text/x-component
+.htt      text/webviewhtml
+.h        text/plain
+.hdf      application/x-hdf
+.hlp      application/winhlp
+.html     text/html
+.htm      text/html
+.hqx      application/mac-binhex40
+.isp      application/x-internet-signup
+.iii      application/x-iphone
+.ief      image/ief
+.ivf      video/x-ivf
+.ins      application/x-internet-signup
+.ico      image/x-icon
+.jpg      image/jpeg
+.jfif     image/pjpeg
+.jpe      image/jpeg
+.jpeg     image/jpeg
+.js       application/x-javascript
+.lsx      video/x-la-asf
+.latex    application/x-latex
+.lsf      video/x-la-asf
+.mhtml    message/rfc822
+.mny      application/x-msmoney
+.mht      message/rfc822
+.mid      audio/mid
+.mpv2     video/mpeg
+.man      application/x-troff-man
+.mvb      application/x-msmediaview
+.mpeg     video/mpeg
+.m3u      audio/x-mpegurl
+.mdb      application/x-msaccess
+.mpp      application/vnd.ms-project
+.m1v      video/mpeg
+.mpa      video/mpeg
+.me       application/x-troff-me
+.m13      application/x-msmediaview
+.movie    video/x-sgi-movie
+.m14      application/x-msmediaview
+.mpe      video/mpeg
+.mp2      video/mpeg
+.mov      video/quicktime
+.mp3      audio/mpeg
+.mpg      video/mpeg
+.ms       application/x-troff-ms
+.nc       application/x-netcdf
+.nws      message/rfc822
+.oda      application/oda
+.ods      application/oleobject
+.pmc      application/x-perfmon
+.p7r      application/x-pkcs7-certreqresp
+.p7b      application/x-pkcs7-certificates
+.p7s      application/pkcs7-signature
+.pmw      application/x-perfmon
+.ps       application/postscript
+.p7c      application/pkcs7-mime
+.pbm      image/x-portable-bitmap
+.ppm      image/x-portable-pixmap
+.pub      application/x-mspublisher
+.png      image/png
+.pnm      image/x-portable-anymap
+.pml      application/x-perfmon
+.p10      application/pkcs10
+.pfx      application/x-pkcs12
+.p12      application/x-pkcs12
+.pdf      application/pdf
+.pps      application/vnd.ms-powerpoint
+.p7m      application/pkcs7-mime
+.pko      application/vndms-pkipko
+.ppt      application/vnd.ms-powerpoint
+.pmr      application/x-perfmon
+.pma      application/x-perfmon
+.pot      application/vnd.ms-powerpoint
+.prf      application/pics-rules
+.pgm      image/x-portable-graymap
+.qt       video/quicktime
+.ra       audio/x-pn-realaudio
+.rgb      image/x-rgb
+.ram      audio/x-pn-realaudio
+.rmi      audio/mid
+.ras      image/x-cmu-raster
+.roff     application/x-troff
+.rtf      application/rtf
+.rtx      text/richtext
+.sv4crc   application/x-sv4crc
+.spc      application/x-pkcs7-certificates
+.setreg   application/set-registration-initiation
+.snd      audio/basic
+.stl      application/vndms-pkistl
+.setpay   application/set-payment-initiation
+.stm      text/html
+.shar     application/x-shar
+.sh       application/x-sh
+.sit      application/x-stuffit
+.spl      application/futuresplash
+.sct      text/scriptlet
+.scd      application/x-msschedule
+.sst      application/vndms-pkicertstore
+.src      application/x-wais-source
+.sv4cpio  application/x-sv4cpio
+.tex      application/x-tex
+.tgz      application/x-compressed
+.t        application/x-troff
+.tar      application/x-tar
+.tr       application/x-troff
+.tif      image/tiff
+.txt      text/plain
+.texinfo  application/x-texinfo
+.trm      application/x-msterminal
+.tiff     image/tiff
+.tcl      application/x-tcl
+.texi     application/x-texinfo
+.tsv      text/tab-separated-values
+.ustar    application/x-ustar
+.uls      text/iuls
+.vcf      text/x-vcard
+.wps      application/vnd.ms-works
+.wav      audio/wav
+.wrz      x-world/x-vrml
+.wri      application/x-mswrite
+.wks      application/vnd.ms-works
+.wmf      application/x-msmetafile
+.wcm      application/vnd.ms-works
+.wrl      x-world/x-vrml
+.wdb      application/vnd.ms-works
+.wsdl     text/xml
+.xml      text/xml
+.xlm      application/vnd.ms-excel
+.xaf      x-world/x-vrml
+.xla      application/vnd.ms-excel
+.xls      application/vnd.ms-excel
+.xof      x-world/x-vrml
+.xlt      application/vnd.ms-excel
+.xlc      application/vnd.ms-excel
+.xsl      text/xml
+.xbm      image/x-xbitmap
+.xlw      application/vnd.ms-excel
+.xpm      image/x-xpixmap
+.xwd      image/x-xwindowdump
+.xsd      text/xml
+.z        application/x-compress
+.zip      application/x-zip-compressed
+.*        application/octet-stream
+# Office 2007 MIME types
+# http://www.bram.us/2007/05/25/office-2007-mime-types-for-iis/
+.docm     application/vnd.ms-word.document.macroEnabled.12
+.docx     application/vnd.openxmlformats-officedocument.wordprocessingml.document
+.dotm     application/vnd.ms-word.template.macroEnabled.12
+.dotx     application/vnd.openxmlformats-officedocument.wordprocessingml.template
+.potm     application/vnd.ms-powerpoint.template.macroEnabled.12
+.potx     application/vnd.openxmlformats-officedocument.presentationml.template
+.ppam     application/vnd.ms-powerpoint.addin.macroEnabled.12
+.ppsm     application/vnd.ms-powerpoint.slideshow.macroEnabled.12
+.ppsx     application/vnd.openxmlformats-officedocument.presentationml.slideshow
+.pptm     application/vnd.ms-powerpoint.presentation.macroEnabled.12
+.pptx     application/vnd.openxmlformats-officedocument.presentationml.presentation
+.xlam     application/vnd.ms-excel.addin.macroEnabled.12
+.xlsb     application/vnd.ms-excel.sheet.binary.macroEnabled.12
+.xlsm     application/vnd.ms-excel.sheet.macroEnabled.12
+.xlsx     application/vnd.openxmlformats-officedocument.spreadsheetml.sheet
+.xltm     application/vnd.ms-excel.template.macroEnabled.12
+.xltx     application/vnd.openxmlformats-officedocument.spreadsheetml.template
+"""
+
+mime_map = None
+
+def get_mime_map():
+    """Gets the map of lower-case extensions, including the leading dot, to 
+    MIME types, building it on first use."""
+    global mime_map
+    if mime_map is None:
+        types = {}
+        for line in MIME_TYPES.splitlines():
+            if line and line[0] != '#':
+                ext, mime_type = line.split()
+                types['.' + ext.lstrip('.').lower()] = mime_type
+        mime_map = types
+    return mime_map
+
+s3_scheme_registered = False
+
+def register_s3_scheme():
+    global s3_scheme_registered
+    if s3_scheme_registered:
+        return
+    from System import UriParser, GenericUriParser, GenericUriParserOptions
+    UriParser.Register(
+        GenericUriParser(GenericUriParserOptions.NoQuery 
+                         | GenericUriParserOptions.NoPort 
+                         | GenericUriParserOptions.NoFragment 
+                         | GenericUriParserOptions.NoUserInfo), 
+        's3', 0)
+    s3_scheme_registered = True
 
 def parse_s3uri(path):
     """Parses an S3 URI into its bucket and key constituents."""
+    register_s3_scheme()
     uri = Uri(path)
     return uri.Authority, uri.GetComponents(UriComponents.Path, UriFormat.Unescaped)
 
 def copy_stream(source, dest, length):
     buffer = Array.CreateInstance(Byte, 8192)
     while length > 0:
-        bytesRead = source.Read(buffer, 0, buffer.Length)
+        bytesRead = source.Read(buffer, 0, int(min(buffer.Length, length)))
         if bytesRead > 0:
             dest.Write(buffer, 0, bytesRead)
         else:
             raise Exception("Unexpected end of stream while copying.")
         length -= bytesRead
 
-def is_windows():
-    return Environment.OSVersion.Platform in (PlatformID.Win32NT, PlatformID.Win32Windows, PlatformID.Win32S, PlatformID.WinCE)
+def copy_text_stream(source, output, length, encoding = Encoding.UTF8):
+    """Copies encoded text from a stream to a file-like output, decoding and 
+    writing it a buffer at a time so that memory use stays the same however 
+    long the text is. Characters split across buffers are carried over."""
+    decoder = encoding.GetDecoder()
+    buffer = Array.CreateInstance(Byte, 8192)
+    chars = Array.CreateInstance(Char, encoding.GetMaxCharCount(buffer.Length))
+    while length > 0:
+        bytesRead = source.Read(buffer, 0, buffer.Length)
+        if bytesRead <= 0:
+            raise Exception("Unexpected end of stream while copying.")
+        length -= bytesRead
+        count = decoder.GetChars(buffer, 0, bytesRead, chars, 0, length <= 0)
+        output.write(String(chars, 0, count))
+        output.flush()
+
+def is_s3uri(path):
+    return path.lower().startswith('s3://')
+
+def as_dir_prefix(prefix):
+    """Ensures a non-empty key prefix ends in a slash so it names a "directory"."""
+    return prefix and prefix[-1] != '/' and prefix + '/' or prefix
+
+def guess_content_type(fpath):
+    return get_mime_map().get(Path.GetExtension(fpath).lower(), 'application/octet-stream')
+
+def hex_str(bytes):
+    return BitConverter.ToString(bytes).Replace('-', '').lower()
+
+def hex_bytes(s):
+    bytes = Array.CreateInstance(Byte, len(s) // 2)
+    for i in range(bytes.Length):
+        bytes[i] = Byte.Parse(s[2 * i:2 * i + 2], NumberStyles.HexNumber)
+    return bytes
+
+def md5_hex(s):
+    return hex_str(MD5.Create().ComputeHash(Encoding.UTF8.GetBytes(s)))
+
+def md5_file_hex(fpath):
+    stream = File.OpenRead(fpath)
+    try:
+        return hex_str(MD5.Create().ComputeHash(stream))
+    finally:
+        stream.Close()
+
+def walk_files(root):
+    """Yields the full and relative (slash-separated) path of every file under a directory."""
+    root = Path.GetFullPath(root)
+    for fpath in Directory.GetFiles(root, '*', SearchOption.AllDirectories):
+        yield fpath, fpath[len(root):].lstrip('\\/').replace('\\', '/')
+
+class PackReader(object):
+    """Reads files one after another as if they were a single stream, each
+    for exactly the length it had when the list of them was made."""
+
+    def __init__(self, members):
+        self.members = members # (path, length)
+        self.next = 0
+        self.stream = None
+        self.left = 0
+
+    def Read(self, buffer, offset, count):
+        while True:
+            if self.stream is None:
+                if self.next == len(self.members):
+                    return 0
+                self.fpath, self.left = self.members[self.next]
+                self.next += 1
+                self.stream = File.OpenRead(self.fpath)
+            if self.left > 0:
+                read = self.stream.Read(buffer, offset, int(min(count, self.left)))
+                if read == 0:
+                    raise Exception('%s got shorter while it was being packed.' % self.fpath)
+                self.left -= read
+                return read
+            self.stream.Close()
+            self.stream = None
+
+def coalesce_ranges(members, gap, max_range):
+    """Groups (name, offset, length) members into runs that can be read with
+    one ranged request each: members no more than gap bytes apart, spanning 
+    no more than max_range bytes unless a single member is larger."""
+    groups = []
+    group = None
+    for member in sorted(members, key = lambda member: member[1]):
+        if group:
+            end = group[-1][1] + group[-1][2]
+            if member[1] - end <= gap and member[1] + member[2] - group[0][1] <= max_range:
+                group.append(member)
+                continue
+        group = [member]
+        groups.append(group)
+    return groups
+
+def local_target(root, rpath):
+    """Maps a slash-separated relative path, usually taken from an object 
+    key, to a full path under a local directory. Paths that would end up
+    outside the directory, through .. or by being absolute, are refused."""
+    sep = str(Path.DirectorySeparatorChar)
+    root = Path.GetFullPath(root).TrimEnd(sep) + sep
+    fpath = Path.GetFullPath(Path.Combine(root, rpath.replace('/', sep)))
+    if not fpath.StartsWith(root) or fpath == root:
+        raise Exception('%s would be written outside %s' % (rpath, root))
+    return fpath
+
+def write_in_place(fpath, write):
+    """Writes a file by way of a temporary file next to it, which replaces 
+    the file only if the write function returns without error. A download 
+    that fails half way then leaves the previous copy as it was."""
+    temp = '%s.%s.tmp' % (fpath, Guid.NewGuid().ToString('N'))
+    try:
+        output = File.Create(temp)
+        try:
+            write(output)
+        finally:
+            output.Close()
+        if File.Exists(fpath):
+            File.Replace(temp, fpath, None)
+        else:
+            File.Move(temp, fpath)
+    finally:
+        if File.Exists(temp):
+            File.Delete(temp)
+
+def is_same_file(obj, info, md5):
+    """Tells whether a listed object appears to hold the same content as a local file.
+    The md5 function is only called when the ETag of the object is the MD5 of its content."""
+    if obj.Size != info.Length:
+        return False
+    etag = obj.ETag.strip('"')
+    if '-' in etag: # multipart upload ETags are not the MD5 of the content
+        return obj.LastModified.ToUniversalTime() >= info.LastWriteTimeUtc
+    return etag == md5()
+
+class WorkQueue(object):
+    """A thread-safe queue of work items, optionally bounded in size, that 
+    can be closed to signal that no more items are coming. None cannot be
+    queued as it is what take returns once the queue is closed and drained."""
+
+    def __init__(self, capacity = 0):
+        self.capacity = capacity
+        self.items = []
+        self.closed = False
+        self.lock = Object()
+
+    def put(self, item):
+        """Adds an item, waiting for room if the queue is full. Returns False 
+        if the queue was closed instead."""
+        Monitor.Enter(self.lock)
+        try:
+            while self.capacity and len(self.items) >= self.capacity and not self.closed:
+                Monitor.Wait(self.lock)
+            if self.closed:
+                return False
+            self.items.append(item)
+            Monitor.PulseAll(self.lock)
+            return True
+        finally:
+            Monitor.Exit(self.lock)
+
+    def take(self):
+        """Removes the next item, waiting for one if the queue is empty."""
+        Monitor.Enter(self.lock)
+        try:
+            while not self.items and not self.closed:
+                Monitor.Wait(self.lock)
+            if not self.items:
+                return None
+            item = self.items.pop(0)
+            Monitor.PulseAll(self.lock)
+            return item
+        finally:
+            Monitor.Exit(self.lock)
+
+    def close(self, discard = False):
+        """Closes the queue, optionally throwing away the items still in it."""
+        Monitor.Enter(self.lock)
+        try:
+            self.closed = True
+            if discard:
+                del self.items[:]
+            Monitor.PulseAll(self.lock)
+        finally:
+            Monitor.Exit(self.lock)
+
+def inherit_output(func):
+    """Wraps a function that is to run on another thread so that its output 
+    goes wherever the output of the calling thread goes."""
+    if isinstance(sys.stdout, ThreadOutput):
+        return sys.stdout.inherit(func)
+    return func
+
+def run_parallel(items, func, workers):
+    """Calls a function for each item on a number of worker threads. Items 
+    are handed out through a bounded queue as they are produced so a lazy 
+    sequence is never read far ahead. The first error raised by the function 
+    stops the work and is raised again once all the workers are done."""
+    if workers <= 1:
+        for item in items:
+            func(item)
+        return
+    if ServicePointManager.DefaultConnectionLimit < workers:
+        ServicePointManager.DefaultConnectionLimit = workers
+    queue = WorkQueue(workers * 2)
+    errors = []
+    def work():
+        while True:
+            item = queue.take()
+            if item is None:
+                break
+            try:
+                func(item)
+            except Exception, e:
+                errors.append(e)
+                queue.close(True)
+                break
+    threads = [Thread(ThreadStart(inherit_output(work))) for i in range(workers)]
+    for thread in threads:
+        thread.IsBackground = True
+        thread.Start()
+    try:
+        for item in items:
+            if not queue.put(item):
+                break
+    finally:
+        queue.close()
+        for thread in threads:
+            thread.Join()
+    if errors:
+        raise errors[0]
+
+def batches(items, size):
+    """Groups a sequence into lists of up to a given size, lazily."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class ThreadOutput(object):
+    """Stands in for standard output so that what each worker thread prints 
+    can be collected and written out in one piece."""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.buffers = {}
+        self.lock = Object()
+
+    def write(self, s):
+        buffer = self.buffers.get(Thread.CurrentThread.ManagedThreadId)
+        if buffer is None:
+            self.stdout.write(s)
+        else:
+            buffer.append(s)
+
+    def flush(self):
+        self.stdout.flush()
+
+    def capture(self):
+        """Starts collecting what the current thread prints."""
+        self.buffers[Thread.CurrentThread.ManagedThreadId] = []
+
+    def release(self):
+        """Stops collecting for the current thread and returns what it printed."""
+        return ''.join(self.buffers.pop(Thread.CurrentThread.ManagedThreadId))
+
+    def inherit(self, func):
+        """Wraps a function that is to run on other threads so that what it 
+        prints is collected along with what the current thread prints."""
+        buffer = self.buffers.get(Thread.CurrentThread.ManagedThreadId)
+        if buffer is None:
+            return func
+        def run(*args):
+            id = Thread.CurrentThread.ManagedThreadId
+            if id in self.buffers:
+                return func(*args)
+            self.buffers[id] = buffer
+            try:
+                return func(*args)
+            finally:
+                del self.buffers[id]
+        return run
+
+    def write_atomic(self, s):
+        """Writes to the real output without interleaving with other threads."""
+        Monitor.Enter(self.lock)
+        try:
+            self.stdout.write(s)
+            self.stdout.flush()
+        finally:
+            Monitor.Exit(self.lock)
+
+def split_command_line(line):
+    """Splits a line into arguments on white space, honoring single and double quotes."""
+    return [dq or sq or bare for dq, sq, bare in re.findall(r'"([^"]*)"|\'([^\']*)\'|(\S+)', line)]
+
+SIGN_BATCH_SIZE = 1000
+
+def read_key_lines(input, bucket, prefix):
+    """Reads keys from a file, one per line, as pairs of bucket and key. A line
+    is either an S3 path or a key relative to the given bucket and prefix."""
+    for line in input:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        if is_s3uri(line):
+            yield parse_s3uri(line)
+        elif not bucket:
+            raise Exception('Missing bucket for key %s.' % line)
+        else:
+            yield bucket, prefix + line
+
+def sign_urls(s3, keys, expires, output, workers = 1):
+    """Writes a pre-authorized URL for each bucket and key pair to an output,
+    in order, and returns how many were written. The keys are signed in 
+    batches, spread over a number of threads with a signer of their own."""
+    signers = {} # by thread and bucket
+    pending = {} # signed batches waiting for those before them
+    state = { 'next': 0, 'count': 0 }
+    lock = Object()
+    def sign(batch):
+        index, pairs = batch
+        Monitor.Enter(lock)
+        try:
+            thread_signers = signers.setdefault(Thread.CurrentThread.ManagedThreadId, {})
+        finally:
+            Monitor.Exit(lock)
+        urls = []
+        for bucket, key in pairs:
+            signer = thread_signers.get(bucket)
+            if signer is None:
+                signer = thread_signers[bucket] = UrlSigner(s3, bucket, expires)
+            urls.append(signer.GetAuthorizedUrl(key))
+        urls.append('')
+        Monitor.Enter(lock)
+        try:
+            pending[index] = '\n'.join(urls)
+            state['count'] += len(pairs)
+            while state['next'] in pending:
+                output.write(pending.pop(state['next']))
+                state['next'] += 1
+        finally:
+            Monitor.Exit(lock)
+    def number(batches):
+        index = 0
+        for batch in batches:
+            yield index, batch
+            index += 1
+    run_parallel(number(batches(keys, SIGN_BATCH_SIZE)), sign, workers)
+    output.flush()
+    return state['count']
+
+GLOB_SPECIAL = '*?['
+REGEX_SPECIAL = '.^$*+?{}[]\\|()'
+AGE_UNITS = { 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800 }
+
+def glob_to_regex(pattern, delimiter = '/'):
+    """Translates a glob pattern into a regular expression. A * or ? does 
+    not match the delimiter while ** matches anything, delimiters included.
+    A class in brackets may be negated with a leading ! or ^."""
+    regex = []
+    not_delimiter = '[^%s]' % re.escape(delimiter)
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern[i:i + 2] == '**':
+            regex.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            regex.append(not_delimiter + '*')
+        elif c == '?':
+            regex.append(not_delimiter)
+        elif c == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            chars = pattern[i + 1:end]
+            if chars[0] in '!^':
+                chars = '^' + chars[1:]
+            regex.append('[%s]' % chars.replace('\\', '\\\\'))
+            i = end
+        else:
+            regex.append(re.escape(c))
+        i += 1
+    return ''.join(regex)
+
+def glob_literal_prefix(pattern):
+    """Gets the part of a glob pattern before its first wildcard."""
+    for i in range(len(pattern)):
+        if pattern[i] in GLOB_SPECIAL:
+            return pattern[:i]
+    return pattern
+
+def regex_literal_prefix(regex):
+    """Gets the literal text every match of a regular expression anchored 
+    with ^ has to start with, or an empty string if it is not anchored."""
+    if regex[:1] != '^':
+        return ''
+    literal = []
+    i = 1
+    while i < len(regex):
+        c = regex[i]
+        if c == '\\' and i + 1 < len(regex) and not regex[i + 1].isalnum():
+            c = regex[i + 1]
+            i += 1
+        elif c in REGEX_SPECIAL:
+            if c in '*?{' and literal:
+                literal.pop() # the last character may repeat zero times
+            elif c == '|':
+                return '' # alternatives may start anywhere
+            break
+        literal.append(c)
+        i += 1
+    if '|' in regex[i:]:
+        return ''
+    return ''.join(literal)
+
+def parse_time_arg(arg):
+    """Parses an age such as 30m, 12h, 7d or 2w, counted back from now, or 
+    else a date and time, into a time in UTC."""
+    match = re.match(r'^(\d+)([smhdw])$', arg.lower())
+    if match:
+        return DateTime.UtcNow.AddSeconds(-int(match.group(1)) * AGE_UNITS[match.group(2)])
+    return DateTime.Parse(arg).ToUniversalTime()
+
+def find_glob(s3, bucket, prefix, pattern, delimiter, cache = None, scheduler = None):
+    """Yields the objects whose key after the prefix matches a glob pattern.
+    Only what the pattern can match is listed: the text before the first 
+    wildcard goes into the listing prefix and, until a ** is met, the 
+    pattern is followed one level at a time, listing with the delimiter 
+    and descending only into the common prefixes that match its segment."""
+    matcher = re.compile(re.escape(prefix) + glob_to_regex(pattern, delimiter) + '$')
+    segments = pattern.split(delimiter)
+    def walk(base, i):
+        # literal segments need no listing to descend into
+        while i < len(segments) - 1 and not [c for c in segments[i] if c in GLOB_SPECIAL]:
+            base += segments[i] + delimiter
+            i += 1
+        segment = segments[i]
+        list_prefix = base + glob_literal_prefix(segment)
+        if '**' in delimiter.join(segments[i:]):
+            for entry in list_range(s3, bucket, list_prefix, None, None, None, cache, scheduler):
+                if matcher.match(entry.Key):
+                    yield entry
+            return
+        last = i == len(segments) - 1
+        segment_matcher = re.compile(glob_to_regex(segment, delimiter) + re.escape(delimiter) + '$')
+        for entry in list_range(s3, bucket, list_prefix, delimiter, None, None, cache, scheduler):
+            if not is_common_prefix(entry):
+                if last and matcher.match(entry.Key):
+                    yield entry
+            elif not last and segment_matcher.match(entry.Prefix[len(base):]):
+                for match in walk(entry.Prefix, i + 1):
+                    yield match
+    return walk(prefix, 0)
+
+def filter_objects(objs, prefix, delimiter, options):
+    """Yields the objects that pass the --name, --regex, size and age tests 
+    in the options. Names and regular expressions are matched against the 
+    last segment and against the key after the prefix respectively."""
+    name = options.get('name') and re.compile(glob_to_regex(options['name'], delimiter) + '$')
+    regex = options.get('regex') and re.compile(options['regex'])
+    min_size = parse_size_arg(options.get('min-size'))
+    max_size = parse_size_arg(options.get('max-size'))
+    newer = options.get('newer-than') and parse_time_arg(options['newer-than'])
+    older = options.get('older-than') and parse_time_arg(options['older-than'])
+    start = len(prefix)
+    for obj in objs:
+        if is_common_prefix(obj):
+            continue
+        key = obj.Key
+        if name and not name.match(key[key.rfind(delimiter) + 1:]):
+            continue
+        if regex and not regex.search(key[start:]):
+            continue
+        if min_size is not None and obj.Size < min_size:
+            continue
+        if max_size is not None and obj.Size > max_size:
+            continue
+        if newer or older:
+            modified = obj.LastModified.ToUniversalTime()
+            if (newer and modified < newer) or (older and modified >= older):
+                continue
+        yield obj
+
+def du_rollups(objs, prefix, delimiter, depth):
+    """Adds up the number and size of objects by the prefix they fall under
+    at a depth below the given prefix. Objects above that depth count
+    towards their own prefix. Returns a map of prefixes to count and size 
+    pairs, holding only one pair per prefix however many objects there are."""
+    rollups = {}
+    start = len(prefix)
+    for obj in objs:
+        if is_common_prefix(obj):
+            continue
+        key = obj.Key
+        end, level = start, 0
+        while level < depth:
+            i = key.find(delimiter, end)
+            if i < 0:
+                break
+            end = i + len(delimiter)
+            level += 1
+        rollup = rollups.get(key[:end])
+        if rollup is None:
+            rollup = rollups[key[:end]] = [0, 0]
+        rollup[0] += 1
+        rollup[1] += obj.Size
+    return rollups
+
+LIST_RANGES_PER_WORKER = 8
+LIST_QUEUE_SIZE = 5000
+
+def is_common_prefix(entry):
+    return type(entry) in (CommonPrefix, CachedCommonPrefix)
+
+def entry_name(entry):
+    """Gets the key of an object entry or the prefix of a common prefix entry."""
+    return is_common_prefix(entry) and entry.Prefix or entry.Key
+
+def list_page(s3, bucket, prefix, delimiter, marker, max_keys = None, cache = None, scheduler = None):
+    """Lists one page of entries, sorted by key, and returns it along with 
+    the marker for the next page or None if it was the last. The page is
+    looked up in and added to the listing cache, if one is given, and the
+    request is made through the scheduler, if one is given."""
+    if cache:
+        page = cache.get(bucket, prefix, delimiter, marker, max_keys)
+        if page:
+            return page
+    args = ListObjectsArgs(Prefix = prefix, Delimiter = delimiter, Marker = marker)
+    if max_keys:
+        args.MaxKeys = max_keys
+    request = lambda: ListObjectsRequest(s3, bucket, args).GetResponse()
+    response = scheduler and scheduler.call(request) or request()
+    try:
+        entries = list(response.Entries)
+        truncated, marker = response.IsTruncated, response.NextMarker
+    finally:
+        response.Close()
+    entries.sort(key = entry_name)
+    if not truncated:
+        marker = None
+    elif not marker:
+        if not entries:
+            raise Exception('S3 Server is misbehaving.')
+        marker = entry_name(entries[-1])
+    if cache:
+        cache.put(bucket, prefix, delimiter, args.Marker, max_keys, entries, marker)
+    return entries, marker
+
+def list_range(s3, bucket, prefix, delimiter, start, end, cache = None, scheduler = None):
+    """Yields the entries under a prefix in key order, from just after the
+    start key up to and including the end key. None stands for either end 
+    of the key space."""
+    marker = start
+    while True:
+        entries, marker = list_page(s3, bucket, prefix, delimiter, marker, None, cache, scheduler)
+        for entry in entries:
+            if end is not None and entry_name(entry) > end:
+                return
+            yield entry
+        if marker is None:
+            return
+
+def split_key_range(prefix, marker, delimiter, count):
+    """Picks keys that split the key space after the marker into up to count 
+    ranges, spreading them over the first two characters after the prefix. 
+    The delimiter never appears in these keys so that a common prefix cannot 
+    straddle two ranges."""
+    chars = [chr(c) for c in range(0x21, 0x7f) if chr(c) not in (delimiter or '')]
+    base = len(chars)
+    def index(c):
+        return min(len([x for x in chars if x < c]), base - 1)
+    tail = marker[len(prefix):len(prefix) + 2]
+    lo = 0
+    for c in (tail + chars[0] * 2)[:2]:
+        lo = lo * base + index(c)
+    step = float(base * base - lo) / count
+    bounds = []
+    for i in range(1, count):
+        value = lo + int(step * i)
+        bound = prefix + chars[value / base] + chars[value % base]
+        if bound > marker and (not bounds or bound > bounds[-1]):
+            bounds.append(bound)
+    return bounds
+
+def list_parallel(s3, bucket, prefix, delimiter, workers, cache = None, scheduler = None):
+    """Lists the entries under a prefix by splitting the key space into 
+    ranges that are listed on a number of threads at the same time. Entries 
+    are yielded in key order as soon as their range is listed, and a range 
+    holds back at most LIST_QUEUE_SIZE entries so memory stays bounded."""
+    entries, marker = list_page(s3, bucket, prefix, delimiter, None, None, cache, scheduler)
+    for entry in entries:
+        yield entry
+    if marker is None:
+        return
+    bounds = split_key_range(prefix, marker, delimiter, workers * LIST_RANGES_PER_WORKER)
+    shards = [(start, end, WorkQueue(LIST_QUEUE_SIZE), [])
+              for start, end in zip([marker] + bounds, bounds + [None])]
+    def produce(shard):
+        start, end, queue, errors = shard
+        if queue.closed: # the consumer stopped before this range was started
+            return
+        try:
+            try:
+                for entry in list_range(s3, bucket, prefix, delimiter, start, end, cache, scheduler):
+                    if not queue.put(entry):
+                        break
+            except Exception, e:
+                errors.append(e)
+        finally:
+            queue.close()
+    producer = Thread(ThreadStart(inherit_output(lambda: run_parallel(shards, produce, workers))))
+    producer.IsBackground = True
+    producer.Start()
+    try:
+        for start, end, queue, errors in shards:
+            entry = queue.take()
+            while entry is not None:
+                yield entry
+                entry = queue.take()
+            if errors:
+                raise errors[0]
+    finally:
+        # lets the producers still waiting for room give up when the 
+        # consumer stops early, on an error or by closing the generator
+        for start, end, queue, errors in shards:
+            queue.close(True)
+
+LISTING_FORMATS = ('ndjson', 'csv', 'tsv')
+LISTING_BUFFER_ROWS = 1000
+EPOCH_TICKS = 621355968000000000 # DateTime(1970, 1, 1).Ticks
+JSON_SPECIAL = re.compile(r'[\x00-\x1f"\\]')
+CSV_SPECIAL = re.compile(r'[,"\r\n]')
+TSV_SPECIAL = re.compile(r'[\t\r\n\\]')
+
+def format_time(dt, epoch):
+    """Formats a time as ISO 8601 in UTC, or as seconds since 1970, with
+    Python string formatting rather than a call to .NET per time."""
+    dt = dt.ToUniversalTime()
+    if epoch:
+        return str((dt.Ticks - EPOCH_TICKS) // 10000000)
+    return '%04d-%02d-%02dT%02d:%02d:%02d.%03dZ' % (
+        dt.Year, dt.Month, dt.Day, dt.Hour, dt.Minute, dt.Second, dt.Millisecond)
+
+def tsv_escape(s):
+    if not TSV_SPECIAL.search(s):
+        return s
+    return s.replace('\\', '\\\\').replace('\t', '\\t').replace('\r', '\\r').replace('\n', '\\n')
+
+class ListingWriter(object):
+    """Writes listing entries to an output as NDJSON, CSV or TSV rows with 
+    the full key, size, ETag, last modification time and owner. Common 
+    prefixes get a row with the prefix as the key and the other fields 
+    empty (null in NDJSON). Rows are collected and written out, then 
+    flushed, every so many so that the output can be piped as it comes."""
+
+    def __init__(self, output, format, epoch = False, rows = LISTING_BUFFER_ROWS):
+        self.output = output
+        self.format = format
+        self.epoch = epoch
+        self.rows = rows
+        self.buffer = []
+        if format == 'csv':
+            self.buffer.append('key,size,etag,last_modified,owner\n')
+        elif format == 'tsv':
+            self.buffer.append('key\tsize\tetag\tlast_modified\towner\n')
+
+    def write(self, entry):
+        if is_common_prefix(entry):
+            key, size, etag, modified, owner = entry.Prefix, None, None, None, None
+        else:
+            key, size, etag = entry.Key, entry.Size, entry.ETag.strip('"')
+            modified = format_time(entry.LastModified, self.epoch)
+            owner = entry.Owner
+            owner = owner and (owner.DisplayName or owner.ID) or None
+        format = self.format
+        if format == 'ndjson':
+            if size is None:
+                row = '{"key": %s, "size": null, "etag": null, "last_modified": null, "owner": null}\n' % self.__json(key)
+            else:
+                row = '{"key": %s, "size": %d, "etag": "%s", "last_modified": %s, "owner": %s}\n' % (
+                    self.__json(key), size, etag, self.epoch and modified or '"%s"' % modified, 
+                    owner and self.__json(owner) or 'null')
+        else:
+            if format == 'csv':
+                escape = self.__csv
+                sep = ','
+            else:
+                escape = tsv_escape
+                sep = '\t'
+            if size is None:
+                row = escape(key) + sep * 4 + '\n'
+            else:
+                row = '%s%s%d%s%s%s%s%s%s\n' % (escape(key), sep, size, sep, etag, sep, modified, sep, 
+                                               owner and escape(owner) or '')
+        self.buffer.append(row)
+        if len(self.buffer) >= self.rows:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.output.write(''.join(self.buffer))
+            self.buffer = []
+        self.output.flush()
+
+    def __json(self, s):
+        if JSON_SPECIAL.search(s):
+            return to_json(s)
+        return '"%s"' % s
+
+    def __csv(self, s):
+        if CSV_SPECIAL.search(s):
+            return '"%s"' % s.replace('"', '""')
+        return s
+
+class CachedObjectEntry(object):
+    """Stands in for an ObjectEntry read back from the listing cache."""
+
+    def __init__(self, key, last_modified, etag, size, owner, search_prefix):
+        self.Key = key
+        self.LastModified = last_modified
+        self.ETag = etag
+        self.Size = size
+        self.Owner = owner
+        self.Name = key[len(search_prefix or ''):]
+
+class CachedOwner(object):
+    """Stands in for the Identity of an object owner read back from the listing cache."""
+
+    def __init__(self, id, display_name):
+        self.ID = id
+        self.DisplayName = display_name
+
+class CachedCommonPrefix(object):
+    """Stands in for a CommonPrefix read back from the listing cache."""
+
+    def __init__(self, prefix, search_prefix, delimiter):
+        self.Prefix = prefix
+        self.Name = prefix[len(search_prefix or ''):len(prefix) - len(delimiter or '')]
+
+class ListingCache(object):
+    """An on-disk cache of listing pages keyed by bucket, prefix, delimiter, 
+    marker and page size. Pages expire after a time to live and the least 
+    recently used ones are evicted beyond a maximum number of pages. Pages 
+    are kept in a directory per bucket and prefix so that all the pages 
+    under a prefix can be dropped when this client changes a key under it."""
+
+    def __init__(self, ttl, capacity, root = None):
+        self.root = root or app_lpath('cache')
+        self.ttl = TimeSpan.FromSeconds(ttl)
+        self.capacity = capacity
+        self.hits = self.misses = 0
+        self.lock = Object()
+
+    def __dir(self, bucket, prefix):
+        return Path.Combine(Path.Combine(self.root, md5_hex(bucket)), md5_hex(prefix or ''))
+
+    def __fpath(self, bucket, prefix, delimiter, marker, max_keys):
+        page = md5_hex('\n'.join([delimiter or '', marker or '', str(max_keys or '')]))
+        return Path.Combine(self.__dir(bucket, prefix), page + '.txt')
+
+    def __count(self, hit):
+        Monitor.Enter(self.lock)
+        try:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        finally:
+            Monitor.Exit(self.lock)
+
+    def get(self, bucket, prefix, delimiter, marker, max_keys):
+        """Gets a cached page as a list of entries and the marker of the 
+        next page, or None if the page is not cached or has expired."""
+        fpath = self.__fpath(bucket, prefix, delimiter, marker, max_keys)
+        if File.Exists(fpath):
+            lines = File.ReadAllLines(fpath)
+            header = lines[0].split('\t')
+            if DateTime.UtcNow - DateTime(Int64.Parse(header[0]), DateTimeKind.Utc) <= self.ttl:
+                entries = []
+                for line in lines[1:]:
+                    fields = line.split('\t')
+                    if fields[0] == 'P':
+                        entries.append(CachedCommonPrefix(Uri.UnescapeDataString(fields[1]), prefix, delimiter))
+                    else:
+                        owner = None
+                        if len(fields) > 6 and (fields[5] or fields[6]):
+                            owner = CachedOwner(Uri.UnescapeDataString(fields[5]) or None, 
+                                                Uri.UnescapeDataString(fields[6]) or None)
+                        entries.append(CachedObjectEntry(Uri.UnescapeDataString(fields[1]), 
+                            DateTime.FromBinary(Int64.Parse(fields[2])), fields[3], Int64.Parse(fields[4]), 
+                            owner, prefix))
+                File.SetLastWriteTimeUtc(fpath, DateTime.UtcNow) # most recently used
+                self.__count(True)
+                return entries, header[1] and Uri.UnescapeDataString(header[1]) or None
+            File.Delete(fpath)
+        self.__count(False)
+        return None
+
+    def put(self, bucket, prefix, delimiter, marker, max_keys, entries, next_marker):
+        """Adds a page of entries and the marker of the next page to the cache."""
+        lines = ['%s\t%s' % (DateTime.UtcNow.Ticks, next_marker and Uri.EscapeDataString(next_marker) or '')]
+        for entry in entries:
+            if is_common_prefix(entry):
+                lines.append('P\t%s' % Uri.EscapeDataString(entry.Prefix))
+            else:
+                owner = entry.Owner
+                lines.append('O\t%s\t%s\t%s\t%s\t%s\t%s' % (Uri.EscapeDataString(entry.Key), 
+                    entry.LastModified.ToBinary(), entry.ETag, entry.Size, 
+                    owner and Uri.EscapeDataString(owner.ID or '') or '', 
+                    owner and Uri.EscapeDataString(owner.DisplayName or '') or ''))
+        fpath = self.__fpath(bucket, prefix, delimiter, marker, max_keys)
+        Directory.CreateDirectory(Path.GetDirectoryName(fpath))
+        File.WriteAllText(fpath, '\n'.join(lines))
+
+    def invalidate(self, bucket, key = None):
+        """Drops all the cached pages of listings that would include a key, 
+        or all the cached pages of a bucket if no key is given."""
+        if key is None:
+            path = Path.Combine(self.root, md5_hex(bucket))
+            if Directory.Exists(path):
+                Directory.Delete(path, True)
+            return
+        for i in range(len(key) + 1):
+            path = self.__dir(bucket, key[:i])
+            if Directory.Exists(path):
+                Directory.Delete(path, True)
+
+    def trim(self):
+        """Evicts the least recently used pages beyond the maximum number."""
+        if not Directory.Exists(self.root):
+            return
+        fpaths = list(Directory.GetFiles(self.root, '*.txt', SearchOption.AllDirectories))
+        if len(fpaths) <= self.capacity:
+            return
+        fpaths.sort(key = File.GetLastWriteTimeUtc)
+        for fpath in fpaths[:len(fpaths) - self.capacity]:
+            File.Delete(fpath)
+
+def region_host(location, default):
+    """Gets the endpoint of the region given by a bucket location constraint."""
+    if not location or location == 'US':
+        return default
+    if location == 'EU':
+        location = 'eu-west-1'
+    return 's3.%s.amazonaws.com' % location
+
+class BucketEndpoints(object):
+    """An on-disk cache of the host each bucket is served from. A bucket 
+    is looked up once, by asking for its location, and its host is kept 
+    until it expires. Requests to a bucket go straight to its host and 
+    when S3 redirects one elsewhere, the cache learns the new host."""
+
+    def __init__(self, s3, ttl, fpath = None):
+        self.s3 = s3
+        self.default = s3.Host
+        self.fpath = fpath or app_lpath('endpoints.txt')
+        self.ttl = TimeSpan.FromSeconds(ttl)
+        self.entries = {} # bucket -> (host, ticks)
+        self.dirty = False
+        self.lock = Object()
+        if File.Exists(self.fpath):
+            now = DateTime.UtcNow
+            for line in File.ReadAllLines(self.fpath):
+                fields = line.split('\t')
+                if len(fields) != 3:
+                    continue
+                ticks = Int64.Parse(fields[2])
+                if now - DateTime(ticks, DateTimeKind.Utc) > self.ttl:
+                    self.dirty = True # drop it on save
+                    continue
+                self.entries[fields[0]] = (fields[1], ticks)
+                if fields[1] != self.default:
+                    s3.SetBucketHost(fields[0], fields[1])
+        s3.BucketRedirected += self.on_redirected
+
+    def resolve(self, bucket, scheduler):
+        """Points requests to a bucket at its region, asking S3 where the 
+        bucket is unless that is known already."""
+        if not bucket or bucket in self.entries:
+            return
+        try:
+            location = scheduler.call(self.s3.GetBucketLocation, bucket)
+        except S3Exception, e:
+            if e.ErrorCode != S3ErrorCode.AccessDenied:
+                return
+            location = None # only its owner may ask; a redirect will tell
+        self.set(bucket, region_host(location, self.default))
+
+    def set(self, bucket, host):
+        Monitor.Enter(self.lock)
+        try:
+            self.entries[bucket] = (host, DateTime.UtcNow.Ticks)
+            self.dirty = True
+        finally:
+            Monitor.Exit(self.lock)
+        self.s3.SetBucketHost(bucket, host != self.default and host or None)
+
+    def forget(self, bucket):
+        Monitor.Enter(self.lock)
+        try:
+            if bucket in self.entries:
+                del self.entries[bucket]
+                self.dirty = True
+        finally:
+            Monitor.Exit(self.lock)
+        self.s3.SetBucketHost(bucket, None)
+
+    def on_redirected(self, sender, args):
+        Monitor.Enter(self.lock)
+        try:
+            self.entries[args.BucketName] = (args.Host, DateTime.UtcNow.Ticks)
+            self.dirty = True
+        finally:
+            Monitor.Exit(self.lock)
+
+    def save(self):
+        if not self.dirty:
+            return
+        lines = ['%s\t%s\t%s' % (bucket, host, ticks) for bucket, (host, ticks) in self.entries.items()]
+        Directory.CreateDirectory(Path.GetDirectoryName(self.fpath))
+        File.WriteAllText(self.fpath, '\n'.join(lines))
+        self.dirty = False
+
+class ProgressPrinter(object):
+    """Handles progress events by rewriting a line on the console, at most 
+    once per interval so that fast transfers are not slowed down by it."""
+
+    def __init__(self, preamble, enabled = True, interval = 250):
+        self.preamble = preamble
+        self.enabled = enabled
+        self.interval = interval # milliseconds
+        self.last = None
+
+    def __call__(self, sender, args):
+        if not self.enabled:
+            return
+        now = Environment.TickCount
+        if self.last is not None and now - self.last < self.interval and args.BytesTransferred < args.BytesTotal:
+            return
+        self.last = now
+        print '\r%s %s (%d%%)' % (self.preamble, args.BytesTransferred.ToString('N0'), args.ProgressPercentage),
+
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000) # milliseconds
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+def to_json(value):
+    """Formats numbers, strings, lists and dictionaries as JSON."""
+    if value is None:
+        return 'null'
+    if value is True or value is False:
+        return value and 'true' or 'false'
+    if isinstance(value, (int, long)):
+        return str(value)
+    if isinstance(value, float):
+        return '%.3f' % value
+    if isinstance(value, dict):
+        keys = value.keys()
+        keys.sort()
+        return '{%s}' % ', '.join(['%s: %s' % (to_json(str(k)), to_json(value[k])) for k in keys])
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join([to_json(item) for item in value])
+    s = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return '"%s"' % re.sub(r'[\x00-\x1f]', lambda m: '\\u%04x' % ord(m.group(0)), s)
+
+class TransferStats(object):
+    """Collects the timings of every request made through a service, the 
+    parts retried and the bytes transferred, and reports on them. Timings
+    are split into signing and response (time to first byte for requests
+    without a body) so that slowness can be pinned down. Resolving and 
+    connecting to the host are timed once, after the command, by probing."""
+
+    def __init__(self, s3, scheduler = None, transport = None):
+        self.s3 = s3
+        self.scheduler = scheduler
+        self.transport = transport
+        self.lock = Object()
+        self.stopwatch = Stopwatch.StartNew()
+        self.requests = self.failures = self.retries = 0
+        self.methods = {}
+        self.statuses = {}
+        self.latencies = []
+        self.first_byte = []
+        self.signing = 0.0
+        self.connections = {}
+        self.transfers = {}
+        s3.RequestCompleted += self.on_request
+        s3.PartRetry += self.on_retry
+        s3.AddObjectProgress += self.on_progress
+        s3.GetObjectProgress += self.on_progress
+
+    def on_request(self, sender, args):
+        request = args.Request.WebRequest
+        latency = args.ResponseTime.TotalMilliseconds
+        Monitor.Enter(self.lock)
+        try:
+            self.requests += 1
+            if args.Error:
+                self.failures += 1
+            self.methods[request.Method] = self.methods.get(request.Method, 0) + 1
+            status = str(Convert.ToInt32(args.StatusCode))
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.latencies.append(latency)
+            if request.Method in ('GET', 'HEAD', 'DELETE'):
+                self.first_byte.append(latency)
+            self.signing += args.SigningTime.TotalMilliseconds
+            host = request.Address.Authority
+            self.connections[host] = max(self.connections.get(host, 0), args.Request.ServicePoint.CurrentConnections)
+        finally:
+            Monitor.Exit(self.lock)
+
+    def on_retry(self, sender, args):
+        Monitor.Enter(self.lock)
+        try:
+            self.retries += 1
+        finally:
+            Monitor.Exit(self.lock)
+
+    def on_progress(self, sender, args):
+        self.transfers[(args.BucketName, args.Key)] = args.BytesTransferred
+
+    def probe(self):
+        """Times resolving and connecting to the service host."""
+        from System.Net import Dns
+        from System.Net.Sockets import TcpClient
+        port = self.s3.CustomPort or (self.s3.UseSsl and 443 or 80)
+        try:
+            stopwatch = Stopwatch.StartNew()
+            addresses = Dns.GetHostAddresses(self.s3.Host)
+            dns = stopwatch.Elapsed.TotalMilliseconds
+            client = TcpClient()
+            try:
+                stopwatch = Stopwatch.StartNew()
+                client.Connect(addresses[0], port)
+                connect = stopwatch.Elapsed.TotalMilliseconds
+            finally:
+                client.Close()
+        except Exception:
+            return None, None
+        return dns, connect
+
+    def report(self):
+        elapsed = self.stopwatch.Elapsed.TotalSeconds
+        latencies = list(self.latencies)
+        latencies.sort()
+        first_byte = list(self.first_byte)
+        first_byte.sort()
+        histogram = {}
+        for latency in latencies:
+            label = '>=%dms' % LATENCY_BUCKETS[-1]
+            for bound in LATENCY_BUCKETS:
+                if latency < bound:
+                    label = '<%dms' % bound
+                    break
+            histogram[label] = histogram.get(label, 0) + 1
+        transferred = 0
+        for bytes in self.transfers.values():
+            transferred += bytes
+        connections = 0
+        for peak in self.connections.values():
+            connections += max(peak, 1)
+        dns, connect = self.probe()
+        report = {
+            'elapsed_sec': elapsed,
+            'requests': self.requests,
+            'failed_requests': self.failures,
+            'retries': self.retries,
+            'requests_by_method': self.methods,
+            'requests_by_status': self.statuses,
+            'bytes': int(transferred),
+            'bytes_per_sec': elapsed and transferred / elapsed or 0.0,
+            'signing_ms_avg': self.requests and self.signing / self.requests or 0.0,
+            'ttfb_ms': { 'p50': percentile(first_byte, 50), 'p90': percentile(first_byte, 90), 
+                         'p99': percentile(first_byte, 99) },
+            'latency_ms': { 'p50': percentile(latencies, 50), 'p90': percentile(latencies, 90), 
+                            'p99': percentile(latencies, 99), 'max': percentile(latencies, 100) },
+            'latency_histogram': histogram,
+            'connections_peak': connections,
+            'requests_per_connection': connections and float(self.requests) / connections or 0.0,
+            'dns_ms': dns,
+            'connect_ms': connect,
+        }
+        if self.transport:
+            opened = self.transport.opened
+            report['connections_opened'] = opened
+            report['requests_per_connection'] = opened and float(self.requests) / opened or 0.0
+        if self.scheduler:
+            report['concurrency'] = self.scheduler.summary()
+        return report
+
+    def print_report(self, output, as_json = False):
+        report = self.report()
+        if as_json:
+            print >> output, to_json(report)
+            return
+        print >> output, 'Elapsed:           %.3f sec' % report['elapsed_sec']
+        print >> output, 'Requests:          %d (%d failed, %d part retries)' % (
+            report['requests'], report['failed_requests'], report['retries'])
+        print >> output, 'Transferred:       %s bytes (%s bytes/sec)' % (
+            Int64(report['bytes']).ToString('N0'), Int64(report['bytes_per_sec']).ToString('N0'))
+        print >> output, 'Signing:           %.3f ms/request' % report['signing_ms_avg']
+        for name, title in (('ttfb_ms', 'Time to 1st byte:'), ('latency_ms', 'Response time:')):
+            values = report[name]
+            print >> output, '%-18s p50 %.1f ms, p90 %.1f ms, p99 %.1f ms' % (title, values['p50'], values['p90'], values['p99'])
+        if 'connections_opened' in report:
+            print >> output, 'Connections:       %d opened, %d at peak, %.1f requests each' % (
+                report['connections_opened'], report['connections_peak'], report['requests_per_connection'])
+        else:
+            print >> output, 'Connections:       %d at peak, %.1f requests each' % (
+                report['connections_peak'], report['requests_per_connection'])
+        if self.transport:
+            print >> output, self.transport.describe()
+        if report['dns_ms'] is not None:
+            print >> output, 'DNS, connect:      %.1f ms, %.1f ms (probed)' % (report['dns_ms'], report['connect_ms'])
+        if self.scheduler:
+            print >> output, self.scheduler.describe()
+        histogram = report['latency_histogram']
+        for bound in LATENCY_BUCKETS + (None, ):
+            label = bound and '<%dms' % bound or '>=%dms' % LATENCY_BUCKETS[-1]
+            if label in histogram:
+                print >> output, '  %8s  %d' % (label, histogram[label])
 
 def parse_options(args, names, flags = None, lax = False):
     args = list(args) # copy for r/w
@@ -322,15 +1480,340 @@ def lax_parse_options(args, names, flags = None):
 def parse_canned_acl_arg(arg):
     return arg and Enum.Parse(CannedAcl, arg.replace('-', ''), True) or CannedAcl.Private
 
+SIZE_UNITS = { '': 1, 'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024 }
+
+def parse_size_arg(arg, default = None):
+    """Parses a size in bytes, optionally suffixed with K, M or G."""
+    if not arg:
+        return default
+    match = re.match(r'^(\d+)([KMG]?)B?$', arg.upper())
+    if not match:
+        raise Exception('Invalid size: %s' % arg)
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_PARALLELISM = 4
+DEFAULT_CACHE_TTL = 300 # seconds
+DEFAULT_CACHE_SIZE = 1000 # pages
+DEFAULT_ENDPOINT_TTL = 7 * 24 * 60 * 60 # seconds
+DEFAULT_STAT_WINDOW = 64 # requests in flight
+DEFAULT_PACK_GAP = 64 * 1024 # bytes of other members worth reading to save a request
+DEFAULT_PACK_RANGE = 16 * 1024 * 1024
+PACK_INDEX_SUFFIX = '.idx'
+PACK_INDEX_HEADER = 'LitS3 pack 1'
+DEFAULT_MAX_INFLIGHT = 64
+DEFAULT_ATTEMPTS = 5
+LATENCY_TOLERANCE = 4 # times the best latency seen
+
+THROTTLE_CODES = ('SlowDown', )
+TRANSIENT_CODES = ('BadDigest', 'InternalError', 'OperationAborted', 'RequestTimeout')
+REDIRECT_CODES = ('PermanentRedirect', 'TemporaryRedirect')
+
+def is_not_found(e):
+    """Tells whether an error from an S3 request means the object does not exist."""
+    if isinstance(e, S3Exception):
+        if e.ErrorCode == S3ErrorCode.NoSuchKey:
+            return True
+        e = e.InnerException
+    return isinstance(e, WebException) and e.Response is not None and Convert.ToInt32(e.Response.StatusCode) == 404
+
+def classify_error(e):
+    """Classifies an error from an S3 request as 'throttled' when the server 
+    asked to slow down, 'transient' when trying again may well succeed, 
+    'redirected' when the server named the host to try instead or None 
+    when the request should not be repeated."""
+    if isinstance(e, S3Exception):
+        code = str(e.ErrorCode)
+        if code in THROTTLE_CODES:
+            return 'throttled'
+        if code in REDIRECT_CODES and e.Endpoint:
+            return 'redirected' # the service now sends the bucket's requests there
+        if code in TRANSIENT_CODES:
+            return 'transient'
+        if code != 'Unknown':
+            return None
+        e = e.InnerException
+    if isinstance(e, WebException):
+        response = e.Response
+        if response is None:
+            return 'transient' # could not connect, timed out and the like
+        status = Convert.ToInt32(response.StatusCode)
+        if status == 503:
+            return 'throttled'
+        return status >= 500 and 'transient' or None
+    if isinstance(e, IOException):
+        return 'transient'
+    return None
+
+class Scheduler(object):
+    """Runs requests to S3, retrying those that fail for transient reasons 
+    with a jittered exponential backoff, and limits how many are in flight 
+    at once. The limit grows by one after each round of successful requests 
+    answered without the latency climbing, is halved when the server 
+    throttles and is lowered by one when latency climbs well above the best 
+    seen so far (additive increase, multiplicative decrease). Latency is 
+    taken from the requests without a body, whose response time does not 
+    depend on how much is being uploaded. Each part of a parallel upload or
+    download made by LitS3 goes through it as a request of its own."""
+
+    def __init__(self, s3, limit = DEFAULT_PARALLELISM, max_limit = DEFAULT_MAX_INFLIGHT, 
+                 attempts = DEFAULT_ATTEMPTS, base_delay = 100, max_delay = 20000):
+        self.lock = Object()
+        self.random = Random()
+        self.limit = self.initial = self.low = self.high = min(limit, max_limit)
+        self.max_limit = max_limit
+        self.attempts = attempts
+        self.base_delay = base_delay # milliseconds
+        self.max_delay = max_delay # milliseconds
+        self.inflight = 0
+        self.successes = 0
+        self.latency = None # moving average in milliseconds
+        self.best_latency = None
+        self.last_decrease = None
+        self.throttles = self.retries = 0
+        self.waited = 0 # milliseconds spent backing off
+        s3.RequestCompleted += self.on_request
+        # each part of a parallel transfer is a request of its own here
+        s3.PartRunner = Action[Action](self.call)
+
+    def offer(self, workers):
+        """Raises the limit to a number of workers a command is about to use, 
+        unless the server has throttled this run already."""
+        Monitor.Enter(self.lock)
+        try:
+            if not self.throttles and workers > self.limit:
+                self.limit = min(workers, self.max_limit)
+                self.high = max(self.high, self.limit)
+                Monitor.PulseAll(self.lock)
+        finally:
+            Monitor.Exit(self.lock)
+
+    def call(self, func, *args):
+        """Calls a function that makes a request, waiting for a free slot 
+        first and retrying it if it fails with a transient error."""
+        attempt = 1
+        while True:
+            self.acquire()
+            try:
+                result = func(*args)
+            except Exception, e:
+                kind = self.release(e)
+                if not kind or attempt >= self.attempts:
+                    raise
+                if kind != 'redirected':
+                    Thread.Sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            self.release()
+            return result
+
+    def acquire(self):
+        """Waits for a free slot for a request made other than through call, 
+        such as one begun asynchronously. Each slot taken must be released."""
+        Monitor.Enter(self.lock)
+        try:
+            while self.inflight >= self.limit:
+                Monitor.Wait(self.lock)
+            self.inflight += 1
+        finally:
+            Monitor.Exit(self.lock)
+
+    def release(self, error = None):
+        """Frees a slot taken with acquire and counts how its request went 
+        towards the limit. Returns the kind of the error, if any, as told 
+        by classify_error."""
+        kind = error is not None and classify_error(error) or None
+        outcome = error is None and 'ok' or kind
+        Monitor.Enter(self.lock)
+        try:
+            self.inflight -= 1
+            if outcome == 'ok':
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_limit and not self.__slow():
+                    self.limit += 1
+                    self.high = max(self.high, self.limit)
+                    self.successes = 0
+            elif outcome == 'throttled':
+                self.throttles += 1
+                self.__decrease(self.limit / 2)
+            Monitor.PulseAll(self.lock)
+        finally:
+            Monitor.Exit(self.lock)
+        return kind
+
+    def on_request(self, sender, args):
+        if args.Error or args.Request.WebRequest.Method not in ('GET', 'HEAD', 'DELETE'):
+            return
+        latency = args.ResponseTime.TotalMilliseconds
+        Monitor.Enter(self.lock)
+        try:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = self.latency * 0.8 + latency * 0.2
+            if self.best_latency is None or self.latency < self.best_latency:
+                self.best_latency = self.latency
+            if self.__slow():
+                self.__decrease(self.limit - 1)
+        finally:
+            Monitor.Exit(self.lock)
+
+    def __slow(self):
+        return self.latency is not None and self.latency > max(self.best_latency, 10) * LATENCY_TOLERANCE
+
+    def __decrease(self, limit):
+        # once per round trip at most, or one burst of errors would floor it
+        now = Environment.TickCount
+        if self.last_decrease is not None and now - self.last_decrease < max(self.latency or 0, 10):
+            return
+        self.last_decrease = now
+        self.limit = max(1, limit)
+        self.low = min(self.low, self.limit)
+        self.successes = 0
+
+    def backoff(self, attempt):
+        """Picks how many milliseconds to wait before trying a request again
+        after the given attempt failed, and counts it as retried."""
+        Monitor.Enter(self.lock)
+        try:
+            self.retries += 1
+            delay = self.random.Next(min(self.max_delay, self.base_delay * 2 ** attempt))
+            self.waited += delay
+        finally:
+            Monitor.Exit(self.lock)
+        return delay
+
+    def summary(self):
+        return {
+            'initial_limit': self.initial,
+            'lowest_limit': self.low,
+            'highest_limit': self.high,
+            'final_limit': self.limit,
+            'throttled': self.throttles,
+            'retries': self.retries,
+            'backoff_sec': self.waited / 1000.0,
+        }
+
+    def describe(self):
+        return ('Concurrency started at %(initial_limit)d, ranged from %(lowest_limit)d to %(highest_limit)d '
+                'and ended at %(final_limit)d; %(throttled)d request(s) throttled, %(retries)d retried, '
+                '%(backoff_sec).1f sec spent backing off.') % self.summary()
+
+TRANSPORT_SETTINGS = ('max-connections', 'keep-alive', 'expect-100', 'nagle', 
+                      'request-timeout', 'read-timeout', 'idle-timeout')
+
+def parse_bool_arg(arg):
+    value = str(arg).lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('0', 'false', 'no', 'off'):
+        return False
+    raise Exception('Invalid yes/no value: %s' % arg)
+
+def load_transport_config(fpath):
+    """Reads transport settings from a file with one NAME VALUE (or 
+    NAME = VALUE) pair per line. Comment lines start with a hash."""
+    settings = {}
+    for line in File.ReadAllLines(fpath):
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        fields = line.replace('=', ' ', 1).split(None, 1)
+        if len(fields) != 2 or fields[0] not in TRANSPORT_SETTINGS:
+            raise Exception('Invalid transport setting in %s: %s' % (fpath, line))
+        settings[fields[0]] = fields[1].strip()
+    return settings
+
+class TransportProfile(object):
+    """How requests use the network: how many connections are opened to 
+    each host, whether they are kept alive for the next request, whether 
+    bodies wait for a 100 Continue, whether Nagle's algorithm holds back 
+    small packets and how long to wait on a request before giving up. 
+    Settings left as None keep the defaults of .NET. It also counts the
+    connections actually opened so that their reuse can be reported."""
+
+    def __init__(self, max_connections = None, keep_alive = None, expect_100 = None,
+                 nagle = None, request_timeout = None, read_timeout = None, idle_timeout = None):
+        self.max_connections = max_connections
+        self.keep_alive = keep_alive
+        self.expect_100 = expect_100
+        self.nagle = nagle
+        self.request_timeout = request_timeout # seconds
+        self.read_timeout = read_timeout # seconds
+        self.idle_timeout = idle_timeout # seconds
+        self.opened = 0
+        self.lock = Object()
+
+    def apply(self, s3):
+        """Sets up the service points to come and every request the service makes."""
+        if self.max_connections is not None:
+            ServicePointManager.DefaultConnectionLimit = self.max_connections
+        if self.expect_100 is not None:
+            ServicePointManager.Expect100Continue = self.expect_100
+        if self.nagle is not None:
+            ServicePointManager.UseNagleAlgorithm = self.nagle
+        if self.idle_timeout is not None:
+            ServicePointManager.MaxServicePointIdleTime = int(self.idle_timeout * 1000)
+        s3.BeforeAuthorize += self.on_request
+
+    def on_request(self, sender, args):
+        request = args.Request
+        if self.keep_alive is not None:
+            request.KeepAlive = self.keep_alive
+        if self.request_timeout:
+            request.Timeout = int(self.request_timeout * 1000)
+        if self.read_timeout:
+            request.ReadWriteTimeout = int(self.read_timeout * 1000)
+        point = request.ServicePoint
+        if self.max_connections is not None:
+            # the limit set here wins over any raised for parallel transfers
+            point.ConnectionLimit = self.max_connections
+        if self.expect_100 is not None:
+            point.Expect100Continue = self.expect_100
+        if self.nagle is not None:
+            point.UseNagleAlgorithm = self.nagle
+        if point.BindIPEndPointDelegate is None:
+            point.BindIPEndPointDelegate = BindIPEndPoint(self.on_connect)
+
+    def on_connect(self, point, remote, retry):
+        # called for every new connection, and again if binding it failed
+        if not retry:
+            Monitor.Enter(self.lock)
+            try:
+                self.opened += 1
+            finally:
+                Monitor.Exit(self.lock)
+        return None # any local end point will do
+
+    def describe(self):
+        def on_off(value):
+            if value is None:
+                return 'as default'
+            return value and 'on' or 'off'
+        limit = self.max_connections is None and 'default' or 'up to %d' % self.max_connections
+        return 'Transport: %s connection(s) per host, keep-alive %s, Expect 100 %s, Nagle %s.' % (
+            limit, on_off(self.keep_alive), on_off(self.expect_100), on_off(self.nagle))
+
 class S3Commander(object):
 
-    def __init__(self, s3):
+    def __init__(self, s3, cache = None, scheduler = None, transport = None, endpoints = None):
         self.s3 = s3
+        self.cache = cache
+        self.scheduler = scheduler or Scheduler(s3)
+        self.transport = transport
+        self.endpoints = endpoints
+        if transport:
+            transport.apply(s3)
+        self.progress = True
 
     def __call__(self, name, args):
-        cmd = getattr(self, name.replace('del', 'rm').replace('ls', 'list'), None)
+        cmd = getattr(self, name.replace('del', 'rm').replace('ls', 'list').replace('-', '_'), None)
         if not cmd:
             raise Exception('Unknown command (%s).' % name)
+        if self.endpoints:
+            for arg in args:
+                if is_s3uri(arg):
+                    self.endpoints.resolve(parse_s3uri(arg)[0], self.scheduler)
         opt_specs = getattr(cmd, 'opt_specs', None)
         if opt_specs:
             flags = getattr(cmd, 'opt_flags', None)
@@ -344,31 +1827,64 @@ class S3Commander(object):
             raise Exception('Missing bucket name.')
         bucket = args.pop(0)
         if options.get('europe', False):
-            self.s3.CreateBucketInEurope(bucket)
+            self.scheduler.call(self.s3.CreateBucketInEurope, bucket)
         else:
-            self.s3.CreateBucket(bucket)
+            self.scheduler.call(self.s3.CreateBucket, bucket)
+        if self.endpoints:
+            self.endpoints.set(bucket, region_host(options.get('europe', False) and 'EU' or None, 
+                                                   self.endpoints.default))
 
     mkbkt.opt_specs = ('europe', )
     mkbkt.opt_flags = ('europe', )
 
-    def rmbkt(self, args):
+    def rmbkt(self, args, options):
         """Deletes a bucket"""
         if not args:
             raise Exception('Missing bucket name.')
-        self.s3.DeleteBucket(args.pop(0))
+        bucket = args.pop(0)
+        if options.get('force', False):
+            self.__rm_tree(bucket, '', options)
+            if options.get('dry-run', False):
+                return
+        self.scheduler.call(self.s3.DeleteBucket, bucket)
+        if self.endpoints:
+            self.endpoints.forget(bucket)
+
+    rmbkt.opt_specs = ('force', 'workers', 'single', 'dry-run')
+    rmbkt.opt_flags = ('force', 'single', 'dry-run')
  
     def list(self, args, options):
         """Lists all buckets or objects in a bucket, optionally constrained by a prefix."""
         brief = options.get('brief', False)
+        format = options.get('format')
+        if format and format not in LISTING_FORMATS:
+            raise Exception('Invalid format: %s' % format)
+        time_format = options.get('time', 'iso')
+        if time_format not in ('iso', 'epoch'):
+            raise Exception('Invalid time format: %s' % time_format)
         if not args:
-            buckets = self.s3.GetAllBuckets()
+            if format:
+                raise Exception('The --format option needs a bucket to list.')
+            buckets = self.scheduler.call(lambda: list(self.s3.GetAllBuckets()))
             print '\n'.join(
                 [brief and b.Name or '%s  %s' % (b.CreationDate.ToString('r'), b.Name) for b in buckets])
         else:
             bucket, prefix = parse_s3uri(args.pop(0))
-            objs = self.s3.ListAllObjects(bucket, prefix)
+            parallel = int(options.get('parallel', 0))
+            delimiter = not options.get('recursive', False) and self.s3.DefaultDelimiter or None
+            if parallel:
+                self.scheduler.offer(parallel)
+                objs = list_parallel(self.s3, bucket, prefix, delimiter, parallel, self.cache, self.scheduler)
+            else:
+                objs = list_range(self.s3, bucket, prefix, delimiter, None, None, self.cache, self.scheduler)
+            if format:
+                writer = ListingWriter(sys.stdout, format, time_format == 'epoch')
+                for obj in objs:
+                    writer.write(obj)
+                writer.flush()
+                return
             for obj in objs:
-                if type(obj) == CommonPrefix:
+                if is_common_prefix(obj):
                     display = brief and obj.Prefix or ' ' * 53 + obj.Prefix
                 else:
                     display = brief and obj.Key[len(prefix):] or '%s  %20s  %s' % (
@@ -377,8 +1893,8 @@ class S3Commander(object):
                         obj.Key[len(prefix):])
                 print display
 
-    list.opt_specs = ('brief', )
-    list.opt_flags = ('brief', )
+    list.opt_specs = ('brief', 'parallel', 'format', 'time', 'recursive')
+    list.opt_flags = ('brief', 'recursive')
 
     def put(self, args, options):
         """Puts a local file as an object in a bucket."""
@@ -390,44 +1906,342 @@ class S3Commander(object):
         fpath = args.pop(0)
         if not key or key[-1] == '/':
             key = (key and key or '') + Path.GetFileName(fpath)
-        content_type = options.get('content-type', MIME_MAP.get(Path.GetExtension(fpath), 'application/octet-stream'))
+        content_type = options.get('content-type', guess_content_type(fpath))
         acl = parse_canned_acl_arg(options.get('acl'))
         fname = Path.GetFileName(fpath)
         preamble = 'Uploading %s (%s bytes) as %s...' % (fname, FileInfo(fpath).Length.ToString('N0'), content_type)
         print preamble,
-        iswin = is_windows()
-        def on_progress(sender, args):
-            if iswin:
-                print '\r%s %s (%d%%)' % (preamble, args.BytesTransferred.ToString('N0'), args.ProgressPercentage),
+        on_progress = ProgressPrinter(preamble, self.progress)
+        part_size = parse_size_arg(options.get('part-size'))
+        parallel = int(options.get('parallel', 0))
+        verify = options.get('verify', False)
+        if options.get('resume', False):
+            if verify:
+                raise Exception('The --verify and --resume options cannot be combined.')
+            self.__put_resumable(fpath, bucket, key, content_type, acl, 
+                part_size or DEFAULT_PART_SIZE, parallel or DEFAULT_PARALLELISM, on_progress)
+            self.__changed(bucket, key)
+            print 'OK'
+            return
         try:
             self.s3.AddObjectProgress += on_progress
-            self.s3.AddObject(fpath, bucket, key, content_type, acl)
+            if part_size or parallel:
+                # the parts go through the scheduler one by one, see Scheduler
+                self.scheduler.offer(parallel or DEFAULT_PARALLELISM)
+                self.s3.AddObjectMultipart(fpath, bucket, key, content_type, acl,
+                    part_size or DEFAULT_PART_SIZE, parallel or DEFAULT_PARALLELISM, verify)
+            else:
+                self.scheduler.call(self.s3.AddObject, fpath, bucket, key, content_type, acl, verify)
         finally:
             self.s3.AddObjectProgress -= on_progress
-        print 'OK'
+        self.__changed(bucket, key)
+        print verify and 'OK (verified)' or 'OK'
     
-    put.opt_specs = ('content-type', 'acl')
+    put.opt_specs = ('content-type', 'acl', 'part-size', 'parallel', 'verify', 'resume')
+    put.opt_flags = ('verify', 'resume')
+
+    def __put_resumable(self, fpath, bucket, key, content_type, acl, part_size, parallel, on_progress):
+        info = FileInfo(fpath)
+        length = info.Length
+        if part_size < S3Service.MinimumPartSize:
+            raise Exception('Parts must be at least 5 MB in size.')
+        count = max(1, (length + part_size - 1) // part_size)
+        if count > S3Service.MaximumPartCount:
+            raise Exception('The file needs more than %d parts; use a larger --part-size.' % S3Service.MaximumPartCount)
+        journal = TransferJournal(fpath + '.s3put', 
+            ('put', bucket, key, length, info.LastWriteTimeUtc.Ticks, part_size))
+        if journal.previous and journal.previous[1].get('upload'):
+            # the file or the target changed; throw away the parts of the old upload
+            header, entries = journal.previous
+            try:
+                self.s3.AbortMultipartUpload(header[1], header[2], entries['upload'])
+            except Exception:
+                pass
+        upload_id = journal.entries.get('upload')
+        if not upload_id:
+            upload_id = self.scheduler.call(self.s3.InitiateMultipartUpload, bucket, key, content_type, acl)
+            journal.start()
+            journal.record('upload', upload_id)
+        def part_bytes(part):
+            return min(part_size, length - (part - 1) * part_size)
+        missing = [part for part in range(1, count + 1) if str(part) not in journal.entries]
+        state = { 'done': length - sum([part_bytes(part) for part in missing]) }
+        on_progress(self, PartProgress(state['done'], length))
+        def upload(part):
+            def send():
+                # reopened on every attempt so that a retry starts at the beginning of the part
+                stream = File.OpenRead(fpath)
+                try:
+                    stream.Seek((part - 1) * part_size, SeekOrigin.Begin)
+                    return self.s3.UploadPart(stream, Int64(part_bytes(part)), bucket, key, upload_id, part)
+                finally:
+                    stream.Close()
+            journal.record(part, self.scheduler.call(send))
+            Monitor.Enter(journal.lock)
+            try:
+                state['done'] += part_bytes(part)
+                on_progress(self, PartProgress(state['done'], length))
+            finally:
+                Monitor.Exit(journal.lock)
+        self.scheduler.offer(parallel)
+        try:
+            run_parallel(missing, upload, parallel)
+        except S3Exception, e:
+            if e.ErrorCode != S3ErrorCode.NoSuchUpload:
+                raise
+            journal.delete()
+            raise Exception('The upload was aborted or has expired on the server. Run again to start over.')
+        etags = Array.CreateInstance(String, count)
+        for part in range(1, count + 1):
+            etags[part - 1] = journal.entries[str(part)]
+        self.scheduler.call(self.s3.CompleteMultipartUpload, bucket, key, upload_id, etags)
+        journal.delete()
 
     def puts(self, args, options):
-        """Puts text from standard input as an object in a bucket."""
+        """Puts text, or any data with --binary, from standard input as an object in a bucket."""
         if not args:
             raise Exception('Missing target object for text.')
         bucket, key = parse_s3uri(args.pop(0))
         if not key:
             raise Exception('Missing key for text.')
         acl = parse_canned_acl_arg(options.get('acl'))
+        if options.get('binary', False):
+            part_size = parse_size_arg(options.get('part-size')) or DEFAULT_PART_SIZE
+            expected = parse_size_arg(options.get('expected-size'))
+            if expected:
+                # leave room for the whole stream within the part count limit, in whole MB
+                needed = (expected + S3Service.MaximumPartCount - 1) // S3Service.MaximumPartCount
+                part_size = max(part_size, (needed + 1048575) // 1048576 * 1048576)
+            content_type = options.get('content-type', 'application/octet-stream')
+            print 'Uploading standard input as %s...' % content_type,
+            length, parts = self.__put_stream(Console.OpenStandardInput(), bucket, key, content_type, acl, 
+                part_size, int(options.get('parallel', DEFAULT_PARALLELISM)))
+            print 'OK (%s bytes%s)' % (Int64(length).ToString('N0'), parts and ' in %d parts' % parts or '')
+            return
         txt = sys.stdin.read()
         print 'Uploading %s characters of text...' % len(txt).ToString("N0"),
-        self.s3.AddObjectString(txt, bucket, key, 'text/plain', acl)
+        self.scheduler.call(self.s3.AddObjectString, txt, bucket, key, 'text/plain', acl)
+        self.__changed(bucket, key)
+        print 'OK'
+
+    puts.opt_specs = ('acl', 'binary', 'content-type', 'part-size', 'parallel', 'expected-size')
+    puts.opt_flags = ('binary', )
+
+    def __put_stream(self, input, bucket, key, content_type, acl, part_size, parallel):
+        """Uploads a stream of unknown length. It is read a part at a time 
+        into a fixed set of buffers, one more than the parts sent at once, 
+        so memory stays bounded however long the stream is. A stream that 
+        ends within the first part is sent as a single object. Returns the
+        number of bytes sent and of parts, zero for a single object. The 
+        stream need only have a Read method like that of a .NET stream."""
+        if part_size < S3Service.MinimumPartSize:
+            raise Exception('Parts must be at least 5 MB in size.')
+        if part_size > Int32.MaxValue:
+            raise Exception('Parts of a stream must be under 2 GB in size.')
+        parallel = max(1, parallel)
+        def fill(buffer):
+            count = 0
+            while count < buffer.Length:
+                read = input.Read(buffer, count, buffer.Length - count)
+                if read == 0:
+                    break
+                count += read
+            return count
+        first = Array.CreateInstance(Byte, part_size)
+        count = fill(first)
+        if count < part_size:
+            def send():
+                return self.s3.AddObject(MemoryStream(first, 0, count, False), Int64(count), 
+                                         bucket, key, content_type, acl)
+            self.scheduler.call(send)
+            self.__changed(bucket, key)
+            return count, 0
+        upload_id = self.scheduler.call(self.s3.InitiateMultipartUpload, bucket, key, content_type, acl)
+        free = WorkQueue()
+        free.put(first)
+        for i in range(parallel):
+            free.put(Array.CreateInstance(Byte, part_size))
+        etags = {}
+        state = { 'bytes': 0, 'first': count }
+        lock = Object()
+        def parts():
+            part = 0
+            while True:
+                buffer = free.take()
+                if buffer is None:
+                    return
+                if state['first']:
+                    count, state['first'] = state['first'], 0
+                else:
+                    count = fill(buffer)
+                if count == 0:
+                    return
+                part += 1
+                if part > S3Service.MaximumPartCount:
+                    raise Exception('The stream needs more than %d parts; use a larger --part-size or give --expected-size.' % S3Service.MaximumPartCount)
+                yield part, buffer, count
+                if count < part_size:
+                    return
+        def upload(item):
+            part, buffer, count = item
+            def send():
+                # a fresh view of the buffer on every attempt so a retry starts over
+                return self.s3.UploadPart(MemoryStream(buffer, 0, count, False), Int64(count), 
+                                          bucket, key, upload_id, part)
+            try:
+                etag = self.scheduler.call(send)
+            finally:
+                free.put(buffer)
+            Monitor.Enter(lock)
+            try:
+                etags[part] = etag
+                state['bytes'] += count
+            finally:
+                Monitor.Exit(lock)
+        self.scheduler.offer(parallel)
+        done = False
+        try:
+            run_parallel(parts(), upload, parallel)
+            ordered = Array.CreateInstance(String, len(etags))
+            for part in range(1, len(etags) + 1):
+                ordered[part - 1] = etags[part]
+            self.scheduler.call(self.s3.CompleteMultipartUpload, bucket, key, upload_id, ordered)
+            done = True
+        finally:
+            if not done:
+                # the parts sent so far would otherwise be kept, and billed, by S3
+                free.close()
+                try:
+                    self.s3.AbortMultipartUpload(bucket, key, upload_id)
+                except Exception:
+                    pass
+        self.__changed(bucket, key)
+        return state['bytes'], len(etags)
+
+    def pack_put(self, args, options):
+        """Packs all files under a local directory into one object with an index of them."""
+        if not args:
+            raise Exception('Missing local directory.')
+        root = args.pop(0)
+        if not Directory.Exists(root):
+            raise Exception('No such directory: %s' % root)
+        if not args:
+            raise Exception('Missing target object path.')
+        bucket, key = parse_s3uri(args.pop(0))
+        if not key or key[-1] == '/':
+            raise Exception('Missing key for the pack.')
+        acl = parse_canned_acl_arg(options.get('acl'))
+        part_size = parse_size_arg(options.get('part-size')) or DEFAULT_PART_SIZE
+        members = [(fpath, rpath, FileInfo(fpath).Length) for fpath, rpath in walk_files(root)]
+        members.sort(key = lambda member: member[1])
+        total = sum([member[2] for member in members])
+        # leave room for the whole pack within the part count limit, in whole MB
+        needed = (total + S3Service.MaximumPartCount - 1) // S3Service.MaximumPartCount
+        part_size = max(part_size, (needed + 1048575) // 1048576 * 1048576)
+        print 'Packing %d files (%s bytes) into %s...' % (len(members), Int64(total).ToString('N0'), key),
+        length, parts = self.__put_stream(PackReader([(member[0], member[2]) for member in members]), 
+            bucket, key, 'application/octet-stream', acl, part_size, 
+            int(options.get('parallel', DEFAULT_PARALLELISM)))
+        # the index goes last so that a pack with an index is always complete
+        index = [PACK_INDEX_HEADER] + ['%s\t%s' % (member[2], Uri.EscapeDataString(member[1])) for member in members]
+        self.scheduler.call(self.s3.AddObjectString, '\n'.join(index), bucket, key + PACK_INDEX_SUFFIX, 'text/plain', acl)
+        self.__changed(bucket, key + PACK_INDEX_SUFFIX)
+        print 'OK (%d requests)' % (parts and parts + 3 or 2)
+
+    pack_put.opt_specs = ('acl', 'part-size', 'parallel')
+
+    def pack_get(self, args, options):
+        """Gets members of a pack made by pack-put as local files, coalescing nearby members into one request."""
+        if not args:
+            raise Exception('Missing pack object path.')
+        bucket, key = parse_s3uri(args.pop(0))
+        if not key:
+            raise Exception('Missing key.')
+        members = self.scheduler.call(self.__pack_index, bucket, key)
+        if options.get('list', False):
+            for name, offset, length in members:
+                print '%s\t%s' % (length, name)
+            return
+        if args:
+            wanted = {}
+            for pattern in args:
+                regex = re.compile(glob_to_regex(pattern) + '$')
+                matched = [member for member in members if regex.match(member[0])]
+                if not matched:
+                    raise Exception('No member of the pack matches %s' % pattern)
+                for member in matched:
+                    wanted[member[0]] = member
+            members = wanted.values()
+        root = Path.GetFullPath(options.get('to', '.'))
+        def local_path(name):
+            fpath = local_target(root, name)
+            Directory.CreateDirectory(Path.GetDirectoryName(fpath))
+            return fpath
+        for name, offset, length in members:
+            if not length:
+                File.Create(local_path(name)).Close()
+        ranges = coalesce_ranges([member for member in members if member[2]],
+            parse_size_arg(options.get('gap')) or DEFAULT_PACK_GAP, 
+            parse_size_arg(options.get('max-range')) or DEFAULT_PACK_RANGE)
+        print 'Getting %d members of %s in %d requests...' % (len(members), key, len(ranges)),
+        def fetch(group):
+            start = group[0][1]
+            end = group[-1][1] + group[-1][2]
+            def receive():
+                request = GetObjectRequest(self.s3, bucket, key)
+                request.AddRange(Int64(start), Int64(end - 1))
+                response = request.GetResponse()
+                try:
+                    input = response.GetResponseStream()
+                    position = start
+                    for name, offset, length in group:
+                        copy_stream(input, Stream.Null, offset - position) # the gap between members
+                        output = File.Create(local_path(name))
+                        try:
+                            copy_stream(input, output, length)
+                        finally:
+                            output.Close()
+                        position = offset + length
+                finally:
+                    response.Close()
+            self.scheduler.call(receive)
+        workers = int(options.get('workers', DEFAULT_PARALLELISM))
+        self.scheduler.offer(workers)
+        run_parallel(ranges, fetch, workers)
         print 'OK'
 
-    puts.opt_specs = ('acl', )
+    pack_get.opt_specs = ('to', 'list', 'gap', 'max-range', 'workers')
+    pack_get.opt_flags = ('list', )
+
+    def __pack_index(self, bucket, key):
+        lines = self.s3.GetObjectString(bucket, key + PACK_INDEX_SUFFIX).split('\n')
+        if lines[0] != PACK_INDEX_HEADER:
+            raise Exception('%s is not the index of a pack.' % (key + PACK_INDEX_SUFFIX))
+        members = []
+        offset = 0
+        for line in lines[1:]:
+            if line:
+                length, name = line.split('\t')
+                length = Int64.Parse(length)
+                members.append((Uri.UnescapeDataString(name), offset, length))
+                offset += length
+        return members
 
-    def get(self, args):
-        """Gets an object from a bucket as a local file."""
+    def get(self, args, options):
+        """Gets an object, several objects or all objects under a prefix from a bucket as local files."""
         if not args:
             raise Exception('Missing source object path.')
-        bucket, key = parse_s3uri(args.pop(0))
+        sources = [parse_s3uri(args.pop(0))]
+        while args and is_s3uri(args[0]):
+            sources.append(parse_s3uri(args.pop(0)))
+        if_changed = options.get('if-changed', False)
+        if if_changed and (options.get('part-size') or options.get('parallel') 
+                           or options.get('verify', False) or options.get('resume', False)):
+            raise Exception('The --if-changed option cannot be combined with --part-size, --parallel, --verify or --resume.')
+        if len(sources) > 1 or options.get('recursive', False):
+            self.__get_many(sources, args and args.pop(0) or '.', options)
+            return
+        bucket, key = sources[0]
         if not key:
             raise Exception('Missing key.')
         name = key.split('/')[-1]
@@ -435,49 +2249,805 @@ class S3Commander(object):
         isdir = Directory.Exists(fpath)
         if not fpath or isdir:
             fpath =  (isdir and fpath + '\\' or '') + name
+        if if_changed:
+            print 'Downloading %s to %s...' % (key, Path.GetFileName(fpath)),
+            fpath = Path.GetFullPath(fpath)
+            index = FetchIndex(Path.GetDirectoryName(fpath))
+            changed = self.__get_if_changed(bucket, key, fpath, Path.GetFileName(fpath), index)
+            index.save()
+            print changed and 'OK' or 'OK (unchanged)'
+            return
         preamble = 'Downloading %s to %s...' % (key, Path.GetFileName(fpath))
         print preamble,        
-        iswin = is_windows()
-        def on_progress(sender, args):
-            if iswin:
-                print '\r%s %s (%d%%)' % (preamble, args.BytesTransferred.ToString('N0'), args.ProgressPercentage),
+        on_progress = ProgressPrinter(preamble, self.progress)
+        part_size = parse_size_arg(options.get('part-size'))
+        parallel = int(options.get('parallel', 0))
+        verify = options.get('verify', False)
+        verified = False
+        if options.get('resume', False):
+            if verify:
+                raise Exception('The --verify and --resume options cannot be combined.')
+            self.__get_resumable(bucket, key, fpath, 
+                part_size or DEFAULT_PART_SIZE, parallel or 1, on_progress)
+            print 'OK'
+            return
         try:
             self.s3.GetObjectProgress += on_progress
-            self.s3.GetObject(bucket, key, fpath)
+            if verify:
+                # segments arrive out of order so their MD5 cannot be taken on the fly
+                verified = self.scheduler.call(self.s3.GetObject, bucket, key, fpath, True)
+            elif part_size or parallel:
+                self.scheduler.offer(parallel or DEFAULT_PARALLELISM)
+                self.s3.GetObjectSegmented(bucket, key, fpath,
+                    part_size or DEFAULT_PART_SIZE, parallel or DEFAULT_PARALLELISM)
+            else:
+                self.scheduler.call(self.s3.GetObject, bucket, key, fpath)
         finally:
             self.s3.GetObjectProgress -= on_progress
-        print 'OK'
+        if verified:
+            print 'OK (verified)'
+        elif verify:
+            print 'OK (not verified: the object was uploaded in parts)'
+        else:
+            print 'OK'
+
+    get.opt_specs = ('part-size', 'parallel', 'verify', 'resume', 'if-changed', 'recursive', 'workers')
+    get.opt_flags = ('verify', 'resume', 'if-changed', 'recursive')
+
+    def __get_if_changed(self, bucket, key, fpath, rpath, index):
+        """Downloads an object unless the local file is still the copy last 
+        downloaded and the object has not changed since, which costs a single
+        conditional request. Tells whether the object was downloaded."""
+        entry = index.lookup(rpath, bucket, key)
+        def receive():
+            request = GetObjectRequest(self.s3, bucket, key)
+            if entry:
+                request.IfNoneMatch = '"%s"' % entry[0]
+                request.IfModifiedSince = entry[1]
+            try:
+                response = request.GetResponse()
+            except WebException, e:
+                if e.Response is not None and Convert.ToInt32(e.Response.StatusCode) == 304:
+                    e.Response.Close()
+                    return False
+                raise
+            try:
+                write_in_place(fpath, lambda output: 
+                    copy_stream(response.GetResponseStream(), output, response.ContentLength))
+                index.update(fpath, rpath, bucket, key, response.ETag, response.LastModified)
+            finally:
+                response.Close()
+            return True
+        return self.scheduler.call(receive)
+
+    def __get_many(self, sources, root, options):
+        root = Path.GetFullPath(root)
+        Directory.CreateDirectory(root)
+        index = options.get('if-changed', False) and FetchIndex(root) or None
+        workers = int(options.get('workers', DEFAULT_PARALLELISM))
+        recursive = options.get('recursive', False)
+        counts = { 'received': 0, 'same': 0 }
+        lock = Object()
+        def items():
+            for bucket, key in sources:
+                if not recursive:
+                    if not key:
+                        raise Exception('Missing key.')
+                    yield bucket, key, key.split('/')[-1], None
+                    continue
+                for obj in list_range(self.s3, bucket, key, None, None, None, None, self.scheduler):
+                    if obj.Key[-1:] != '/': # skip folder placeholders
+                        yield bucket, obj.Key, obj.Key[len(key):].lstrip('/'), obj
+        def fetch(item):
+            bucket, key, rpath, obj = item
+            fpath = local_target(root, rpath)
+            Directory.CreateDirectory(Path.GetDirectoryName(fpath))
+            if index and obj:
+                # the listing already has the ETag, so no request is needed to tell
+                entry = index.lookup(rpath, bucket, key)
+                changed = not entry or entry[0] != obj.ETag.strip('"')
+                if changed:
+                    changed = self.__get_if_changed(bucket, key, fpath, rpath, index)
+            elif index:
+                changed = self.__get_if_changed(bucket, key, fpath, rpath, index)
+            else:
+                self.scheduler.call(self.s3.GetObject, bucket, key, fpath)
+                changed = True
+            Monitor.Enter(lock)
+            try:
+                counts[changed and 'received' or 'same'] += 1
+                print 'Downloading %s...%s' % (key, changed and 'OK' or 'OK (unchanged)')
+            finally:
+                Monitor.Exit(lock)
+        self.scheduler.offer(workers)
+        try:
+            run_parallel(items(), fetch, workers)
+        finally:
+            if index:
+                index.save()
+        print '%d downloaded, %d unchanged.' % (counts['received'], counts['same'])
+
+    def __get_resumable(self, bucket, key, fpath, part_size, parallel, on_progress):
+        def head():
+            response = GetObjectRequest(self.s3, bucket, key, True).GetResponse()
+            try:
+                return response.ContentLength, response.ETag, response.LastModified
+            finally:
+                response.Close()
+        length, etag, modified = self.scheduler.call(head)
+        count = max(1, (length + part_size - 1) // part_size)
+        # a new ETag or modification time means the object changed and the 
+        # segments already fetched belong to something else
+        journal = TransferJournal(fpath + '.s3get', 
+            ('get', bucket, key, etag, modified.ToUniversalTime().Ticks, length, part_size))
+        if not journal.entries or not File.Exists(fpath) or FileInfo(fpath).Length != length:
+            journal.start()
+            stream = File.Create(fpath)
+            try:
+                stream.SetLength(length)
+            finally:
+                stream.Close()
+        def segment_bytes(segment):
+            return min(part_size, length - segment * part_size)
+        missing = [segment for segment in range(count) 
+                   if segment_bytes(segment) > 0 and str(segment) not in journal.entries]
+        state = { 'done': length - sum([segment_bytes(segment) for segment in missing]) }
+        on_progress(self, PartProgress(state['done'], length))
+        def fetch(segment):
+            offset = segment * part_size
+            bytes = segment_bytes(segment)
+            def receive():
+                request = GetObjectRequest(self.s3, bucket, key)
+                request.IfMatch = etag # fail rather than mix two versions of the object
+                request.AddRange(Int64(offset), Int64(offset + bytes - 1))
+                response = request.GetResponse()
+                try:
+                    output = FileStream(fpath, FileMode.Open, FileAccess.Write, FileShare.ReadWrite)
+                    try:
+                        output.Seek(offset, SeekOrigin.Begin)
+                        copy_stream(response.GetResponseStream(), output, bytes)
+                    finally:
+                        output.Close()
+                finally:
+                    response.Close()
+            self.scheduler.call(receive)
+            journal.record(segment)
+            Monitor.Enter(journal.lock)
+            try:
+                state['done'] += bytes
+                on_progress(self, PartProgress(state['done'], length))
+            finally:
+                Monitor.Exit(journal.lock)
+        self.scheduler.offer(parallel)
+        run_parallel(missing, fetch, parallel)
+        journal.delete()
 
     def gets(self, args):
         """Sends an object from a bucket to standard output."""
-        print self.__gets(args)[-1]
+        self.__gets(args)
 
     def pops(self, args):
         """Removes and sends an object from a bucket to standard output."""
-        bucket, key, txt = self.__gets(args)
-        print txt
-        self.rm([Uri(Uri('s3://' + bucket), key).ToString()])
+        bucket, key = self.__gets(args)
+        self.rm([Uri(Uri('s3://' + bucket), key).ToString()], {})
 
-    def rm(self, args):
-        """Removes an from a bucket."""
+    def rm(self, args, options):
+        """Removes an object, or all objects under a prefix, from a bucket."""
         if not args:
             raise Exception('Missing object path.')
         bucket, key = parse_s3uri(args.pop(0))
+        if options.get('recursive', False):
+            if not key and not options.get('force', False):
+                raise Exception('This would remove every object in the bucket; add --force to do so.')
+            self.__rm_tree(bucket, as_dir_prefix(key or ''), options)
+            return
         if not key:
             raise Exception('Missing key.')
-        self.s3.DeleteObject(bucket, key)
+        self.scheduler.call(self.s3.DeleteObject, bucket, key)
+        self.__changed(bucket, key)
 
-    def authurl(self, args, options):
-        """Creates a pre-authorized URI valid for performing a GET."""
+    rm.opt_specs = ('recursive', 'force', 'workers', 'single', 'dry-run')
+    rm.opt_flags = ('recursive', 'force', 'single', 'dry-run')
+
+    def __rm_tree(self, bucket, prefix, options):
+        objs = list_range(self.s3, bucket, prefix, None, None, None, None, self.scheduler)
+        self.__rm_objects(bucket, objs, options)
+
+    def __rm_objects(self, bucket, objs, options):
+        if options.get('dry-run', False):
+            count = size = 0
+            for obj in objs:
+                count += 1
+                size += obj.Size
+            print 'Would remove %d object(s) (%s bytes).' % (count, Int64(size).ToString('N0'))
+            return
+        workers = int(options.get('workers', DEFAULT_PARALLELISM))
+        state = { 'multi': not options.get('single', False), 'removed': 0, 'failed': 0 }
+        lock = Object()
+        def remove(keys):
+            failed = None
+            if state['multi']:
+                try:
+                    errors = self.scheduler.call(self.s3.DeleteObjects, bucket, keys)
+                    failed = [(error.Key, error.Message) for error in errors]
+                except S3Exception, e:
+                    if e.ErrorCode not in (S3ErrorCode.NotImplemented, S3ErrorCode.MethodNotAllowed):
+                        raise
+                    state['multi'] = False # server cannot delete many at once
+            if failed is None:
+                failed = []
+                for key in keys:
+                    self.scheduler.call(self.s3.DeleteObject, bucket, key)
+            Monitor.Enter(lock)
+            try:
+                state['removed'] += len(keys) - len(failed)
+                state['failed'] += len(failed)
+                for key, message in failed:
+                    print >> sys.stderr, 'Failed to remove %s: %s' % (key, message)
+            finally:
+                Monitor.Exit(lock)
+        batch_size = state['multi'] and S3Service.MaximumDeleteCount or 1
+        self.scheduler.offer(workers)
+        try:
+            run_parallel(batches((obj.Key for obj in objs), batch_size), remove, workers)
+        finally:
+            self.__changed(bucket)
+        print '%d object(s) removed.' % state['removed']
+        if state['failed']:
+            raise Exception('%d object(s) could not be removed.' % state['failed'])
+
+    def find(self, args, options):
+        """Finds objects by name, path pattern, size and age, and prints, downloads or removes them."""
+        if not args:
+            raise Exception('Missing S3 path.')
+        bucket, prefix = parse_s3uri(args.pop(0))
+        path, regex, name = options.get('path'), options.get('regex'), options.get('name')
+        if path and regex:
+            raise Exception('The --path and --regex options cannot be combined.')
+        if options.get('get') and options.get('rm', False):
+            raise Exception('The --get and --rm options cannot be combined.')
+        delimiter = self.s3.DefaultDelimiter or '/'
+        if path:
+            objs = find_glob(self.s3, bucket, prefix, path, delimiter, self.cache, self.scheduler)
+        else:
+            literal = regex and regex_literal_prefix(regex) or ''
+            objs = list_range(self.s3, bucket, prefix + literal, None, None, None, self.cache, self.scheduler)
+        objs = filter_objects(objs, prefix, delimiter, options)
+        workers = int(options.get('workers', DEFAULT_PARALLELISM))
+        if options.get('rm', False):
+            self.__rm_objects(bucket, objs, options)
+        elif options.get('get'):
+            self.__get_objects(bucket, prefix, objs, options['get'], workers, options.get('dry-run', False))
+        else:
+            count = 0
+            for obj in objs:
+                print 's3://%s/%s' % (bucket, obj.Key)
+                count += 1
+            print >> sys.stderr, '%d object(s) found.' % count
+
+    find.opt_specs = ('name', 'path', 'regex', 'min-size', 'max-size', 'newer-than', 'older-than',
+                      'get', 'rm', 'workers', 'single', 'dry-run')
+    find.opt_flags = ('rm', 'single', 'dry-run')
+
+    def __get_objects(self, bucket, prefix, objs, root, workers, dry_run):
+        root = Path.GetFullPath(root)
+        counts = { 'done': 0 }
+        lock = Object()
+        def fetch(obj):
+            fpath = local_target(root, obj.Key[len(prefix):].lstrip('/'))
+            if not dry_run:
+                Directory.CreateDirectory(Path.GetDirectoryName(fpath))
+                self.scheduler.call(self.s3.GetObject, bucket, obj.Key, fpath)
+            Monitor.Enter(lock)
+            try:
+                counts['done'] += 1
+                print dry_run and 'Would download %s' % obj.Key or 'Downloading %s...OK' % obj.Key
+            finally:
+                Monitor.Exit(lock)
+        self.scheduler.offer(workers)
+        run_parallel((obj for obj in objs if obj.Key[-1:] != '/'), fetch, workers)
+        print '%d object(s) %s.' % (counts['done'], dry_run and 'would be downloaded' or 'downloaded')
+
+    def du(self, args, options):
+        """Sums up the size and number of objects under a prefix, rolled up by the prefixes at a given depth."""
+        if not args:
+            raise Exception('Missing S3 path.')
+        bucket, prefix = parse_s3uri(args.pop(0))
+        depth = int(options.get('depth', 1))
+        workers = int(options.get('workers', DEFAULT_PARALLELISM))
+        order = options.get('sort', 'name')
+        if order not in ('name', 'size', 'count'):
+            raise Exception('Invalid sort order: %s' % order)
+        delimiter = self.s3.DefaultDelimiter or '/'
+        self.scheduler.offer(workers)
+        objs = list_parallel(self.s3, bucket, prefix, None, workers, self.cache, self.scheduler)
+        rollups = du_rollups(objs, prefix, delimiter, depth)
+        items = rollups.items()
+        if order == 'name':
+            items.sort()
+        else:
+            index = order == 'size' and 1 or 0
+            items.sort(lambda a, b: cmp(b[1][index], a[1][index]) or cmp(a[0], b[0]))
+        count = size = 0
+        for name, (n, bytes) in items:
+            count += n
+            size += bytes
+            if depth:
+                print '%20s  %12s  %s' % (Int64(bytes).ToString('N0'), Int64(n).ToString('N0'), name or prefix or '/')
+        print '%20s  %12s  %s' % (Int64(size).ToString('N0'), Int64(count).ToString('N0'), 'total')
+
+    du.opt_specs = ('depth', 'workers', 'sort')
+
+    def exists(self, args, options):
+        """Checks that objects exist in a bucket, failing if any does not."""
+        if options.get('from-file') or len(args) > 1:
+            def report(bucket, key, info):
+                if info is None:
+                    print 's3://%s/%s' % (bucket, key)
+            self.__stat_many(args, options, report)
+            return
         if not args:
             raise Exception('Missing object path.')
         bucket, key = parse_s3uri(args.pop(0))
         if not key:
             raise Exception('Missing key.')
+        if self.cache:
+            entries, marker = list_page(self.s3, bucket, key, None, None, 1, self.cache, self.scheduler)
+            found = entries and entry_name(entries[0]) == key
+        else:
+            found = self.scheduler.call(self.s3.ObjectExists, bucket, key)
+        if not found:
+            raise Exception('Object not found: %s' % key)
+
+    exists.opt_specs = ('from-file', 'window')
+
+    def stat(self, args, options):
+        """Reports the size, ETag, content type and modification time of many objects, or that they are missing."""
+        format = options.get('format', 'tsv')
+        if format not in ('tsv', 'ndjson'):
+            raise Exception('Invalid format: %s' % format)
+        epoch = options.get('time', 'iso') == 'epoch'
+        if format == 'tsv':
+            sys.stdout.write('path\tstatus\tsize\tetag\tcontent_type\tlast_modified\n')
+        def report(bucket, key, info):
+            path = 's3://%s/%s' % (bucket, key)
+            if format == 'ndjson':
+                if info is None:
+                    row = '{"path": %s, "status": "missing"}\n' % to_json(path)
+                else:
+                    size, etag, content_type, modified = info
+                    modified = format_time(modified, epoch)
+                    row = '{"path": %s, "status": "found", "size": %d, "etag": "%s", "content_type": %s, "last_modified": %s}\n' % (
+                        to_json(path), size, etag, to_json(content_type or ''), epoch and modified or '"%s"' % modified)
+            elif info is None:
+                row = '%s\tmissing\t\t\t\t\n' % tsv_escape(path)
+            else:
+                size, etag, content_type, modified = info
+                row = '%s\tfound\t%d\t%s\t%s\t%s\n' % (tsv_escape(path), size, etag, 
+                    tsv_escape(content_type or ''), format_time(modified, epoch))
+            sys.stdout.write(row)
+        self.__stat_many(args, options, report)
+
+    stat.opt_specs = ('from-file', 'window', 'format', 'time')
+
+    def __stat_many(self, args, options, report):
+        bucket, key = args and parse_s3uri(args.pop(0)) or (None, '')
+        from_file = options.get('from-file')
+        input = None
+        if from_file:
+            input = from_file == '-' and sys.stdin or open(from_file)
+            keys = read_key_lines(input, bucket, key)
+        else:
+            if not bucket:
+                raise Exception('Missing object path.')
+            keys = [(bucket, key)] + [parse_s3uri(arg) for arg in args]
+            for bucket, key in keys:
+                if not key:
+                    raise Exception('Missing key.')
+        counts = { 'found': 0, 'missing': 0 }
+        lock = Object()
+        def on_result(bucket, key, info):
+            Monitor.Enter(lock) # results come in on any thread
+            try:
+                counts[info is None and 'missing' or 'found'] += 1
+                report(bucket, key, info)
+            finally:
+                Monitor.Exit(lock)
+        stopwatch = Stopwatch.StartNew()
+        try:
+            self.__head_many(keys, int(options.get('window', DEFAULT_STAT_WINDOW)), on_result)
+        finally:
+            if input and input is not sys.stdin:
+                input.close()
+            sys.stdout.flush()
+        seconds = stopwatch.Elapsed.TotalSeconds
+        total = counts['found'] + counts['missing']
+        print >> sys.stderr, '%s found, %s missing in %.2f second(s) (%s per second).' % (
+            Int64(counts['found']).ToString('N0'), Int64(counts['missing']).ToString('N0'), 
+            seconds, Int64(seconds and total / seconds or 0).ToString('N0'))
+        if counts['missing']:
+            raise Exception('%s object(s) not found.' % Int64(counts['missing']).ToString('N0'))
+
+    def __head_many(self, keys, window, on_result):
+        """Sends a HEAD request for each bucket and key pair without tying up
+        a thread per request: up to window keys are worked on at once, each
+        request taking a slot from the scheduler before it begins, and the 
+        completion of each lets the next one begin. Calls on_result with the
+        bucket, key and a (size, ETag, content type, last modified) tuple, 
+        or None if the object does not exist, as each request completes and 
+        on whatever thread it completes. Transient failures are tried again 
+        once a timer says so; any other error stops the requests and is 
+        raised once they are done."""
+        self.scheduler.offer(window)
+        lock = Object()
+        state = { 'pending': 0 } # keys taken and not done, retries included
+        ready = [] # keys due to be tried again
+        timers = []
+        errors = []
+        def finish(error = None):
+            Monitor.Enter(lock)
+            try:
+                if error is not None:
+                    errors.append(error)
+                state['pending'] -= 1
+                Monitor.PulseAll(lock)
+            finally:
+                Monitor.Exit(lock)
+        def retry(item, delay):
+            # a timer rather than a sleep so the I/O thread goes on completing others
+            def due(ignored):
+                Monitor.Enter(lock)
+                try:
+                    timers.remove(timer)
+                    ready.append(item)
+                    Monitor.PulseAll(lock)
+                finally:
+                    Monitor.Exit(lock)
+            Monitor.Enter(lock)
+            try:
+                timer = Timer(TimerCallback(due), None, Timeout.Infinite, Timeout.Infinite)
+                timers.append(timer) # or it could be collected before it fires
+                timer.Change(delay, Timeout.Infinite)
+            finally:
+                Monitor.Exit(lock)
+        def begin(bucket, key, attempt):
+            request = GetObjectRequest(self.s3, bucket, key, True)
+            # a service point made before now keeps the limit it was made with
+            point = request.ServicePoint
+            if point.ConnectionLimit < window:
+                point.ConnectionLimit = window
+            def completed(result):
+                try:
+                    try:
+                        response = request.EndGetResponse(result)
+                    except Exception, e:
+                        if is_not_found(e):
+                            self.scheduler.release()
+                            on_result(bucket, key, None)
+                            finish()
+                            return
+                        kind = self.scheduler.release(e)
+                        if not kind or attempt >= self.scheduler.attempts or errors:
+                            raise
+                        delay = kind != 'redirected' and self.scheduler.backoff(attempt) or 0
+                        retry((bucket, key, attempt + 1), delay)
+                        return
+                    self.scheduler.release()
+                    try:
+                        info = (response.ContentLength, (response.ETag or '').strip('"'), 
+                                response.ContentType, response.LastModified)
+                    finally:
+                        response.Close()
+                    on_result(bucket, key, info)
+                except Exception, e:
+                    finish(e)
+                    return
+                finish()
+            request.BeginGetResponse(AsyncCallback(inherit_output(completed)), None)
+        keys = iter(keys)
+        try:
+            while True:
+                Monitor.Enter(lock)
+                try:
+                    # once the keys run out, wait for the last ones to be done or retried
+                    while not errors and not ready and state['pending'] >= (keys is None and 1 or window):
+                        Monitor.Wait(lock)
+                    if errors or not ready and keys is None:
+                        break
+                    item = ready and ready.pop(0) or None
+                finally:
+                    Monitor.Exit(lock)
+                if item is None:
+                    try:
+                        bucket, key = keys.next()
+                    except StopIteration:
+                        keys = None
+                        continue
+                    item = bucket, key, 1
+                    Monitor.Enter(lock)
+                    try:
+                        state['pending'] += 1
+                    finally:
+                        Monitor.Exit(lock)
+                self.scheduler.acquire()
+                try:
+                    begin(*item)
+                except Exception, e:
+                    self.scheduler.release(e)
+                    finish(e)
+        finally:
+            Monitor.Enter(lock)
+            try:
+                while state['pending']:
+                    # retries not begun yet are dropped once something failed
+                    state['pending'] -= len(ready)
+                    del ready[:]
+                    if state['pending']:
+                        Monitor.Wait(lock)
+            finally:
+                Monitor.Exit(lock)
+        if errors:
+            raise errors[0]
+
+    def authurl(self, args, options):
+        """Creates pre-authorized URIs valid for performing a GET."""
+        bucket, key = args and parse_s3uri(args.pop(0)) or (None, '')
         expires = DateTime.Parse(options.get('expires', DateTime.Now.AddHours(1).ToString()))
-        print self.s3.GetAuthorizedUrl(bucket, key, expires)
+        from_file = options.get('from-file')
+        if not from_file and not options.get('recursive', False):
+            if not bucket:
+                raise Exception('Missing object path.')
+            if not key:
+                raise Exception('Missing key.')
+            print UrlSigner(self.s3, bucket, expires).GetAuthorizedUrl(key)
+            return
+        input = None
+        if from_file:
+            input = from_file == '-' and sys.stdin or open(from_file)
+            keys = read_key_lines(input, bucket, key)
+        else:
+            if not bucket:
+                raise Exception('Missing bucket to list.')
+            keys = ((bucket, obj.Key) for obj in 
+                list_range(self.s3, bucket, key, None, None, None, self.cache, self.scheduler))
+        stopwatch = Stopwatch.StartNew()
+        try:
+            count = sign_urls(self.s3, keys, expires, sys.stdout, int(options.get('workers', 1)))
+        finally:
+            if input and input is not sys.stdin:
+                input.close()
+        seconds = stopwatch.Elapsed.TotalSeconds
+        print >> sys.stderr, 'Signed %s URL(s) in %.2f second(s) (%s per second).' % (
+            Int64(count).ToString('N0'), seconds, Int64(seconds and count / seconds or 0).ToString('N0'))
+
+    authurl.opt_specs = ('expires', 'from-file', 'recursive', 'workers')
+    authurl.opt_flags = ('recursive', )
+
+    def cp(self, args, options):
+        """Copies an object, or all objects under a prefix, within S3 without downloading them."""
+        self.__copy(args, options, False)
+
+    cp.opt_specs = ('recursive', 'acl', 'workers')
+    cp.opt_flags = ('recursive', )
+
+    def mv(self, args, options):
+        """Moves an object, or all objects under a prefix, within S3 without downloading them."""
+        self.__copy(args, options, True)
+
+    mv.opt_specs = cp.opt_specs
+    mv.opt_flags = cp.opt_flags
+
+    def __copy(self, args, options, move):
+        if len(args) < 2 or not is_s3uri(args[0]) or not is_s3uri(args[1]):
+            raise Exception('Missing source and target S3 paths.')
+        src_bucket, src_key = parse_s3uri(args.pop(0))
+        dst_bucket, dst_key = parse_s3uri(args.pop(0))
+        acl = parse_canned_acl_arg(options.get('acl'))
+        verb = move and 'Moving' or 'Copying'
+        if not options.get('recursive', False):
+            if not src_key:
+                raise Exception('Missing source key.')
+            if not dst_key or dst_key[-1] == '/':
+                dst_key = (dst_key or '') + src_key.split('/')[-1]
+            if move and (src_bucket, src_key) == (dst_bucket, dst_key):
+                raise Exception('Cannot move an object onto itself.')
+            print '%s %s to %s...' % (verb, src_key, dst_key),
+            self.scheduler.call(self.s3.CopyObject, src_bucket, src_key, dst_bucket, dst_key, acl)
+            self.__changed(dst_bucket, dst_key)
+            if move:
+                self.scheduler.call(self.s3.DeleteObject, src_bucket, src_key)
+                self.__changed(src_bucket, src_key)
+            print 'OK'
+            return
+        src_prefix, dst_prefix = as_dir_prefix(src_key), as_dir_prefix(dst_key)
+        if src_bucket == dst_bucket and dst_prefix.startswith(src_prefix):
+            # the listing would pick up the copies as they are made
+            raise Exception('Cannot copy a prefix to itself or under itself.')
+        workers = int(options.get('workers', DEFAULT_PARALLELISM))
+        counts = { 'done': 0 }
+        lock = Object()
+        def copy(src_key):
+            dst_key = dst_prefix + src_key[len(src_prefix):]
+            self.scheduler.call(self.s3.CopyObject, src_bucket, src_key, dst_bucket, dst_key, acl)
+            if move: # only once the copy is known to be good
+                self.scheduler.call(self.s3.DeleteObject, src_bucket, src_key)
+            Monitor.Enter(lock)
+            try:
+                counts['done'] += 1
+                print '%s %s to %s...OK' % (verb, src_key, dst_key)
+            finally:
+                Monitor.Exit(lock)
+        objs = list_range(self.s3, src_bucket, src_prefix, None, None, None, None, self.scheduler)
+        self.scheduler.offer(workers)
+        try:
+            run_parallel((obj.Key for obj in objs), copy, workers)
+        finally:
+            self.__changed(dst_bucket)
+            if move:
+                self.__changed(src_bucket)
+        print '%d object(s) %s.' % (counts['done'], move and 'moved' or 'copied')
+
+    def sync(self, args, options):
+        """Synchronizes a local directory and a prefix in a bucket, in either direction, transferring only what changed."""
+        if len(args) < 2:
+            raise Exception('Missing source and target to sync.')
+        source, target = args[:2]
+        if is_s3uri(target) and not is_s3uri(source):
+            self.__sync_up(source, target, options)
+        elif is_s3uri(source) and not is_s3uri(target):
+            self.__sync_down(source, target, options)
+        else:
+            raise Exception('Sync needs one local directory and one S3 path.')
+
+    sync.opt_specs = ('acl', 'delete', 'dry-run')
+    sync.opt_flags = ('delete', 'dry-run')
+
+    def __sync_up(self, root, uri, options):
+        if not Directory.Exists(root):
+            raise Exception('Directory not found: %s' % root)
+        bucket, prefix = parse_s3uri(uri)
+        prefix = as_dir_prefix(prefix)
+        acl = parse_canned_acl_arg(options.get('acl'))
+        dry_run = options.get('dry-run', False)
+        remote = {}
+        for obj in list_range(self.s3, bucket, prefix, None, None, None, None, self.scheduler):
+            if type(obj) == ObjectEntry:
+                remote[obj.Key] = obj
+        manifest = SyncManifest(root)
+        sent = same = 0
+        for fpath, rpath in walk_files(root):
+            key = prefix + rpath
+            obj = remote.pop(key, None)
+            if obj and is_same_file(obj, FileInfo(fpath), lambda: manifest.md5(fpath, rpath)):
+                same += 1
+                continue
+            print 'Uploading %s...' % key,
+            if not dry_run:
+                def send():
+                    # the manifest keeps the MD5 sent, so the next run need not hash the file
+                    self.__put_file(fpath, bucket, key, guess_content_type(fpath), acl, manifest.md5(fpath, rpath))
+                self.scheduler.call(send)
+                self.__changed(bucket, key)
+            print 'OK'
+            sent += 1
+        removed = 0
+        if options.get('delete', False):
+            for key in sorted(remote.keys()):
+                print 'Removing %s...' % key,
+                if not dry_run:
+                    self.scheduler.call(self.s3.DeleteObject, bucket, key)
+                    self.__changed(bucket, key)
+                print 'OK'
+                removed += 1
+        manifest.save()
+        print '%d uploaded, %d unchanged, %d removed.' % (sent, same, removed)
+
+    def __put_file(self, fpath, bucket, key, content_type, acl, md5):
+        """Uploads a file with the MD5 it should have as Content-MD5, so that
+        S3 refuses it if it changed after it was hashed."""
+        request = AddObjectRequest(self.s3, bucket, key)
+        request.ContentType = content_type
+        request.CannedAcl = acl
+        request.ContentMD5 = Convert.ToBase64String(hex_bytes(md5))
+        input = File.OpenRead(fpath)
+        try:
+            request.ContentLength = input.Length
+            output = request.GetRequestStream()
+            try:
+                copy_stream(input, output, input.Length)
+            finally:
+                output.Close()
+            request.GetResponse().Close()
+        finally:
+            input.Close()
+
+    def __sync_down(self, uri, root, options):
+        bucket, prefix = parse_s3uri(uri)
+        prefix = as_dir_prefix(prefix)
+        dry_run = options.get('dry-run', False)
+        local = {}
+        if Directory.Exists(root):
+            for fpath, rpath in walk_files(root):
+                local[rpath] = fpath
+        root = Path.GetFullPath(root)
+        manifest = SyncManifest(root)
+        received = same = 0
+        for obj in list_range(self.s3, bucket, prefix, None, None, None, None, self.scheduler):
+            if type(obj) != ObjectEntry or obj.Key[-1:] == '/': # skip folder placeholders
+                continue
+            rpath = obj.Key[len(prefix):]
+            fpath = local_target(root, rpath)
+            if local.pop(rpath, None) and is_same_file(obj, FileInfo(fpath), lambda: manifest.md5(fpath, rpath)):
+                same += 1
+                continue
+            print 'Downloading %s...' % obj.Key,
+            if not dry_run:
+                Directory.CreateDirectory(Path.GetDirectoryName(fpath))
+                self.scheduler.call(self.s3.GetObject, bucket, obj.Key, fpath)
+                etag = obj.ETag.strip('"')
+                manifest.update(fpath, rpath, '-' not in etag and etag or None)
+            print 'OK'
+            received += 1
+        removed = 0
+        if options.get('delete', False):
+            for rpath in sorted(local.keys()):
+                print 'Removing %s...' % rpath,
+                if not dry_run:
+                    File.Delete(local[rpath])
+                print 'OK'
+                removed += 1
+        manifest.save()
+        print '%d downloaded, %d unchanged, %d removed.' % (received, same, removed)
+
+    def batch(self, args, options):
+        """Runs commands read one per line from a file or standard input in this one process."""
+        fpath = args and args.pop(0) or '-'
+        workers = int(options.get('workers', 1))
+        input = fpath == '-' and sys.stdin or open(fpath)
+        output = ThreadOutput(sys.stdout)
+        counts = { 'ok': 0, 'failed': 0 }
+        counts_lock = Object()
+        def lines():
+            lineno = 0
+            for line in input:
+                lineno += 1
+                line = line.strip()
+                if line and line[0] != '#':
+                    yield lineno, line
+        def run(item):
+            lineno, line = item
+            output.capture()
+            try:
+                try:
+                    args = split_command_line(line)
+                    if args[0] == 'batch':
+                        raise Exception('Batches cannot be nested.')
+                    self(args[0], args[1:])
+                    status = 'OK'
+                except Exception, e:
+                    status = 'ERROR\t%s' % ' '.join(str(e).split())
+            finally:
+                printed = output.release()
+            Monitor.Enter(counts_lock)
+            try:
+                counts[status == 'OK' and 'ok' or 'failed'] += 1
+            finally:
+                Monitor.Exit(counts_lock)
+            output.write_atomic('%s%d\t%s\t%s\n' % (printed, lineno, line, status))
+        self.progress = False
+        sys.stdout = output
+        try:
+            self.scheduler.offer(workers)
+            run_parallel(lines(), run, workers)
+        finally:
+            sys.stdout = output.stdout
+            if input is not sys.stdin:
+                input.close()
+        print >> sys.stderr, '%d command(s) succeeded, %d failed.' % (counts['ok'], counts['failed'])
+        if counts['failed']:
+            raise Exception('Some commands in the batch failed.')
 
-    authurl.opt_specs = ('expires', )
+    batch.opt_specs = ('workers', )
 
     def __gets(self, args):
         if not args:
@@ -487,17 +3057,20 @@ class S3Commander(object):
             raise Exception('Missing key.')
         content_type = clr.Reference[str]()
         content_length = clr.Reference[Int64]()
-        input = self.s3.GetObjectStream(bucket, key, content_length, content_type)
+        input = self.scheduler.call(self.s3.GetObjectStream, bucket, key, content_length, content_type)
         try:
             content_length, content_type = content_length.Value, content_type.Value
             if 'text/plain' != content_type:
                 raise Exception('Object is %s, not text/plain.' % content_type)
-            output = MemoryStream()
-            copy_stream(input, output, content_length)
+            copy_text_stream(input, sys.stdout, content_length)
         finally:
             input.Close()
-        txt = Encoding.UTF8.GetString(output.GetBuffer(), 0, content_length)
-        return (bucket, key, txt)
+        print
+        return (bucket, key)
+
+    def __changed(self, bucket, key = None):
+        if self.cache:
+            self.cache.invalidate(bucket, key)
         
 def app_lpath(rhs = None, dont_make = False):
     """Creates a path under where local application data is stored."""
@@ -506,16 +3079,170 @@ def app_lpath(rhs = None, dont_make = False):
         Directory.CreateDirectory(path)
     return rhs and Path.Combine(path, rhs) or path
 
+class SyncManifest(object):
+    """Remembers the modification time, size and MD5 of the files under a local 
+    directory so that files unchanged since the last sync are not hashed again."""
+
+    def __init__(self, root):
+        self.fpath = Path.Combine(app_lpath('manifests'), md5_hex(Path.GetFullPath(root).ToLowerInvariant()) + '.txt')
+        self.entries = {}
+        self.dirty = False
+        if File.Exists(self.fpath):
+            for line in File.ReadAllLines(self.fpath):
+                fields = line.split('\t')
+                if len(fields) == 4:
+                    self.entries[fields[0]] = (Int64.Parse(fields[1]), Int64.Parse(fields[2]), fields[3])
+
+    def md5(self, fpath, rpath):
+        """Gets the MD5 of a file, hashing it only if it changed since it was last seen."""
+        info = FileInfo(fpath)
+        entry = self.entries.get(rpath)
+        if entry and entry[2] and entry[:2] == (info.LastWriteTimeUtc.Ticks, info.Length):
+            return entry[2]
+        md5 = md5_file_hex(fpath)
+        self.update(fpath, rpath, md5)
+        return md5
+
+    def update(self, fpath, rpath, md5):
+        """Records the MD5 of a file as it is now, or forgets it if the MD5 is None."""
+        info = FileInfo(fpath)
+        self.entries[rpath] = (info.LastWriteTimeUtc.Ticks, info.Length, md5 or '')
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        Directory.CreateDirectory(Path.GetDirectoryName(self.fpath))
+        lines = ['%s\t%s\t%s\t%s' % (rpath, mtime, size, md5)
+                 for rpath, (mtime, size, md5) in self.entries.items()]
+        File.WriteAllText(self.fpath, Environment.NewLine.join(lines))
+        self.dirty = False
+
+class FetchIndex(object):
+    """Remembers, for the files downloaded into a local directory, which 
+    object each came from, the object's ETag and modification time and 
+    the file's own modification time and size right after the download. 
+    A file that has not been touched since can then be downloaded again 
+    only if the object changed."""
+
+    def __init__(self, root):
+        self.root = Path.GetFullPath(root)
+        self.fpath = Path.Combine(app_lpath('fetched'), md5_hex(self.root.ToLowerInvariant()) + '.txt')
+        self.entries = {}
+        self.dirty = False
+        self.lock = Object()
+        if File.Exists(self.fpath):
+            for line in File.ReadAllLines(self.fpath):
+                fields = line.split('\t')
+                if len(fields) == 6:
+                    self.entries[fields[0]] = (fields[1], fields[2], Int64.Parse(fields[3]), 
+                                               Int64.Parse(fields[4]), Int64.Parse(fields[5]))
+
+    def lookup(self, rpath, bucket, key):
+        """Gets the ETag and modification time (UTC) of the object last 
+        downloaded as a file, or None if the file was not downloaded from
+        that object or has changed since."""
+        entry = self.entries.get(rpath)
+        if not entry or entry[0] != 's3://%s/%s' % (bucket, key):
+            return None
+        fpath = Path.Combine(self.root, rpath.replace('/', str(Path.DirectorySeparatorChar)))
+        if not File.Exists(fpath):
+            return None
+        info = FileInfo(fpath)
+        if (info.LastWriteTimeUtc.Ticks, info.Length) != entry[3:]:
+            return None
+        return entry[1], DateTime(entry[2], DateTimeKind.Utc)
+
+    def update(self, fpath, rpath, bucket, key, etag, modified):
+        info = FileInfo(fpath)
+        Monitor.Enter(self.lock)
+        try:
+            self.entries[rpath] = ('s3://%s/%s' % (bucket, key), etag.strip('"'), 
+                modified.ToUniversalTime().Ticks, info.LastWriteTimeUtc.Ticks, info.Length)
+            self.dirty = True
+        finally:
+            Monitor.Exit(self.lock)
+
+    def save(self):
+        if not self.dirty:
+            return
+        Directory.CreateDirectory(Path.GetDirectoryName(self.fpath))
+        lines = ['\t'.join([rpath] + [str(field) for field in entry]) for rpath, entry in self.entries.items()]
+        File.WriteAllText(self.fpath, Environment.NewLine.join(lines))
+        self.dirty = False
+
+class TransferJournal(object):
+    """Records the parts of a transfer that completed in a file next to the
+    local file so that a rerun can carry on where a failed one stopped. The
+    first line identifies the transfer and every other line is a name/value
+    pair appended as soon as a part is done. A journal left behind by some
+    other transfer is kept as previous so that its leftovers can be cleaned."""
+
+    def __init__(self, fpath, identity):
+        self.fpath = fpath
+        self.identity = '\t'.join([str(x) for x in identity])
+        self.entries = {}
+        self.previous = None
+        self.lock = Object()
+        if File.Exists(fpath):
+            lines = File.ReadAllLines(fpath)
+            entries = {}
+            for line in lines[1:]:
+                fields = line.split('\t', 1)
+                if len(fields) == 2:
+                    entries[fields[0]] = fields[1]
+            if lines and lines[0] == self.identity:
+                self.entries = entries
+            else:
+                self.previous = (lines and lines[0].split('\t') or [], entries)
+
+    def start(self):
+        """Starts the journal afresh, forgetting anything recorded so far."""
+        File.WriteAllText(self.fpath, self.identity + '\n')
+        self.entries = {}
+
+    def record(self, name, value = ''):
+        """Records that a part is done, immediately and safely from any thread."""
+        Monitor.Enter(self.lock)
+        try:
+            File.AppendAllText(self.fpath, '%s\t%s\n' % (name, value))
+            self.entries[str(name)] = value
+        finally:
+            Monitor.Exit(self.lock)
+
+    def delete(self):
+        if File.Exists(self.fpath):
+            File.Delete(self.fpath)
+
+class PartProgress(object):
+    """Progress of a transfer made of parts, shaped like the progress event 
+    arguments of LitS3 so that it can be handed to a ProgressPrinter."""
+
+    def __init__(self, done, total):
+        self.BytesTransferred = Int64(done)
+        self.BytesTotal = Int64(total)
+        self.ProgressPercentage = total and int(done * 100 / total) or 100
+
+def load_data_protection():
+    """Loads the data protection API, which lives in an assembly that only 
+    the commands dealing with saved identifiers need."""
+    clr.AddReference('System.Security')
+    from System.Security.Cryptography import ProtectedData, DataProtectionScope
+    return ProtectedData, DataProtectionScope
+
 def protect_user_str(secret, entropy):
     """Protects a string for the current user."""
+    ProtectedData, DataProtectionScope = load_data_protection()
     return ProtectedData.Protect(Encoding.UTF8.GetBytes(secret), entropy, DataProtectionScope.CurrentUser)
 
 def unprotect_user_str(secret, entropy):
     """Unprotects a string previously protected for the current user."""
+    ProtectedData, DataProtectionScope = load_data_protection()
     return Encoding.UTF8.GetString(ProtectedData.Unprotect(secret, entropy, DataProtectionScope.CurrentUser))
 
 def save_aws_ids(path, id, key):
     """Saves AWS identifiers securely to a file."""
+    from System.Security.Cryptography import RNGCryptoServiceProvider
     entropy = Array.CreateInstance(Byte, 16)
     RNGCryptoServiceProvider().GetBytes(entropy)
     id, key = protect_user_str(id, entropy), protect_user_str(key, entropy)
@@ -527,6 +3254,40 @@ def load_aws_ids(path):
     entropy, id, key = [Convert.FromBase64String(line) for line in lines]
     return unprotect_user_str(id, entropy), unprotect_user_str(key, entropy)
        
+def make_transport_profile(options):
+    """Makes the transport profile from the settings in the configuration 
+    file, if there is one, overridden by those on the command line. What 
+    is set in neither is left as .NET has it."""
+    fpath = options.get('transport-config')
+    if fpath and not File.Exists(fpath):
+        raise Exception('Transport configuration not found: %s' % fpath)
+    fpath = fpath or app_lpath('transport.txt', True)
+    settings = File.Exists(fpath) and load_transport_config(fpath) or {}
+    for name in TRANSPORT_SETTINGS:
+        if name in options:
+            settings[name] = options[name]
+    if options.get('no-keep-alive', False):
+        settings['keep-alive'] = 'no'
+    def seconds(name):
+        return name in settings and float(settings[name]) or None
+    def flag(name):
+        if name not in settings:
+            return None
+        return parse_bool_arg(settings[name])
+    return TransportProfile(
+        'max-connections' in settings and int(settings['max-connections']) or None,
+        flag('keep-alive'), flag('expect-100'), flag('nagle'),
+        seconds('request-timeout'), seconds('read-timeout'), seconds('idle-timeout'))
+
+def set_endpoint(s3, endpoint):
+    """Points the service at an S3-compatible server given by its URL, with
+    buckets addressed in the path rather than the host name."""
+    uri = Uri(endpoint)
+    s3.Host = uri.Host
+    s3.UseSsl = uri.Scheme == 'https'
+    s3.CustomPort = not uri.IsDefaultPort and uri.Port or 0
+    s3.UseSubdomains = False
+
 def print_help(args):
     print """LitS3 Commander - $Revision: 100 $
 Command-line interface to LitS3
@@ -556,8 +3317,8 @@ where:
 
   COMMAND is one of:
     ls (list), put, get, puts, gets, pops, rm (del), 
-    authurl, mkbkt, rmbkt, ids, 
-    about
+    cp, mv, du, find, exists, stat, sync, batch, pack-put, pack-get, 
+    authurl, mkbkt, rmbkt, ids, about
   ARGS
     COMMAND-specific arguments
     
@@ -574,6 +3335,71 @@ place, you can simply resort to the second usage:
  
   %(this)s COMMAND --aws-key-id - --aws-secret-key - ARGS
   
+Listings can be cached on disk between runs with these options:
+
+  --cache                 Answer ls and exists from cached listings
+  --cache-ttl SECONDS     How long a cached listing is used (300)
+  --cache-size PAGES      How many listing pages are kept (1000)
+  --cache-stats           Report cache hits and misses when done
+
+Objects put or removed with --cache in effect are dropped from the 
+cache right away, but changes made by others are only seen once the
+cached listings expire.
+
+Any command can also report on the requests it made:
+
+  --stats                 Print request timings and throughput when done
+  --stats-json            Same, as a single line of JSON
+
+The report goes to standard error and covers the number of requests,
+failures and part retries, bytes transferred per second, the time to 
+sign requests, the time to first byte of requests without a body, 
+response time percentiles and histogram, and connections to the host 
+at peak. The time to resolve and connect to the host is measured once, 
+at the end, with a separate connection.
+
+Requests that fail for reasons that may pass, such as the server being
+too busy, are tried again after a growing, randomized delay. How many 
+requests are in flight at once adapts to the server: it grows while 
+requests succeed and latency holds, and is cut when the server asks to
+slow down. The limits chosen are reported along with --stats, or on 
+their own if any request had to be tried again. These options tune it:
+
+  --max-inflight N        Never have more than N requests in flight (64)
+  --attempts N            Give up on a request after N attempts (5)
+
+To talk to an S3-compatible server other than Amazon's, such as the
+local stand-in s3local, give its URL:
+
+  --endpoint URL          For example, http://localhost:8053/
+
+Otherwise, the region of each bucket named is looked up once and kept
+in endpoints.txt next to the saved identifiers, so that requests go 
+straight to the bucket's region. When S3 redirects a request for a 
+bucket elsewhere, the new host is remembered instead.
+
+  --endpoint-ttl SECONDS  How long a bucket's region is kept (604800)
+  --no-endpoint-cache     Send every request to s3.amazonaws.com
+
+How requests use the network can be tuned too:
+
+  --max-connections N     Open at most N connections per host
+  --no-keep-alive         Close each connection after its request
+  --expect-100            Wait for 100 Continue before sending bodies
+  --nagle                 Let Nagle's algorithm delay small packets
+  --request-timeout SEC   Give up on a request, body and response 
+                          included, that takes longer than SEC
+  --read-timeout SEC      Give up if a read or write stalls for SEC
+  --idle-timeout SEC      Close connections idle for SEC
+
+Whatever is not set is left as .NET has it, except that parallel 
+commands allow as many connections per host as they use. These can
+also be put in a file, one NAME VALUE per line without the leading 
+dashes (keep-alive, expect-100 and nagle take yes or no), given with 
+--transport-config FILE or saved as transport.txt next to the saved 
+identifiers. The command line wins over the file. With --stats, the
+report says how many connections were opened for the requests made.
+  
 The access identifiers can also be securely saved into a file instead
 of environment variables. To do this, use "ids" (without quotes) as
 COMMAND. If the access identifiers can be found in the saved file
@@ -596,6 +3422,20 @@ Examples:
 %(this)s ls s3://foo/images/
   List all objects in bucket foo with the common prefix of images/
  
+%(this)s ls s3://foo/logs/ --parallel 8
+  List all objects in bucket foo with the common prefix of logs/ by
+  splitting the keys into ranges that are listed 8 at a time. The 
+  output is in key order and starts as soon as the first range is in.
+ 
+%(this)s ls s3://foo/logs/ --recursive --format ndjson --time epoch
+  List every object under logs/ in bucket foo, at any depth, as one 
+  JSON object per line with the full key, size, ETag, time of last 
+  modification (seconds since 1970; ISO 8601 in UTC without --time) 
+  and owner. --format csv and --format tsv write the same fields with
+  a header line. Rows are written out every 1000 so that they can be
+  piped into another program as the listing goes. --format only 
+  applies to the objects of a bucket, not to the list of buckets.
+
 %(this)s put s3://foo index.html
   Add local file named index.html as key index.html in bucket foo
  
@@ -610,6 +3450,12 @@ Examples:
   Add local file named script as key script in bucket foo and
   set its content type to plain text
 
+%(this)s put s3://foo/backup.zip backup.zip --parallel 8 --part-size 16M
+  Add local file named backup.zip as key backup.zip in bucket foo
+  using a multipart upload of 16 MB parts, sending 8 parts at a time.
+  Either option alone turns on multipart upload; the defaults are 
+  8 MB parts and 4 at a time. Parts must be at least 5 MB.
+
 %(this)s get s3://foo/index.html
   Get object with key index.html in bucket foo as local file named 
   index.html
@@ -618,12 +3464,131 @@ Examples:
   Get object with key index.html in bucket foo as local file 
   named bar.html
  
+%(this)s get s3://foo/backup.zip --parallel 8
+  Get object with key backup.zip in bucket foo as local file named
+  backup.zip, fetching it as 8 MB ranges (--part-size to change) 
+  downloaded 8 at a time straight into their place in the file
+
+%(this)s get s3://foo/tools/ tools --recursive --if-changed --workers 8
+  Get every object under tools/ in bucket foo into the local directory 
+  tools, 8 at a time, skipping those that have not changed since they 
+  were last downloaded there. The ETag and modification time of what
+  was downloaded are remembered, and so are the time and size of each
+  file, so a file changed locally is downloaded again. Unchanged objects
+  under a prefix cost no request beyond the listing. Given one or more
+  S3 paths without --recursive, each is asked for with a conditional 
+  request that comes back empty when the object is unchanged.
+
+%(this)s put s3://foo/backup.zip backup.zip --verify
+  Add local file named backup.zip as key backup.zip in bucket foo and
+  check that S3 received exactly what was read. The MD5 of the file, 
+  or of each part with --parallel, is sent along so that S3 refuses
+  damaged data before it replaces the object, and is compared with the
+  ETag S3 returns; the command fails if they differ. With --verify, get
+  hashes the object as it arrives the same way, downloading it as one
+  stream even with --parallel or --part-size so that the file is never
+  read a second time, and keeps the file only if it matches. Objects 
+  uploaded in parts cannot be checked by get because their ETag is not
+  an MD5 of the content.
+
+%(this)s put s3://foo/backup.zip backup.zip --resume
+  Add local file named backup.zip as key backup.zip in bucket foo as
+  a multipart upload, recording each part sent in backup.zip.s3put. 
+  If the upload fails, running the same command again sends only the
+  parts that are missing, unless the file has changed in the meantime.
+  With --resume, get works the same way for downloads, fetching ranges
+  of the object and recording them in a .s3get file next to the local
+  file, and starts over if the ETag or modification time of the object
+  changed. The journal is removed once the transfer is complete.
+
 %(this)s rm s3://foo/index.html
   Remove the object with key index.html in the bucket foo
+
+%(this)s rm s3://foo/logs/2008/ --recursive --workers 8
+  Remove all objects under the prefix logs/2008/ in the bucket foo,
+  deleting up to 1000 keys per request, 8 requests at a time, while 
+  the keys are still being listed. Add --single for servers that 
+  cannot delete many objects in one request and --dry-run to only 
+  count what would be removed. The prefix always ends at a slash, so
+  logs/2008 does not take logs/2008-old/ with it. Emptying a whole
+  bucket this way takes --force as well.
+
+%(this)s cp s3://foo/index.html s3://bar/backup/
+  Copy the object with key index.html in bucket foo to the key 
+  backup/index.html in bucket bar. The copy is made by S3 itself so 
+  the content never travels through this machine. Use --acl to set
+  the access control of the copy.
+
+%(this)s mv s3://foo/drafts/ s3://foo/posts/ --recursive --workers 16
+  Move all objects under drafts/ in bucket foo to the same keys under 
+  posts/, 16 at a time. Each source object is removed only once its 
+  copy has been made. Without --recursive, mv moves a single object.
+
+%(this)s du s3://foo/logs/ --depth 2 --workers 8
+  Print the total size and number of objects under each prefix two 
+  levels below logs/ in bucket foo (such as logs/2008/07/), followed 
+  by the grand total. The keys are listed as ranges, 8 at a time, and 
+  only one running total is kept per prefix. Objects not that deep are 
+  counted under the prefix they are in. Use --depth 0 for the total 
+  only and --sort size or --sort count for the largest first.
+
+%(this)s find s3://foo/logs/ --path "2008/*/app-*.log" --min-size 1M
+  Print the S3 path of every object under logs/ in bucket foo whose 
+  key after logs/ matches the pattern and that is 1 MB or larger. A *
+  or ? does not match a slash while ** matches any number of levels.
+  Only the part of the bucket the pattern can match is listed: here
+  logs/2008/, one level down, and then app- under each prefix found. 
+  Other tests, all optional: --name GLOB for the last segment of the 
+  key, --regex RE for the key after the S3 path (the literal text after
+  a leading ^ narrows the listing too), --max-size SIZE, --newer-than
+  and --older-than with an age such as 30m, 12h, 7d or 2w or a date.
+  Add --get DIR to download what is found under DIR, or --rm to remove
+  it, --workers at a time (4); --dry-run shows what would be done.
+
+%(this)s exists s3://foo/index.html --cache
+  Succeed if the object with key index.html exists in the bucket foo 
+  and fail otherwise, answering from the listing cache if it can
+
+%(this)s stat s3://foo/www/ --from-file manifest.txt --window 128
+  For each key listed in manifest.txt, one per line and relative to 
+  www/ in bucket foo unless given as an S3 path, prints the path, 
+  found or missing, and the size, ETag, content type and modification
+  time of the object, as tab-separated columns under a header or with
+  --format ndjson; --time epoch gives times as seconds since 1970. The
+  keys can also be given as S3 paths, or read from standard input with 
+  --from-file -. Up to --window (64) HEAD requests are in flight at 
+  once, without a thread for each, as long as --max-inflight and the 
+  server allow, and results are printed as they come in, so not in 
+  order. Fails if any object is missing.
+
+%(this)s exists s3://foo/www/ --from-file manifest.txt
+  The same, but only the paths of missing objects are printed
  
 dir | %(this)s puts s3://foo/dir.txt
   Puts the output from dir (on Windows; ls on Unix platforms) as a 
   plain text object named dir.txt in bucket foo
+
+tar c site | %(this)s puts s3://foo/site.tar --binary --parallel 4
+  Streams the bytes of standard input, of any length, to the object
+  site.tar in bucket foo as a multipart upload, sending each part of
+  --part-size (8 MB) while the next is read, 4 at a time. Memory use
+  stays at about (parallel + 1) parts. As there can be no more than
+  10,000 parts, give --expected-size SIZE for streams over about 78 GB
+  so parts are sized to fit.
+
+%(this)s pack-put logs s3://foo/logs.pack
+  Packs every file under the local directory logs into the single 
+  object logs.pack in bucket foo, one after another, followed by an 
+  index of their names and sizes in logs.pack.idx. However many files
+  there are, this takes a handful of requests; see puts --binary for 
+  --part-size and --parallel.
+
+%(this)s pack-get s3://foo/logs.pack 2024/01/*.log --to logs
+  Gets the members of the pack logs.pack in bucket foo matching a glob
+  pattern (or all of them if none is given) into the directory logs 
+  (or the current one). Members no more than --gap (64 KB) apart are 
+  read with a single ranged request of up to --max-range (16 MB), 
+  --workers requests at a time (4). Add --list to list the members.
  
 %(this)s gets s3://foo/dir.txt
   Gets the plain text object named dir.txt in bucket foo and writes 
@@ -633,6 +3598,27 @@ dir | %(this)s puts s3://foo/dir.txt
   Gets the plain text object named dir.txt in bucket foo, writes its 
   content to standard output and then removes the object.
 
+%(this)s sync site s3://foo/www/
+  Upload every file under the local directory site that is new or 
+  changed compared to the objects under www/ in bucket foo. Add
+  --delete to also remove objects that no longer exist locally and
+  --dry-run to only show what would be done. The sizes, times and 
+  MD5 hashes of local files are remembered between runs so that 
+  unchanged files are not read again.
+
+%(this)s sync s3://foo/www/ site
+  Download every object under www/ in bucket foo that is new or
+  changed compared to the files under the local directory site
+
+%(this)s batch commands.txt --workers 8
+  Run the commands listed one per line in commands.txt (use - or 
+  leave out the file name to read standard input), 8 at a time, in 
+  this one process so that start-up and authorization are paid once.
+  Each command line is written as in this usage but without the 
+  leading %(this)s. What a command prints is followed by a status 
+  line of the form: line number, TAB, command, TAB, OK or ERROR (and 
+  another TAB and the error message).
+
 %(this)s authurl s3://foo/bar
   Get a pre-authenticated URL for object with key bar in the 
   bucket foo that expires in an hour
@@ -641,6 +3627,13 @@ dir | %(this)s puts s3://foo/dir.txt
   Get a pre-authenticated URL for object with key bar in the 
   bucket foo that expires on January 1st, 2010
 
+%(this)s authurl s3://foo/videos/ --from-file keys.txt --workers 4
+  Get a pre-authenticated URL, one per line and in the same order, 
+  for every key read from keys.txt (a dash reads standard input). 
+  Each line is a key under videos/ in bucket foo or a full S3 path. 
+  Keys are signed in batches of 1000 on 4 threads. Use --recursive 
+  instead of --from-file to sign every key listed under the prefix.
+
 %(this)s mkbkt foo
   Creates a new bucket called foo in U.S.
 
@@ -649,6 +3642,10 @@ dir | %(this)s puts s3://foo/dir.txt
 
 %(this)s rmbkt foo
   Delete the bucket called foo if it is empty
+
+%(this)s rmbkt foo --force
+  Remove all objects in the bucket called foo, as rm --recursive 
+  does, and then delete the bucket
 """ % { 'this': Path.GetFileNameWithoutExtension(sys.argv[0]) }
         
 def main(args):
@@ -661,20 +3658,30 @@ def main(args):
         print_help(args)
         return
 
-    ids_fpath = GetEnvironmentVariable('AWS_IDS_FILE') or app_lpath('aws-ids')
-    saved_id, saved_key = File.Exists(ids_fpath) and load_aws_ids(ids_fpath) or (None, None)
-
-    options, args = lax_parse_options(args, ('aws-key-id', 'aws-secret-key'))
+    options, args = lax_parse_options(args, 
+        ('aws-key-id', 'aws-secret-key', 'cache', 'cache-ttl', 'cache-size', 'cache-stats', 'stats', 'stats-json',
+         'max-inflight', 'attempts', 'endpoint', 'transport-config', 'max-connections', 'no-keep-alive', 
+         'expect-100', 'nagle', 'request-timeout', 'read-timeout', 'idle-timeout', 'endpoint-ttl', 
+         'no-endpoint-cache'), 
+        ('cache', 'cache-stats', 'stats', 'stats-json', 'no-keep-alive', 'expect-100', 'nagle', 
+         'no-endpoint-cache'))
 
     id = options.get('aws-key-id', '-')
     if id == '-':
-        id = GetEnvironmentVariable('AWS_ACCESS_KEY_ID') or saved_id
-    if not id:
-        raise Exception('Missing AWS access key ID.')
+        id = GetEnvironmentVariable('AWS_ACCESS_KEY_ID')
 
     key = options.get('aws-secret-key', '-')
     if key == '-':
-        key = GetEnvironmentVariable('AWS_SECRET_ACCESS_KEY') or saved_key
+        key = GetEnvironmentVariable('AWS_SECRET_ACCESS_KEY')
+
+    # the saved identifiers are only decrypted when they are needed
+    ids_fpath = GetEnvironmentVariable('AWS_IDS_FILE') or app_lpath('aws-ids')
+    if (not id or not key) and File.Exists(ids_fpath):
+        saved_id, saved_key = load_aws_ids(ids_fpath)
+        id, key = id or saved_id, key or saved_key
+
+    if not id:
+        raise Exception('Missing AWS access key ID.')
     if not key:
         raise Exception('Missing AWS secret access key.')
 
@@ -685,8 +3692,34 @@ def main(args):
         print Path.GetFullPath(ids_fpath)
         return
 
+    cache = None
+    if options.get('cache', False):
+        cache = ListingCache(int(options.get('cache-ttl', DEFAULT_CACHE_TTL)), 
+                             int(options.get('cache-size', DEFAULT_CACHE_SIZE)))
+
     s3 = S3Service(AccessKeyID = id, SecretAccessKey = key)
-    S3Commander(s3)(cmd, args)
+    endpoints = None
+    if options.get('endpoint'):
+        set_endpoint(s3, options['endpoint'])
+    elif not options.get('no-endpoint-cache', False):
+        endpoints = BucketEndpoints(s3, int(options.get('endpoint-ttl', DEFAULT_ENDPOINT_TTL)))
+    max_inflight = int(options.get('max-inflight', DEFAULT_MAX_INFLIGHT))
+    scheduler = Scheduler(s3, max_limit = max_inflight, attempts = int(options.get('attempts', DEFAULT_ATTEMPTS)))
+    transport = make_transport_profile(options)
+    stats = (options.get('stats', False) or options.get('stats-json', False)) and TransferStats(s3, scheduler, transport) or None
+    try:
+        S3Commander(s3, cache, scheduler, transport, endpoints)(cmd, args)
+    finally:
+        if endpoints:
+            endpoints.save()
+        if stats:
+            stats.print_report(sys.stderr, options.get('stats-json', False))
+        elif scheduler.throttles or scheduler.retries:
+            print >> sys.stderr, scheduler.describe()
+        if cache:
+            cache.trim()
+            if options.get('cache-stats', False):
+                print >> sys.stderr, 'Listing cache: %d hit(s), %d miss(es).' % (cache.hits, cache.misses)
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,759 @@
+# LitS3.Commander
+# Local S3-compatible stand-in server for testing and benchmarking
+#
+# The MIT License
+#
+# Copyright (c) 2008, Nick Farina
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Serves the part of the S3 REST API that LitS3 uses, from a directory on
+this machine, so that s3cmd can be tested and benchmarked without an AWS
+account. Buckets are addressed in the path (http://localhost:PORT/BUCKET/KEY)
+and requests are not checked for authorization.
+
+Supported are listing buckets, creating and deleting buckets, listing
+objects with prefix, delimiter, marker and pagination, putting objects
+(with Content-MD5 checks), copying objects, ranged and conditional gets,
+heads, deletes, multi-object deletes and multipart uploads. Metadata, ACLs
+and versioning are not kept.
+
+Usage:
+
+  s3local [--root DIR] [--port N] [--latency MS] [--jitter MS]
+          [--error-rate FRACTION] [--error-code CODE] [--seed N]
+          [--page-size N]
+
+--latency and --jitter delay every request by the given number of
+milliseconds plus a random part of the jitter. --error-rate fails that
+fraction of requests, chosen at random, with --error-code (SlowDown by
+default, or InternalError). --page-size caps how many keys a listing
+returns per page so that pagination is exercised with few objects.
+
+Use it with s3cmd like this:
+
+  s3cmd ls s3://foo --endpoint http://localhost:8053/ --aws-key-id X --aws-secret-key Y
+"""
+
+import sys, clr
+
+from System import DateTime, DateTimeKind, Int64, Byte, Array, Random, Guid, Object, \
+    Uri, BitConverter, Convert
+from System.IO import Path, File, Directory, FileStream, FileMode, FileAccess, FileShare, \
+    SeekOrigin, IOException
+from System.Text import Encoding
+from System.Threading import Thread, ThreadStart, Monitor
+from System.Security import SecurityElement
+from System.Security.Cryptography import MD5
+
+clr.AddReference('System.Xml')
+from System.Xml import XmlDocument, XmlConvert, XmlDateTimeSerializationMode
+
+clr.AddReference('System')
+from System.Net import HttpListener, IPAddress
+from System.Net.Sockets import TcpListener
+
+DEFAULT_PORT = 8053
+DEFAULT_PAGE_SIZE = 1000
+OWNER_ID = '75aa57f09aa0c8caeab4f8c24e99d10f8e7faeebf76c078efc7c6caea54ba06a'
+OWNER_NAME = 'local'
+
+ERROR_STATUS = {
+    'AccessDenied': 403,
+    'BadDigest': 400,
+    'BucketAlreadyOwnedByYou': 409,
+    'BucketNotEmpty': 409,
+    'InternalError': 500,
+    'InvalidArgument': 400,
+    'InvalidPart': 400,
+    'InvalidRange': 416,
+    'MalformedXML': 400,
+    'MethodNotAllowed': 405,
+    'NoSuchBucket': 404,
+    'NoSuchKey': 404,
+    'NoSuchUpload': 404,
+    'PreconditionFailed': 412,
+    'SlowDown': 503,
+}
+
+class S3Error(Exception):
+    """An error to be returned to the client as an S3 error response."""
+
+    def __init__(self, code, message, resource = ''):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+        self.resource = resource
+
+def hex_str(bytes):
+    return BitConverter.ToString(bytes).Replace('-', '').lower()
+
+def md5_hex(s):
+    return hex_str(MD5.Create().ComputeHash(Encoding.UTF8.GetBytes(s)))
+
+def xml_escape(s):
+    return SecurityElement.Escape(s)
+
+def iso_time(dt):
+    return XmlConvert.ToString(dt, XmlDateTimeSerializationMode.Utc)
+
+def unescape(s, plus = False):
+    """Decodes a path segment or, with plus, a query string value."""
+    if plus:
+        s = s.replace('+', ' ')
+    return Uri.UnescapeDataString(s)
+
+def parse_query(query):
+    params = {}
+    for pair in query.split('&'):
+        if pair:
+            fields = pair.split('=', 1)
+            params[unescape(fields[0], True)] = len(fields) == 2 and unescape(fields[1], True) or ''
+    return params
+
+def parse_range(header, length):
+    """Parses a single byte range header into an inclusive (first, last)
+    pair of offsets, or returns None if there is no range to honour."""
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    if ',' in spec:
+        return None # multiple ranges; answer with the whole object as S3 does
+    first, last = [x.strip() for x in spec.split('-', 1)]
+    if not first:
+        if not last or int(last) == 0:
+            raise S3Error('InvalidRange', 'The requested range is not satisfiable.')
+        return max(0, length - int(last)), length - 1
+    first = int(first)
+    last = last and min(int(last), length - 1) or length - 1
+    if first >= length or first > last:
+        raise S3Error('InvalidRange', 'The requested range is not satisfiable.')
+    return first, last
+
+def copy_stream(source, dest, length, hash = None):
+    """Copies up to length bytes (all of the source if length is None),
+    feeding them to a hash algorithm if one is given, and returns the count."""
+    buffer = Array.CreateInstance(Byte, 65536)
+    total = 0
+    while length is None or total < length:
+        count = buffer.Length
+        if length is not None:
+            count = int(min(count, length - total))
+        read = source.Read(buffer, 0, count)
+        if read <= 0:
+            break
+        if hash:
+            hash.TransformBlock(buffer, 0, read, buffer, 0)
+        dest.Write(buffer, 0, read)
+        total += read
+    return total
+
+class StoredObject(object):
+    """What is known about an object; its content lives in a data file."""
+
+    def __init__(self, key, data, etag, size, modified, content_type):
+        self.key = key
+        self.data = data
+        self.etag = etag
+        self.size = size
+        self.modified = modified
+        self.content_type = content_type
+
+class Store(object):
+    """Keeps buckets as directories under a root. Every object is a data
+    file with a name of its own plus a small text file, named after a hash
+    of the key, that records the key, the data file and the attributes of
+    the object. A new version of an object gets a new data file so that
+    gets in progress keep reading the old one. The keys of each bucket are
+    also held in memory and sorted when a listing needs them."""
+
+    def __init__(self, root):
+        self.root = Path.GetFullPath(root)
+        self.lock = Object()
+        self.buckets = {} # name -> (creation date, { key: StoredObject }, [sorted keys] or None)
+        self.uploads_root = Path.Combine(self.root, '.uploads')
+        Directory.CreateDirectory(self.uploads_root)
+        for dpath in Directory.GetDirectories(self.root):
+            name = Path.GetFileName(dpath)
+            if name.startswith('.'):
+                continue
+            objects = {}
+            for fpath in Directory.GetFiles(dpath, '*.meta'):
+                obj = self.__read_meta(dpath, fpath)
+                if obj:
+                    objects[obj.key] = obj
+            self.buckets[name] = [Directory.GetCreationTimeUtc(dpath), objects, None]
+
+    def __read_meta(self, dpath, fpath):
+        lines = File.ReadAllLines(fpath)
+        if len(lines) < 6:
+            return None
+        key = Uri.UnescapeDataString(lines[0])
+        data = Path.Combine(dpath, lines[1])
+        if not File.Exists(data):
+            return None
+        return StoredObject(key, data, lines[2], Int64.Parse(lines[3]),
+            DateTime(Int64.Parse(lines[4]), DateTimeKind.Utc), lines[5])
+
+    def __bucket(self, name):
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            raise S3Error('NoSuchBucket', 'The specified bucket does not exist.', name)
+        return bucket
+
+    def bucket_names(self):
+        Monitor.Enter(self.lock)
+        try:
+            names = self.buckets.keys()
+            names.sort()
+            return [(name, self.buckets[name][0]) for name in names]
+        finally:
+            Monitor.Exit(self.lock)
+
+    def create_bucket(self, name):
+        Monitor.Enter(self.lock)
+        try:
+            if name in self.buckets:
+                raise S3Error('BucketAlreadyOwnedByYou', 'Your previous request to create the named bucket succeeded and you already own it.', name)
+            if not name or name.startswith('.'):
+                raise S3Error('InvalidArgument', 'Invalid bucket name.', name)
+            Directory.CreateDirectory(Path.Combine(self.root, name))
+            self.buckets[name] = [DateTime.UtcNow, {}, None]
+        finally:
+            Monitor.Exit(self.lock)
+
+    def delete_bucket(self, name):
+        Monitor.Enter(self.lock)
+        try:
+            if self.__bucket(name)[1]:
+                raise S3Error('BucketNotEmpty', 'The bucket you tried to delete is not empty.', name)
+            Directory.Delete(Path.Combine(self.root, name), True)
+            del self.buckets[name]
+        finally:
+            Monitor.Exit(self.lock)
+
+    def get(self, bucket, key):
+        Monitor.Enter(self.lock)
+        try:
+            obj = self.__bucket(bucket)[1].get(key)
+        finally:
+            Monitor.Exit(self.lock)
+        if obj is None:
+            raise S3Error('NoSuchKey', 'The specified key does not exist.', '/%s/%s' % (bucket, key))
+        return obj
+
+    def new_data_path(self, bucket):
+        """Gets the path of a new data file in a bucket to write content to."""
+        Monitor.Enter(self.lock)
+        try:
+            self.__bucket(bucket)
+        finally:
+            Monitor.Exit(self.lock)
+        return Path.Combine(Path.Combine(self.root, bucket), Guid.NewGuid().ToString('N') + '.dat')
+
+    def put(self, bucket, key, data, etag, size, content_type):
+        """Makes a data file, already written, the content of an object."""
+        obj = StoredObject(key, data, etag, size, DateTime.UtcNow, content_type or 'binary/octet-stream')
+        dpath = Path.Combine(self.root, bucket)
+        Monitor.Enter(self.lock)
+        try:
+            objects = self.__bucket(bucket)[1]
+            old = objects.get(key)
+            File.WriteAllText(Path.Combine(dpath, md5_hex(key) + '.meta'), '\n'.join([
+                Uri.EscapeDataString(key), Path.GetFileName(data), etag, str(size),
+                str(obj.modified.Ticks), obj.content_type]))
+            if old is None:
+                self.buckets[bucket][2] = None
+            objects[key] = obj
+        finally:
+            Monitor.Exit(self.lock)
+        if old is not None:
+            delete_quietly(old.data)
+        return obj
+
+    def delete(self, bucket, key):
+        dpath = Path.Combine(self.root, bucket)
+        Monitor.Enter(self.lock)
+        try:
+            objects = self.__bucket(bucket)[1]
+            obj = objects.pop(key, None)
+            if obj is None:
+                return
+            self.buckets[bucket][2] = None
+            File.Delete(Path.Combine(dpath, md5_hex(key) + '.meta'))
+        finally:
+            Monitor.Exit(self.lock)
+        delete_quietly(obj.data)
+
+    def keys(self, bucket):
+        """Gets the keys of a bucket in order."""
+        Monitor.Enter(self.lock)
+        try:
+            entry = self.__bucket(bucket)
+            if entry[2] is None:
+                keys = entry[1].keys()
+                keys.sort()
+                entry[2] = keys
+            return entry[2], entry[1]
+        finally:
+            Monitor.Exit(self.lock)
+
+    def list(self, bucket, prefix, marker, delimiter, max_keys):
+        """Lists the objects and common prefixes after a marker, as S3 does,
+        and returns them with whether the listing was truncated."""
+        keys, objects = self.keys(bucket)
+        # binary search for the first key after the marker and the prefix
+        start = max(marker or '', prefix or '')
+        lo, hi = 0, len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[mid] < start or (marker and keys[mid] == marker):
+                lo = mid + 1
+            else:
+                hi = mid
+        contents, prefixes = [], []
+        i = lo
+        while i < len(keys):
+            key = keys[i]
+            if prefix and not key.startswith(prefix):
+                break
+            if len(contents) + len(prefixes) >= max_keys:
+                return contents, prefixes, True
+            cut = -1
+            if delimiter:
+                cut = key.find(delimiter, len(prefix or ''))
+            if cut >= 0:
+                common = key[:cut + len(delimiter)]
+                if not marker or common > marker:
+                    prefixes.append(common)
+                # skip the rest of the keys rolled up into this prefix
+                i += 1
+                while i < len(keys) and keys[i].startswith(common):
+                    i += 1
+                continue
+            obj = objects.get(key)
+            if obj is not None:
+                contents.append(obj)
+            i += 1
+        return contents, prefixes, False
+
+    def upload_dir(self, upload_id):
+        dpath = Path.Combine(self.uploads_root, Path.GetFileName(upload_id or ''))
+        if not upload_id or not Directory.Exists(dpath):
+            raise S3Error('NoSuchUpload', 'The specified upload does not exist.', upload_id)
+        return dpath
+
+    def start_upload(self, bucket, key, content_type):
+        Monitor.Enter(self.lock)
+        try:
+            self.__bucket(bucket)
+        finally:
+            Monitor.Exit(self.lock)
+        upload_id = Guid.NewGuid().ToString('N')
+        dpath = Path.Combine(self.uploads_root, upload_id)
+        Directory.CreateDirectory(dpath)
+        File.WriteAllText(Path.Combine(dpath, 'upload'), '\n'.join([bucket, Uri.EscapeDataString(key), content_type or '']))
+        return upload_id
+
+    def abort_upload(self, upload_id):
+        Directory.Delete(self.upload_dir(upload_id), True)
+
+def delete_quietly(fpath):
+    try:
+        File.Delete(fpath)
+    except IOException:
+        pass # still being read; left behind
+
+class LocalS3(object):
+    """Serves a Store over HTTP on localhost from a number of threads.
+    Every request can be delayed and some failed at random to see how a
+    client copes with a slow or overloaded server."""
+
+    def __init__(self, root, port = 0, latency = 0, jitter = 0, error_rate = 0.0,
+                 error_code = 'SlowDown', seed = None, page_size = DEFAULT_PAGE_SIZE, threads = 16):
+        self.store = Store(root)
+        self.port = port or free_port()
+        self.latency = latency # milliseconds
+        self.jitter = jitter # milliseconds
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.page_size = page_size
+        self.random = seed is None and Random() or Random(seed)
+        self.lock = Object()
+        self.requests = self.errors = self.injected = 0
+        self.listener = HttpListener()
+        self.listener.Prefixes.Add(self.endpoint)
+        self.threads = [Thread(ThreadStart(self.serve)) for i in range(threads)]
+
+    endpoint = property(lambda self: 'http://localhost:%d/' % self.port)
+
+    def start(self):
+        self.listener.Start()
+        for thread in self.threads:
+            thread.IsBackground = True
+            thread.Start()
+        return self
+
+    def stop(self):
+        self.listener.Stop()
+        for thread in self.threads:
+            thread.Join()
+        self.listener.Close()
+
+    def serve(self):
+        while True:
+            try:
+                context = self.listener.GetContext()
+            except Exception:
+                if not self.listener.IsListening:
+                    return # stopped
+                continue
+            try:
+                self.handle(context)
+            except Exception, e:
+                # the client went away or something is broken; never take the thread down
+                print >> sys.stderr, '%s %s: %s' % (context.Request.HttpMethod, context.Request.RawUrl, e)
+                try:
+                    context.Response.Abort()
+                except Exception:
+                    pass
+
+    def __count(self, name):
+        Monitor.Enter(self.lock)
+        try:
+            setattr(self, name, getattr(self, name) + 1)
+        finally:
+            Monitor.Exit(self.lock)
+
+    def __inject(self):
+        """Sleeps for the configured latency and tells whether to fail."""
+        Monitor.Enter(self.lock)
+        try:
+            delay = self.latency + (self.jitter and self.random.Next(self.jitter + 1) or 0)
+            fail = self.error_rate and self.random.NextDouble() < self.error_rate
+        finally:
+            Monitor.Exit(self.lock)
+        if delay:
+            Thread.Sleep(delay)
+        return fail
+
+    def handle(self, context):
+        request, response = context.Request, context.Response
+        self.__count('requests')
+        raw = request.RawUrl
+        path, query = (raw.split('?', 1) + [''])[:2]
+        segments = path.lstrip('/').split('/', 1)
+        bucket = unescape(segments[0])
+        key = len(segments) == 2 and unescape(segments[1]) or ''
+        params = parse_query(query)
+        try:
+            try:
+                if self.__inject():
+                    self.__count('injected')
+                    raise S3Error(self.error_code, 'Injected failure.', path)
+                self.route(request, response, request.HttpMethod, bucket, key, params)
+            except S3Error, e:
+                self.__count('errors')
+                self.send_error(request, response, e)
+            except IOException:
+                raise # the client went away
+            except Exception, e:
+                self.__count('errors')
+                self.send_error(request, response, S3Error('InternalError', str(e), path))
+        finally:
+            response.Close()
+
+    def route(self, request, response, method, bucket, key, params):
+        store = self.store
+        if not bucket:
+            if method != 'GET':
+                raise S3Error('MethodNotAllowed', 'The specified method is not allowed against this resource.')
+            self.list_buckets(response)
+        elif not key:
+            if method == 'GET' and 'location' in params:
+                store.keys(bucket)
+                self.send_xml(response, '<LocationConstraint></LocationConstraint>')
+            elif method == 'GET':
+                self.list_objects(response, bucket, params)
+            elif method == 'PUT':
+                store.create_bucket(bucket)
+                response.AddHeader('Location', '/' + bucket)
+            elif method == 'DELETE':
+                store.delete_bucket(bucket)
+                response.StatusCode = 204
+            elif method == 'POST' and 'delete' in params:
+                self.delete_objects(request, response, bucket)
+            else:
+                raise S3Error('MethodNotAllowed', 'The specified method is not allowed against this resource.')
+        elif method in ('GET', 'HEAD'):
+            self.get_object(request, response, bucket, key, method == 'HEAD')
+        elif method == 'PUT' and 'uploadId' in params:
+            self.upload_part(request, response, params)
+        elif method == 'PUT' and request.Headers['x-amz-copy-source']:
+            self.copy_object(request, response, bucket, key)
+        elif method == 'PUT':
+            self.put_object(request, response, bucket, key)
+        elif method == 'POST' and 'uploads' in params:
+            upload_id = store.start_upload(bucket, key, request.ContentType)
+            self.send_xml(response, '<InitiateMultipartUploadResult><Bucket>%s</Bucket><Key>%s</Key><UploadId>%s</UploadId></InitiateMultipartUploadResult>' % (
+                xml_escape(bucket), xml_escape(key), upload_id))
+        elif method == 'POST' and 'uploadId' in params:
+            self.complete_upload(request, response, bucket, key, params['uploadId'])
+        elif method == 'DELETE' and 'uploadId' in params:
+            store.abort_upload(params['uploadId'])
+            response.StatusCode = 204
+        elif method == 'DELETE':
+            store.delete(bucket, key)
+            response.StatusCode = 204
+        else:
+            raise S3Error('MethodNotAllowed', 'The specified method is not allowed against this resource.')
+
+    def list_buckets(self, response):
+        xml = ['<ListAllMyBucketsResult><Owner><ID>%s</ID><DisplayName>%s</DisplayName></Owner><Buckets>' % (OWNER_ID, OWNER_NAME)]
+        for name, created in self.store.bucket_names():
+            xml.append('<Bucket><Name>%s</Name><CreationDate>%s</CreationDate></Bucket>' % (xml_escape(name), iso_time(created)))
+        xml.append('</Buckets></ListAllMyBucketsResult>')
+        self.send_xml(response, ''.join(xml))
+
+    def list_objects(self, response, bucket, params):
+        prefix = params.get('prefix', '')
+        marker = params.get('marker', '')
+        delimiter = params.get('delimiter', '')
+        max_keys = min(int(params.get('max-keys', DEFAULT_PAGE_SIZE)), self.page_size)
+        contents, prefixes, truncated = self.store.list(bucket, prefix, marker, delimiter, max_keys)
+        xml = ['<ListBucketResult><Name>%s</Name><Prefix>%s</Prefix><Marker>%s</Marker>' % (
+            xml_escape(bucket), xml_escape(prefix), xml_escape(marker))]
+        if truncated and delimiter:
+            last = max(contents and contents[-1].key or '', prefixes and prefixes[-1] or '')
+            xml.append('<NextMarker>%s</NextMarker>' % xml_escape(last))
+        xml.append('<MaxKeys>%d</MaxKeys>' % max_keys)
+        if delimiter:
+            xml.append('<Delimiter>%s</Delimiter>' % xml_escape(delimiter))
+        xml.append('<IsTruncated>%s</IsTruncated>' % (truncated and 'true' or 'false'))
+        for obj in contents:
+            xml.append('<Contents><Key>%s</Key><LastModified>%s</LastModified><ETag>&quot;%s&quot;</ETag><Size>%d</Size>'
+                       '<Owner><ID>%s</ID><DisplayName>%s</DisplayName></Owner><StorageClass>STANDARD</StorageClass></Contents>' % (
+                xml_escape(obj.key), iso_time(obj.modified), obj.etag, obj.size, OWNER_ID, OWNER_NAME))
+        for common in prefixes:
+            xml.append('<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>' % xml_escape(common))
+        xml.append('</ListBucketResult>')
+        self.send_xml(response, ''.join(xml))
+
+    def get_object(self, request, response, bucket, key, head):
+        obj = self.store.get(bucket, key)
+        etag = '"%s"' % obj.etag
+        if_match = request.Headers['If-Match']
+        if if_match and if_match.strip() not in ('*', etag, obj.etag):
+            raise S3Error('PreconditionFailed', 'At least one of the preconditions you specified did not hold.')
+        if_none_match = request.Headers['If-None-Match']
+        if_modified_since = request.Headers['If-Modified-Since']
+        modified = obj.modified.AddTicks(-(obj.modified.Ticks % 10000000)) # HTTP dates have whole seconds
+        if (if_none_match and if_none_match.strip() in ('*', etag, obj.etag)) or \
+           (not if_none_match and if_modified_since and modified <= DateTime.Parse(if_modified_since).ToUniversalTime()):
+            response.StatusCode = 304
+            response.AddHeader('ETag', etag)
+            return
+        byte_range = parse_range(request.Headers['Range'], obj.size)
+        first, last = byte_range or (0, obj.size - 1)
+        response.AddHeader('ETag', etag)
+        response.AddHeader('Last-Modified', obj.modified.ToString('r'))
+        response.AddHeader('Accept-Ranges', 'bytes')
+        response.ContentType = obj.content_type
+        if byte_range:
+            response.StatusCode = 206
+            response.AddHeader('Content-Range', 'bytes %d-%d/%d' % (first, last, obj.size))
+        response.ContentLength64 = last - first + 1
+        if head:
+            return
+        stream = FileStream(obj.data, FileMode.Open, FileAccess.Read, FileShare.ReadWrite | FileShare.Delete)
+        try:
+            stream.Seek(first, SeekOrigin.Begin)
+            copy_stream(stream, response.OutputStream, last - first + 1)
+        finally:
+            stream.Close()
+
+    def put_object(self, request, response, bucket, key):
+        data = self.store.new_data_path(bucket)
+        hash = MD5.Create()
+        stream = File.Create(data)
+        try:
+            size = copy_stream(request.InputStream, stream, None, hash)
+        finally:
+            stream.Close()
+        hash.TransformFinalBlock(Array.CreateInstance(Byte, 0), 0, 0)
+        content_md5 = request.Headers['Content-MD5']
+        if content_md5 and Convert.ToBase64String(hash.Hash) != content_md5.strip():
+            File.Delete(data)
+            raise S3Error('BadDigest', 'The Content-MD5 you specified did not match what was received.')
+        obj = self.store.put(bucket, key, data, hex_str(hash.Hash), size, request.ContentType)
+        response.AddHeader('ETag', '"%s"' % obj.etag)
+
+    def copy_object(self, request, response, bucket, key):
+        source = unescape(request.Headers['x-amz-copy-source'].lstrip('/'))
+        fields = source.split('/', 1)
+        if len(fields) != 2 or not fields[1]:
+            raise S3Error('InvalidArgument', 'Copy Source must mention the source bucket and key.')
+        obj = self.store.get(fields[0], fields[1])
+        etag = '"%s"' % obj.etag
+        if_match = request.Headers['x-amz-copy-source-if-match']
+        if_none_match = request.Headers['x-amz-copy-source-if-none-match']
+        if (if_match and if_match.strip() not in (etag, obj.etag)) or \
+           (if_none_match and if_none_match.strip() in (etag, obj.etag)):
+            raise S3Error('PreconditionFailed', 'At least one of the preconditions you specified did not hold.')
+        data = self.store.new_data_path(bucket)
+        try:
+            File.Copy(obj.data, data)
+        except IOException:
+            raise S3Error('NoSuchKey', 'The specified key does not exist.', source) # replaced meanwhile
+        copy = self.store.put(bucket, key, data, obj.etag, obj.size, obj.content_type)
+        self.send_xml(response, '<CopyObjectResult><LastModified>%s</LastModified><ETag>&quot;%s&quot;</ETag></CopyObjectResult>' % (
+            iso_time(copy.modified), copy.etag))
+
+    def delete_objects(self, request, response, bucket):
+        doc = XmlDocument()
+        try:
+            doc.Load(request.InputStream)
+        except Exception:
+            raise S3Error('MalformedXML', 'The XML you provided was not well-formed.')
+        quiet = doc.SelectSingleNode('/Delete/Quiet')
+        quiet = quiet is not None and quiet.InnerText.strip().lower() == 'true'
+        xml = ['<DeleteResult>']
+        for node in doc.SelectNodes('/Delete/Object/Key'):
+            self.store.delete(bucket, node.InnerText)
+            if not quiet:
+                xml.append('<Deleted><Key>%s</Key></Deleted>' % xml_escape(node.InnerText))
+        xml.append('</DeleteResult>')
+        self.send_xml(response, ''.join(xml))
+
+    def upload_part(self, request, response, params):
+        dpath = self.store.upload_dir(params['uploadId'])
+        number = int(params.get('partNumber', '0'))
+        if number < 1 or number > 10000:
+            raise S3Error('InvalidArgument', 'Part number must be an integer between 1 and 10000.')
+        fpath = Path.Combine(dpath, '%05d.part' % number)
+        temp = fpath + '.' + Guid.NewGuid().ToString('N')
+        hash = MD5.Create()
+        stream = File.Create(temp)
+        try:
+            copy_stream(request.InputStream, stream, None, hash)
+        finally:
+            stream.Close()
+        hash.TransformFinalBlock(Array.CreateInstance(Byte, 0), 0, 0)
+        # a part sent again replaces the one before it
+        Monitor.Enter(self.store.lock)
+        try:
+            if File.Exists(fpath):
+                File.Delete(fpath)
+            File.Move(temp, fpath)
+        finally:
+            Monitor.Exit(self.store.lock)
+        response.AddHeader('ETag', '"%s"' % hex_str(hash.Hash))
+
+    def complete_upload(self, request, response, bucket, key, upload_id):
+        dpath = self.store.upload_dir(upload_id)
+        lines = File.ReadAllLines(Path.Combine(dpath, 'upload'))
+        if lines[0] != bucket or Uri.UnescapeDataString(lines[1]) != key:
+            raise S3Error('NoSuchUpload', 'The specified upload does not exist.', upload_id)
+        doc = XmlDocument()
+        try:
+            doc.Load(request.InputStream)
+        except Exception:
+            raise S3Error('MalformedXML', 'The XML you provided was not well-formed.')
+        data = self.store.new_data_path(bucket)
+        digests = MD5.Create()
+        output = File.Create(data)
+        size = count = 0
+        done = False
+        try:
+            for part in doc.SelectNodes('/CompleteMultipartUpload/Part'):
+                number = int(part.SelectSingleNode('PartNumber').InnerText)
+                fpath = Path.Combine(dpath, '%05d.part' % number)
+                if not File.Exists(fpath):
+                    raise S3Error('InvalidPart', 'One or more of the specified parts could not be found.')
+                hash = MD5.Create()
+                input = File.OpenRead(fpath)
+                try:
+                    size += copy_stream(input, output, None, hash)
+                finally:
+                    input.Close()
+                hash.TransformFinalBlock(Array.CreateInstance(Byte, 0), 0, 0)
+                if part.SelectSingleNode('ETag').InnerText.strip().strip('"') != hex_str(hash.Hash):
+                    raise S3Error('InvalidPart', 'One or more of the specified parts could not be found.')
+                digests.TransformBlock(hash.Hash, 0, hash.Hash.Length, hash.Hash, 0)
+                count += 1
+            done = True
+        finally:
+            output.Close()
+            if not done:
+                File.Delete(data)
+        digests.TransformFinalBlock(Array.CreateInstance(Byte, 0), 0, 0)
+        content_type = len(lines) > 2 and lines[2] or None # the last line is dropped if empty
+        obj = self.store.put(bucket, key, data, '%s-%d' % (hex_str(digests.Hash), count), size, content_type)
+        Directory.Delete(dpath, True)
+        self.send_xml(response, '<CompleteMultipartUploadResult><Location>%s%s/%s</Location><Bucket>%s</Bucket><Key>%s</Key><ETag>&quot;%s&quot;</ETag></CompleteMultipartUploadResult>' % (
+            self.endpoint, xml_escape(bucket), xml_escape(Uri.EscapeDataString(key)), xml_escape(bucket), xml_escape(key), obj.etag))
+
+    def send_xml(self, response, xml):
+        bytes = Encoding.UTF8.GetBytes('<?xml version="1.0" encoding="UTF-8"?>' + xml)
+        response.ContentType = 'application/xml'
+        response.ContentLength64 = bytes.Length
+        response.OutputStream.Write(bytes, 0, bytes.Length)
+
+    def send_error(self, request, response, error):
+        response.StatusCode = ERROR_STATUS.get(error.code, 400)
+        if request.HttpMethod == 'HEAD':
+            return # no body to carry the error in
+        self.send_xml(response, '<Error><Code>%s</Code><Message>%s</Message><Resource>%s</Resource><RequestId>%d</RequestId></Error>' % (
+            error.code, xml_escape(error.message), xml_escape(error.resource or ''), self.requests))
+
+def free_port():
+    """Finds a port on the loopback interface that nothing listens on."""
+    listener = TcpListener(IPAddress.Loopback, 0)
+    listener.Start()
+    try:
+        return listener.LocalEndpoint.Port
+    finally:
+        listener.Stop()
+
+def main(args):
+    options = {}
+    while args:
+        arg = args.pop(0)
+        if arg[:2] != '--' or not args:
+            raise Exception('Invalid argument: %s' % arg)
+        options[arg[2:]] = args.pop(0)
+    root = options.get('root', Path.Combine(Path.GetTempPath(), 's3local'))
+    Directory.CreateDirectory(root)
+    server = LocalS3(root, int(options.get('port', DEFAULT_PORT)),
+        int(options.get('latency', 0)), int(options.get('jitter', 0)),
+        float(options.get('error-rate', 0)), options.get('error-code', 'SlowDown'),
+        options.has_key('seed') and int(options['seed']) or None,
+        int(options.get('page-size', DEFAULT_PAGE_SIZE))).start()
+    print 'Serving %s at %s' % (Path.GetFullPath(root), server.endpoint)
+    print 'Press Enter to stop.'
+    sys.stdin.readline()
+    server.stop()
+    print '%d request(s), %d failed (%d injected).' % (server.requests, server.errors, server.injected)
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1:])
+    except Exception, e:
+        print >> sys.stderr, e
+        sys.exit(1)
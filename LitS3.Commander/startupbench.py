@@ -0,0 +1,96 @@
+# LitS3.Commander
+# Start-up benchmark for the command-line interface to LitS3
+#
+# The MIT License
+#
+# Copyright (c) 2008, Nick Farina
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Measures how long s3cmd takes to start, run and exit for commands that
+do not need the network, by running each one a number of times in a new
+process. The first run of each command is reported on its own since it is
+the one most affected by a cold disk cache.
+
+Usage:
+
+  startupbench [--runs N] [COMMAND-LINE ...]
+
+where each COMMAND-LINE is quoted as one argument, for example:
+
+  startupbench --runs 10 "help" "authurl s3://foo/bar --aws-key-id X --aws-secret-key Y"
+"""
+
+import sys
+
+from System import Environment, PlatformID
+from System.IO import Path
+from System.Diagnostics import Process, ProcessStartInfo, Stopwatch
+
+DEFAULT_COMMANDS = (
+    'help',
+    'help --version',
+    'authurl s3://foo/bar --aws-key-id X --aws-secret-key Y',
+    'authurl s3://foo/bar.docx --aws-key-id X --aws-secret-key Y --expires 2030-01-01',
+)
+
+def is_windows():
+    return Environment.OSVersion.Platform in (PlatformID.Win32NT, PlatformID.Win32Windows, PlatformID.Win32S, PlatformID.WinCE)
+
+def run(command_line):
+    """Runs s3cmd once with the given arguments and returns how long it took in milliseconds."""
+    home = Path.GetDirectoryName(Path.GetFullPath(sys.argv[0]))
+    if is_windows():
+        info = ProcessStartInfo(Environment.GetEnvironmentVariable('COMSPEC'),
+                                '/c "%s" %s' % (Path.Combine(home, 's3cmd.cmd'), command_line))
+    else:
+        info = ProcessStartInfo('/bin/bash', '"%s" %s' % (Path.Combine(home, 's3cmd'), command_line))
+    info.UseShellExecute = False
+    info.RedirectStandardOutput = True
+    info.RedirectStandardError = True
+    stopwatch = Stopwatch.StartNew()
+    process = Process.Start(info)
+    process.StandardOutput.ReadToEnd()
+    error = process.StandardError.ReadToEnd()
+    process.WaitForExit()
+    elapsed = stopwatch.Elapsed.TotalMilliseconds
+    if process.ExitCode != 0:
+        raise Exception('s3cmd %s failed: %s' % (command_line, error.strip()))
+    return elapsed
+
+def main(args):
+    runs = 5
+    if args[:1] == ['--runs']:
+        runs = int(args[1])
+        args = args[2:]
+    commands = args or DEFAULT_COMMANDS
+    print '%-12s %10s %10s %10s %10s' % ('', 'first', 'min', 'median', 'max')
+    for command_line in commands:
+        times = [run(command_line) for i in range(runs)]
+        first = times[0]
+        times.sort()
+        print '%-12s %10.0f %10.0f %10.0f %10.0f  %s' % (
+            command_line.split()[0], first, times[0], times[len(times) // 2], times[-1], command_line)
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1:])
+    except Exception, e:
+        print >> sys.stderr, e
+        sys.exit(1)
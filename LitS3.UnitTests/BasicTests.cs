@@ -39,5 +39,21 @@ namespace LitS3.UnitTests
             var fileContentsAtS3 = bucket.GetObjectString(fileName);
             Assert.AreEqual(fileContents, fileContentsAtS3);
         }
+
+        [TestMethod]
+        public void Verified_round_trip()
+        {
+            var fileName = "verified.txt";
+            var fileContents = "this is a verified string";
+
+            s3.AddObject(GetStreamFromString(fileContents), fileContents.Length, bucket.BucketName, fileName,
+                "text/plain", CannedAcl.Private, true);
+
+            using (var outputStream = new System.IO.MemoryStream())
+            {
+                Assert.IsTrue(s3.GetObject(bucket.BucketName, fileName, outputStream, true));
+                Assert.AreEqual(fileContents, System.Text.Encoding.UTF8.GetString(outputStream.ToArray()));
+            }
+        }
     }
 }
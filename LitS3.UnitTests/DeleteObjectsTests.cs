@@ -0,0 +1,36 @@
+﻿using System.Linq;
+using LitS3.UnitTests.Support;
+using Microsoft.VisualStudio.TestTools.UnitTesting;
+
+namespace LitS3.UnitTests
+{
+    [TestClass]
+    public class DeleteObjectsTests : S3TestBase
+    {
+        [TestMethod]
+        public void Delete_several_objects_in_one_request()
+        {
+            var fileNames = new[] { "delete-many/a.txt", "delete-many/b & c.txt", "delete-many/d.txt" };
+
+            foreach (var fileName in fileNames)
+                s3.AddObjectString(fileName, bucket.BucketName, fileName);
+
+            var errors = s3.DeleteObjects(bucket.BucketName, fileNames);
+
+            Assert.AreEqual(0, errors.Count);
+            foreach (var fileName in fileNames)
+                bucket.AssertFileDoesNotExist(fileName);
+        }
+
+        [TestMethod]
+        public void Deleting_missing_objects_is_not_an_error()
+        {
+            var fileName = "delete-many/missing.txt";
+            bucket.DeleteFile(fileName);
+
+            var errors = s3.DeleteObjects(bucket.BucketName, new[] { fileName });
+
+            Assert.AreEqual(0, errors.Count);
+        }
+    }
+}
@@ -0,0 +1,78 @@
+﻿using System.IO;
+using System.Linq;
+using LitS3.UnitTests.Support;
+using Microsoft.VisualStudio.TestTools.UnitTesting;
+
+namespace LitS3.UnitTests
+{
+    [TestClass]
+    public class MultipartUploadTests : S3TestBase
+    {
+        [TestMethod]
+        public void Upload_file_in_parallel_parts()
+        {
+            var fileName = "multipart.bin";
+            bucket.DeleteFile(fileName);
+
+            // two full parts and a short last one
+            var localFile = Path.GetTempFileName();
+            var length = 2 * S3Service.MinimumPartSize + 1024;
+            File.WriteAllBytes(localFile, new byte[length]);
+
+            long lastReported = 0;
+            s3.AddObjectProgress += (sender, e) => lastReported = e.BytesTransferred;
+
+            try
+            {
+                s3.AddObjectMultipart(localFile, bucket.BucketName, fileName, null, CannedAcl.Private,
+                    S3Service.MinimumPartSize, 3);
+            }
+            finally
+            {
+                File.Delete(localFile);
+            }
+
+            bucket.AssertFileExists(fileName);
+            var entry = s3.ListObjects(bucket.BucketName, fileName).OfType<ObjectEntry>().Single();
+            Assert.AreEqual(length, entry.Size);
+            Assert.AreEqual(length, lastReported);
+        }
+
+        [TestMethod]
+        public void Verified_upload_checks_parts_and_object()
+        {
+            var fileName = "multipart-verified.bin";
+            bucket.DeleteFile(fileName);
+
+            var localFile = Path.GetTempFileName();
+            var data = new byte[S3Service.MinimumPartSize + 1024];
+            new System.Random(42).NextBytes(data);
+            File.WriteAllBytes(localFile, data);
+
+            try
+            {
+                s3.AddObjectMultipart(localFile, bucket.BucketName, fileName, null, CannedAcl.Private,
+                    S3Service.MinimumPartSize, 2, true);
+            }
+            finally
+            {
+                File.Delete(localFile);
+            }
+
+            bucket.AssertFileExists(fileName);
+        }
+
+        [TestMethod]
+        public void Aborted_upload_leaves_no_object()
+        {
+            var fileName = "multipart-aborted.bin";
+            bucket.DeleteFile(fileName);
+
+            var uploadId = s3.InitiateMultipartUpload(bucket.BucketName, fileName, null, CannedAcl.Private);
+            s3.UploadPart(GetStreamFromString("part one"), 8, bucket.BucketName, fileName, uploadId, 1);
+            s3.AbortMultipartUpload(bucket.BucketName, fileName, uploadId);
+
+            bucket.AssertFileDoesNotExist(fileName);
+        }
+    }
+}
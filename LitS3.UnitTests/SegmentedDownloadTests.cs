@@ -0,0 +1,32 @@
+﻿using System.IO;
+using System.Text;
+using LitS3.UnitTests.Support;
+using Microsoft.VisualStudio.TestTools.UnitTesting;
+
+namespace LitS3.UnitTests
+{
+    [TestClass]
+    public class SegmentedDownloadTests : S3TestBase
+    {
+        [TestMethod]
+        public void Download_object_in_parallel_segments()
+        {
+            var fileName = "segmented.txt";
+            var fileContents = "0123456789abcdefghijklmnopqrstuvwxyz";
+            s3.AddObjectString(fileContents, bucket.BucketName, fileName);
+
+            var localFile = Path.GetTempFileName();
+
+            try
+            {
+                // uneven segments so the last one is short
+                s3.GetObjectSegmented(bucket.BucketName, fileName, localFile, 5, 3);
+                Assert.AreEqual(fileContents, File.ReadAllText(localFile, Encoding.UTF8));
+            }
+            finally
+            {
+                File.Delete(localFile);
+            }
+        }
+    }
+}
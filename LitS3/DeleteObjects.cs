@@ -0,0 +1,180 @@
+﻿using System;
+using System.Collections.Generic;
+using System.IO;
+using System.Net;
+using System.Security;
+using System.Security.Cryptography;
+using System.Text;
+using System.Xml;
+
+namespace LitS3
+{
+    /// <summary>
+    /// Deletes up to 1000 objects in an S3 bucket with a single request. By default the request
+    /// is made in quiet mode where S3 only reports the keys it failed to delete.
+    /// </summary>
+    public class DeleteObjectsRequest : S3Request<DeleteObjectsResponse>
+    {
+        List<string> keys = new List<string>();
+
+        public DeleteObjectsRequest(S3Service service, string bucketName)
+            : base(service, "POST", bucketName, null, "?delete")
+        {
+            this.Quiet = true;
+        }
+
+        /// <summary>
+        /// Gets or sets whether S3 should leave the deleted keys out of the response and only
+        /// report errors. The default is true.
+        /// </summary>
+        public bool Quiet { get; set; }
+
+        /// <summary>
+        /// Gets the number of keys added to this request so far.
+        /// </summary>
+        public int KeyCount
+        {
+            get { return keys.Count; }
+        }
+
+        /// <summary>
+        /// Adds the key of an object to delete.
+        /// </summary>
+        public void AddKey(string key)
+        {
+            if (keys.Count == S3Service.MaximumDeleteCount)
+                throw new InvalidOperationException("A single request can delete at most " + S3Service.MaximumDeleteCount + " objects.");
+
+            keys.Add(key);
+        }
+
+        byte[] CreateManifest()
+        {
+            var manifest = new StringBuilder("<Delete>");
+
+            if (Quiet)
+                manifest.Append("<Quiet>true</Quiet>");
+
+            foreach (string key in keys)
+                manifest.Append("<Object><Key>").Append(SecurityElement.Escape(key)).Append("</Key></Object>");
+
+            manifest.Append("</Delete>");
+            return Encoding.UTF8.GetBytes(manifest.ToString());
+        }
+
+        public override DeleteObjectsResponse GetResponse()
+        {
+            if (keys.Count == 0)
+                throw new InvalidOperationException("At least one key must be added to delete.");
+
+            byte[] manifest = CreateManifest();
+            WebRequest.ContentLength = manifest.Length;
+
+            // S3 requires the digest for this request
+            using (MD5 md5 = MD5.Create())
+                WebRequest.Headers[HttpRequestHeader.ContentMd5] = Convert.ToBase64String(md5.ComputeHash(manifest));
+
+            AuthorizeIfNecessary(); // authorize before getting the request stream!
+
+            using (Stream stream = WebRequest.GetRequestStream())
+                stream.Write(manifest, 0, manifest.Length);
+
+            return base.GetResponse();
+        }
+
+        public override IAsyncResult BeginGetResponse(AsyncCallback callback, object state)
+        {
+            throw new InvalidOperationException("BeginGetResponse() is not supported for this class yet.");
+        }
+    }
+
+    /// <summary>
+    /// Represents the S3 response to a DeleteObjectsRequest. A successful response may still
+    /// report errors for some of the keys, so you should inspect the Errors list.
+    /// </summary>
+    public sealed class DeleteObjectsResponse : S3Response
+    {
+        /// <summary>
+        /// Gets the keys S3 reports as deleted. This is empty for requests made in quiet mode.
+        /// </summary>
+        public IList<string> DeletedKeys { get; private set; }
+
+        /// <summary>
+        /// Gets the keys S3 failed to delete along with the reason.
+        /// </summary>
+        public IList<DeleteObjectsError> Errors { get; private set; }
+
+        protected override void ProcessResponse()
+        {
+            this.DeletedKeys = new List<string>();
+            this.Errors = new List<DeleteObjectsError>();
+
+            if (Reader.IsEmptyElement)
+                return;
+
+            Reader.ReadStartElement("DeleteResult");
+
+            while (Reader.Name == "Deleted" || Reader.Name == "Error")
+            {
+                bool deleted = Reader.Name == "Deleted";
+                string key = null, code = null, message = null;
+
+                Reader.ReadStartElement();
+
+                while (Reader.NodeType == XmlNodeType.Element)
+                {
+                    switch (Reader.Name)
+                    {
+                        case "Key":
+                            key = Reader.ReadElementContentAsString();
+                            break;
+                        case "Code":
+                            code = Reader.ReadElementContentAsString();
+                            break;
+                        case "Message":
+                            message = Reader.ReadElementContentAsString();
+                            break;
+                        default:
+                            Reader.Skip();
+                            break;
+                    }
+                }
+
+                Reader.ReadEndElement();
+
+                if (deleted)
+                    DeletedKeys.Add(key);
+                else
+                    Errors.Add(new DeleteObjectsError(key, S3Exception.ParseCode(code), message));
+            }
+        }
+    }
+
+    /// <summary>
+    /// Describes a key that S3 failed to delete as part of a DeleteObjectsRequest.
+    /// </summary>
+    public sealed class DeleteObjectsError
+    {
+        internal DeleteObjectsError(string key, S3ErrorCode errorCode, string message)
+        {
+            this.Key = key;
+            this.ErrorCode = errorCode;
+            this.Message = message;
+        }
+
+        /// <summary>
+        /// Gets the key of the object that was not deleted.
+        /// </summary>
+        public string Key { get; private set; }
+
+        /// <summary>
+        /// Gets the error code returned by S3 for this key.
+        /// </summary>
+        public S3ErrorCode ErrorCode { get; private set; }
+
+        /// <summary>
+        /// Gets the error message returned by S3 for this key.
+        /// </summary>
+        public string Message { get; private set; }
+    }
+}
@@ -22,10 +22,18 @@ namespace LitS3
         /// </summary>
         public bool IsEurope { get; private set; }
 
+        /// <summary>
+        /// Gets the location constraint of the bucket, or an empty string if the bucket was 
+        /// created without one, in the US Standard region.
+        /// </summary>
+        public string Location { get; private set; }
+
         protected override void ProcessResponse()
         {
             string location = Reader.ReadElementContentAsString("LocationConstraint", "");
 
+            Location = location;
+
             if (location == "EU")
                 IsEurope = true;
         }
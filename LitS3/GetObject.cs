@@ -2,6 +2,7 @@
 using System.Collections.Specialized;
 using System.IO;
 using System.Net;
+using System.Reflection;
 
 namespace LitS3
 {
@@ -78,12 +79,45 @@ namespace LitS3
             rangeWasAdded = true;
         }
 
+        /// <summary>
+        /// Requests a partial object using 64-bit byte offsets, for objects larger than 2 GB.
+        /// You can only add one range request.
+        /// </summary>
+        /// <param name="from">The offset of the first byte to return.</param>
+        /// <param name="to">The offset of the last byte to return (inclusive).</param>
+        public void AddRange(long from, long to)
+        {
+            if (rangeWasAdded)
+                throw new InvalidOperationException("S3 only supports a single range specifier.");
+
+            // HttpWebRequest.AddRange() only takes ints before .NET 4.0 and Range is a
+            // restricted header, so go around the validation to set it ourselves.
+            if (AddWithoutValidate != null)
+                AddWithoutValidate.Invoke(WebRequest.Headers, 
+                    new object[] { "Range", "bytes=" + from + "-" + to });
+            else if (to <= int.MaxValue)
+                WebRequest.AddRange((int)from, (int)to);
+            else
+                throw new NotSupportedException(
+                    "This runtime cannot request ranges beyond the first 2 GB of an object.");
+            rangeWasAdded = true;
+        }
+
+        static readonly MethodInfo AddWithoutValidate = typeof(WebHeaderCollection).GetMethod(
+            "AddWithoutValidate", BindingFlags.Instance | BindingFlags.NonPublic);
+
         /// <summary>
         /// Gets or sets: Return the object only if its entity tag (ETag) is the same as the 
         /// one specified, otherwise return a 412 (precondition failed).
         /// </summary>
         public string IfMatch { get; set; }
 
+        /// <summary>
+        /// Gets or sets: Return the object only if its entity tag (ETag) is different from the 
+        /// one specified, otherwise return a 304 (not modified).
+        /// </summary>
+        public string IfNoneMatch { get; set; }
+
         protected override void Authorize()
         {
             if (ifUnmodifiedSince.HasValue)
@@ -93,6 +127,9 @@ namespace LitS3
             if (IfMatch != null)
                 WebRequest.Headers[HttpRequestHeader.IfMatch] = IfMatch;
 
+            if (IfNoneMatch != null)
+                WebRequest.Headers[HttpRequestHeader.IfNoneMatch] = IfNoneMatch;
+
             base.Authorize();
         }
     }
@@ -0,0 +1,327 @@
+﻿using System;
+using System.Collections.Generic;
+using System.Collections.Specialized;
+using System.IO;
+using System.Net;
+using System.Text;
+
+namespace LitS3
+{
+    /// <summary>
+    /// Starts a multipart upload. The returned upload ID identifies the upload in all the
+    /// subsequent UploadPart, CompleteMultipartUpload and AbortMultipartUpload requests.
+    /// </summary>
+    public class InitiateMultipartUploadRequest : S3Request<InitiateMultipartUploadResponse>
+    {
+        // created on demand to save memory
+        NameValueCollection metadata;
+
+        public InitiateMultipartUploadRequest(S3Service service, string bucketName, string objectKey)
+            : base(service, "POST", bucketName, objectKey, "?uploads")
+        {
+            this.CannedAcl = CannedAcl.Private;
+            WebRequest.ContentLength = 0;
+        }
+
+        /// <summary>
+        /// Gets or sets the "canned" access control to apply to the completed object. The default
+        /// is Private.
+        /// </summary>
+        public CannedAcl CannedAcl { get; set; }
+
+        /// <summary>
+        /// Gets or sets the MIME type of the completed object. It will be stored by S3 and returned
+        /// as a standard Content-Type header when the object is retrieved.
+        /// </summary>
+        public string ContentType
+        {
+            get { return WebRequest.ContentType; }
+            set { WebRequest.ContentType = value; }
+        }
+
+        /// <summary>
+        /// Gets a collection where you can store name/value metadata pairs to be stored along
+        /// with the completed object. Note that LitS3 manages adding the special "x-amz-meta"
+        /// prefix for you.
+        /// </summary>
+        public NameValueCollection Metadata
+        {
+            get { return metadata ?? (metadata = new NameValueCollection()); }
+        }
+
+        protected override void Authorize()
+        {
+            // write canned ACL, if it's not private (which is implied by default)
+            switch (CannedAcl)
+            {
+                case CannedAcl.PublicRead:
+                    WebRequest.Headers[S3Headers.CannedAcl] = "public-read"; break;
+                case CannedAcl.PublicReadWrite:
+                    WebRequest.Headers[S3Headers.CannedAcl] = "public-read-write"; break;
+                case CannedAcl.AuthenticatedRead:
+                    WebRequest.Headers[S3Headers.CannedAcl] = "authenticated-read"; break;
+            }
+
+            if (metadata != null)
+                foreach (string key in metadata)
+                    foreach (string value in metadata.GetValues(key))
+                        WebRequest.Headers.Add(S3Headers.MetadataPrefix + key, value);
+
+            base.Authorize();
+        }
+    }
+
+    /// <summary>
+    /// Represents the S3 response to an InitiateMultipartUploadRequest.
+    /// </summary>
+    public sealed class InitiateMultipartUploadResponse : S3Response
+    {
+        /// <summary>
+        /// Gets the bucket the upload was initiated in.
+        /// </summary>
+        public string BucketName { get; private set; }
+
+        /// <summary>
+        /// Gets the key of the object being uploaded.
+        /// </summary>
+        public string Key { get; private set; }
+
+        /// <summary>
+        /// Gets the ID that identifies this multipart upload.
+        /// </summary>
+        public string UploadId { get; private set; }
+
+        protected override void ProcessResponse()
+        {
+            Reader.ReadStartElement("InitiateMultipartUploadResult");
+            this.BucketName = Reader.ReadElementContentAsString("Bucket", "");
+            this.Key = Reader.ReadElementContentAsString("Key", "");
+            this.UploadId = Reader.ReadElementContentAsString("UploadId", "");
+        }
+    }
+
+    /// <summary>
+    /// Uploads a single part of a multipart upload. Parts are numbered from 1 to 10,000 and all
+    /// but the last part must be at least 5 MB in size.
+    /// </summary>
+    public class UploadPartRequest : S3Request<UploadPartResponse>
+    {
+        bool contentLengthWasSet;
+
+        public UploadPartRequest(S3Service service, string bucketName, string objectKey,
+            string uploadId, int partNumber)
+            : base(service, "PUT", bucketName, objectKey,
+                   "?partNumber=" + partNumber + "&uploadId=" + Uri.EscapeDataString(uploadId))
+        {
+            this.UploadId = uploadId;
+            this.PartNumber = partNumber;
+            WebRequest.AllowWriteStreamBuffering = false; // important! parts can be large
+        }
+
+        /// <summary>
+        /// Gets the ID of the multipart upload this part belongs to.
+        /// </summary>
+        public string UploadId { get; private set; }
+
+        /// <summary>
+        /// Gets the number of this part within the multipart upload.
+        /// </summary>
+        public int PartNumber { get; private set; }
+
+        /// <summary>
+        /// Gets or sets the size of the part you are uploading. Setting this property is required.
+        /// </summary>
+        public long ContentLength
+        {
+            get { return WebRequest.ContentLength; }
+            set { WebRequest.ContentLength = value; contentLengthWasSet = true; }
+        }
+
+        /// <summary>
+        /// Gets or sets the base64 encoded 128-bit MD5 digest of the part data according to RFC 1864.
+        /// </summary>
+        public string ContentMD5
+        {
+            get { return WebRequest.Headers[HttpRequestHeader.ContentMd5]; }
+            set { WebRequest.Headers[HttpRequestHeader.ContentMd5] = value; }
+        }
+
+        protected override void Authorize()
+        {
+            // sanity check
+            if (!contentLengthWasSet)
+                throw new InvalidOperationException("Amazon S3 requires that you specify ContentLength when uploading a part.");
+
+            base.Authorize();
+        }
+
+        /// <summary>
+        /// Submits the request to the server and retrieves a Stream for writing the part data to.
+        /// </summary>
+        public Stream GetRequestStream()
+        {
+            AuthorizeIfNecessary();
+            return WebRequest.GetRequestStream();
+        }
+
+        /// <summary>
+        /// Submits the request to the server and performs the given action with the request
+        /// stream which should be filled with the part's data. Returns the ETag S3 assigned
+        /// to the part, which is needed to complete the upload.
+        /// </summary>
+        public string PerformWithRequestStream(Action<Stream> action)
+        {
+            using (Stream stream = GetRequestStream())
+                action(stream);
+
+            using (UploadPartResponse response = GetResponse())
+                return response.ETag;
+        }
+    }
+
+    /// <summary>
+    /// Represents the response returned by S3 after uploading a part with UploadPartRequest.
+    /// </summary>
+    public sealed class UploadPartResponse : S3Response
+    {
+        /// <summary>
+        /// Gets the ETag of the uploaded part as calculated by S3.
+        /// </summary>
+        public string ETag { get; private set; }
+
+        protected override void ProcessResponse()
+        {
+            ETag = WebResponse.Headers[HttpResponseHeader.ETag];
+        }
+    }
+
+    /// <summary>
+    /// Completes a multipart upload by assembling the previously uploaded parts into the
+    /// final object. Even if you successfully get a CompleteMultipartUploadResponse without
+    /// an exception, you should inspect it to see if any errors occurred while assembling.
+    /// </summary>
+    public class CompleteMultipartUploadRequest : S3Request<CompleteMultipartUploadResponse>
+    {
+        SortedList<int, string> parts = new SortedList<int, string>();
+
+        public CompleteMultipartUploadRequest(S3Service service, string bucketName, string objectKey,
+            string uploadId)
+            : base(service, "POST", bucketName, objectKey, "?uploadId=" + Uri.EscapeDataString(uploadId))
+        {
+            this.UploadId = uploadId;
+        }
+
+        /// <summary>
+        /// Gets the ID of the multipart upload to complete.
+        /// </summary>
+        public string UploadId { get; private set; }
+
+        /// <summary>
+        /// Adds a part, identified by its number and the ETag returned when it was uploaded,
+        /// to the list of parts making up the final object.
+        /// </summary>
+        public void AddPart(int partNumber, string etag)
+        {
+            parts[partNumber] = etag;
+        }
+
+        byte[] CreateManifest()
+        {
+            var manifest = new StringBuilder("<CompleteMultipartUpload>");
+
+            foreach (var part in parts)
+                manifest.Append("<Part><PartNumber>").Append(part.Key).Append("</PartNumber><ETag>")
+                        .Append(part.Value).Append("</ETag></Part>");
+
+            manifest.Append("</CompleteMultipartUpload>");
+            return Encoding.UTF8.GetBytes(manifest.ToString());
+        }
+
+        public override CompleteMultipartUploadResponse GetResponse()
+        {
+            if (parts.Count == 0)
+                throw new InvalidOperationException("A multipart upload must be completed with at least one part.");
+
+            byte[] manifest = CreateManifest();
+            WebRequest.ContentLength = manifest.Length;
+
+            AuthorizeIfNecessary(); // authorize before getting the request stream!
+
+            using (Stream stream = WebRequest.GetRequestStream())
+                stream.Write(manifest, 0, manifest.Length);
+
+            return base.GetResponse();
+        }
+
+        public override IAsyncResult BeginGetResponse(AsyncCallback callback, object state)
+        {
+            throw new InvalidOperationException("BeginGetResponse() is not supported for this class yet.");
+        }
+    }
+
+    /// <summary>
+    /// Represents the S3 response to a CompleteMultipartUploadRequest.
+    /// </summary>
+    public sealed class CompleteMultipartUploadResponse : S3Response
+    {
+        /// <summary>
+        /// Gets the URI that identifies the newly created object.
+        /// </summary>
+        public string Location { get; private set; }
+
+        /// <summary>
+        /// Gets the ETag of the assembled object as calculated by S3.
+        /// </summary>
+        public string ETag { get; private set; }
+
+        /// <summary>
+        /// Gets the error that occurred while assembling the object, if any.
+        /// </summary>
+        public S3Exception Error { get; private set; }
+
+        protected override void ProcessResponse()
+        {
+            // S3 may send back an error even after responding with 200 OK
+            if (Reader.Name == "Error")
+                Error = S3Exception.FromErrorResponse(Reader, null);
+            else if (Reader.Name == "CompleteMultipartUploadResult")
+            {
+                if (Reader.IsEmptyElement)
+                    throw new Exception("Expected a non-empty <CompleteMultipartUploadResult> element.");
+
+                Reader.ReadStartElement("CompleteMultipartUploadResult");
+
+                this.Location = Reader.ReadElementContentAsString("Location", "");
+                Reader.ReadElementContentAsString("Bucket", "");
+                Reader.ReadElementContentAsString("Key", "");
+                this.ETag = Reader.ReadElementContentAsString("ETag", "");
+            }
+            else
+                throw new Exception("Unknown S3 XML response tag: " + Reader.Name);
+        }
+    }
+
+    /// <summary>
+    /// Aborts a multipart upload, freeing the storage consumed by any parts uploaded so far.
+    /// </summary>
+    public class AbortMultipartUploadRequest : S3Request<AbortMultipartUploadResponse>
+    {
+        public AbortMultipartUploadRequest(S3Service service, string bucketName, string objectKey,
+            string uploadId)
+            : base(service, "DELETE", bucketName, objectKey, "?uploadId=" + Uri.EscapeDataString(uploadId))
+        {
+        }
+    }
+
+    /// <summary>
+    /// Represents the S3 response for an aborted multipart upload.
+    /// </summary>
+    public sealed class AbortMultipartUploadResponse : S3Response
+    {
+        protected override void ProcessResponse()
+        {
+            if (WebResponse.StatusCode != HttpStatusCode.NoContent)
+                throw new Exception("Unexpected status code: " + WebResponse.StatusCode);
+        }
+    }
+}
@@ -39,4 +39,32 @@ namespace LitS3
             this.BytesTotal = bytesTotal;
         }
     }
+
+    /// <summary>
+    /// Describes a part of a parallel transfer that failed and is about to be attempted again.
+    /// </summary>
+    public class S3PartRetryEventArgs : EventArgs
+    {
+        /// <summary>
+        /// Gets the number of the part being retried, starting from 1.
+        /// </summary>
+        public int PartNumber { get; private set; }
+
+        /// <summary>
+        /// Gets the number of the attempt that failed, starting from 1.
+        /// </summary>
+        public int Attempt { get; private set; }
+
+        /// <summary>
+        /// Gets the error the failed attempt ended with.
+        /// </summary>
+        public Exception Error { get; private set; }
+
+        public S3PartRetryEventArgs(int partNumber, int attempt, Exception error)
+        {
+            this.PartNumber = partNumber;
+            this.Attempt = attempt;
+            this.Error = error;
+        }
+    }
 }
@@ -8,6 +8,12 @@ namespace LitS3
 {
     class S3Authorizer : IComparer<string>
     {
+        // query string parameters that identify a sub-resource and must be signed
+        static readonly string[] SubResources = 
+        {
+            "acl", "delete", "location", "logging", "partNumber", "torrent", "uploadId", "uploads"
+        };
+
         S3Service service;
         HMACSHA1 signer;
 
@@ -51,11 +57,9 @@ namespace LitS3
 
             stringToSign.Append(request.RequestUri.AbsolutePath);
 
-            // add sub-resource, if present. "?acl", "?location", "?logging", or "?torrent"
-            string query = request.RequestUri.Query;
-
-            if (query == "?acl" || query == "?location" || query == "?logging" || query == "?torrent")
-                stringToSign.Append(query);
+            // add sub-resources, if present. "?acl", "?location", "?logging", "?torrent"
+            // or the multipart upload ones such as "?partNumber=1&uploadId=..."
+            AppendCanonicalizedSubResources(request.RequestUri.Query, stringToSign);
 
             string signed = Sign(stringToSign.ToString());
 
@@ -89,6 +93,36 @@ namespace LitS3
             return string.CompareOrdinal(x, y);
         }
 
+        void AppendCanonicalizedSubResources(string query, StringBuilder stringToSign)
+        {
+            if (string.IsNullOrEmpty(query))
+                return;
+
+            // specify ourself as the sorter so we can use string.CompareOrdinal.
+            var subResources = new SortedList<string, string>(this);
+
+            foreach (string parameter in query.Substring(1).Split('&'))
+            {
+                int separator = parameter.IndexOf('=');
+                string name = separator < 0 ? parameter : parameter.Substring(0, separator);
+
+                if (Array.IndexOf(SubResources, name) >= 0)
+                    subResources[name] = separator < 0 ? null
+                        : Uri.UnescapeDataString(parameter.Substring(separator + 1));
+            }
+
+            char sep = '?';
+            foreach (var subResource in subResources)
+            {
+                stringToSign.Append(sep).Append(subResource.Key);
+
+                if (subResource.Value != null)
+                    stringToSign.Append('=').Append(subResource.Value);
+
+                sep = '&';
+            }
+        }
+
         void AppendCanonicalizedAmzHeaders(HttpWebRequest request, StringBuilder stringToSign)
         {
             // specify ourself as the sorter so we can use string.CompareOrdinal.
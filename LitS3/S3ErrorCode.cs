@@ -199,6 +199,11 @@ namespace LitS3
         /// </summary>
         NoSuchKey,
         /// <summary>
+        /// The specified multipart upload does not exist. The upload ID might be invalid, or the
+        /// multipart upload might have been aborted or completed.
+        /// </summary>
+        NoSuchUpload,
+        /// <summary>
         /// A header you provided implies functionality that is not implemented.
         /// </summary>
         NotImplemented,
@@ -31,6 +31,11 @@ namespace LitS3
         /// </summary>
         public string HostID { get; private set; }
 
+        /// <summary>
+        /// Gets the host that requests should be sent to instead, given with redirect errors.
+        /// </summary>
+        public string Endpoint { get; private set; }
+
         public S3Exception(S3ErrorCode errorCode, string bucketName, string message, WebException innerException)
             : base(message, innerException)
         {
@@ -46,7 +51,7 @@ namespace LitS3
             reader.ReadStartElement("Error");
 
             S3ErrorCode errorCode = S3ErrorCode.Unknown;
-            string message = null, bucketName = null, requestID = null, hostID = null;
+            string message = null, bucketName = null, requestID = null, hostID = null, endpoint = null;
             
             while (reader.Name != "Error")
             {
@@ -67,6 +72,9 @@ namespace LitS3
                     case "HostID":
                         hostID = reader.ReadElementContentAsString();
                         break;
+                    case "Endpoint":
+                        endpoint = reader.ReadElementContentAsString();
+                        break;
                     default:
                         reader.Skip();
                         break;
@@ -80,7 +88,8 @@ namespace LitS3
             return new S3Exception(errorCode, bucketName, message, exception)
             {
                 RequestID = requestID,
-                HostID = hostID
+                HostID = hostID,
+                Endpoint = endpoint
             };
         }
 
@@ -106,7 +115,7 @@ namespace LitS3
             return FromErrorResponse(xmlReader, exception);
         }
 
-        static S3ErrorCode ParseCode(string code)
+        internal static S3ErrorCode ParseCode(string code)
         {
             if (Enum.IsDefined(typeof(S3ErrorCode), code))
                 return (S3ErrorCode)Enum.Parse(typeof(S3ErrorCode), code);
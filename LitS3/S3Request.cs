@@ -1,4 +1,5 @@
 ﻿using System;
+using System.Diagnostics;
 using System.Net;
 using System.Text;
 
@@ -18,6 +19,10 @@ namespace LitS3
 
         public HttpWebRequest WebRequest { get; private set; }
 
+        // times the request from when it is signed until the response headers arrive
+        Stopwatch stopwatch;
+        TimeSpan signingTime;
+
         internal S3Request(S3Service service, string method, string bucketName, string objectKey,
             string queryString)
         {
@@ -33,7 +38,7 @@ namespace LitS3
             if (BucketName != null && Service.UseSubdomains)
                 uriString.Append(BucketName).Append('.');
 
-            uriString.Append(Service.Host);
+            uriString.Append(BucketName != null ? Service.GetBucketHost(BucketName) : Service.Host);
 
             if (Service.CustomPort != 0)
                 uriString.Append(':').Append(Service.CustomPort);
@@ -94,6 +99,16 @@ namespace LitS3
             set { WebRequest.Proxy = value; }
         }
 
+        /// <summary>
+        /// Gets or sets the time-out in milliseconds for connecting to S3 and getting the request
+        /// stream or the response. The default value is int.MaxValue, that is: no time-out.
+        /// </summary>
+        public int Timeout
+        {
+            get { return WebRequest.Timeout; }
+            set { WebRequest.Timeout = value; }
+        }
+
         /// <summary>
         /// Gets or sets a time-out in milliseconds when writing to or reading from a stream.
         /// The default value is 5 minutes.
@@ -132,7 +147,22 @@ namespace LitS3
             if (S3Authorizer.IsAuthorized(WebRequest))
                 throw new InvalidOperationException("This request has already been authorized.");
 
+            stopwatch = Stopwatch.StartNew();
             Service.AuthorizeRequest(this, WebRequest, BucketName);
+            signingTime = stopwatch.Elapsed;
+        }
+
+        internal void ReportCompletion(HttpWebResponse response, Exception error)
+        {
+            TimeSpan responseTime = stopwatch != null ? stopwatch.Elapsed - signingTime : TimeSpan.Zero;
+            Service.OnRequestCompleted(this, signingTime, responseTime, 
+                response != null ? response.StatusCode : 0, error);
+
+            // a redirect that was followed shows in the host the response came from
+            if (BucketName != null && response != null && 
+                Uri.Compare(response.ResponseUri, WebRequest.RequestUri, UriComponents.Host,
+                    UriFormat.Unescaped, StringComparison.OrdinalIgnoreCase) != 0)
+                Service.OnBucketRedirected(BucketName, response.ResponseUri.Host);
         }
 
         protected void TryThrowS3Exception(WebException exception)
@@ -145,6 +175,13 @@ namespace LitS3
                  exception.Response.Headers[HttpResponseHeader.TransferEncoding] == "chunked"))
             {
                 var wrapped = S3Exception.FromWebException(exception);
+
+                // remember where S3 says the bucket is, so the request can be sent there again
+                if (wrapped != null && wrapped.Endpoint != null && BucketName != null &&
+                    (wrapped.ErrorCode == S3ErrorCode.PermanentRedirect ||
+                     wrapped.ErrorCode == S3ErrorCode.TemporaryRedirect))
+                    Service.OnBucketRedirected(BucketName, wrapped.Endpoint);
+
                 if (wrapped != null)
                     throw wrapped; // do this on a separate statement so the debugger can re-execute
             }
@@ -164,6 +201,64 @@ namespace LitS3
         }
     }
 
+    /// <summary>
+    /// Describes a bucket that S3 redirected to another host.
+    /// </summary>
+    public class S3BucketRedirectedArgs : EventArgs
+    {
+        public string BucketName { get; private set; }
+
+        /// <summary>
+        /// Gets the host requests to the bucket are now sent to.
+        /// </summary>
+        public string Host { get; private set; }
+
+        public S3BucketRedirectedArgs(string bucketName, string host)
+        {
+            this.BucketName = bucketName;
+            this.Host = host;
+        }
+    }
+
+    /// <summary>
+    /// Describes an S3Request that has completed, successfully or not, along with how long
+    /// it took.
+    /// </summary>
+    public class S3RequestCompletedArgs : S3RequestArgs
+    {
+        /// <summary>
+        /// Gets the time it took to sign the request, including any BeforeAuthorize handlers.
+        /// </summary>
+        public TimeSpan SigningTime { get; private set; }
+
+        /// <summary>
+        /// Gets the time from when the request was signed until the response headers arrived.
+        /// For requests with a body, like AddObject, this includes the time to send the body.
+        /// For requests without one, this is the time to first byte.
+        /// </summary>
+        public TimeSpan ResponseTime { get; private set; }
+
+        /// <summary>
+        /// Gets the HTTP status code of the response, or zero if none was received.
+        /// </summary>
+        public HttpStatusCode StatusCode { get; private set; }
+
+        /// <summary>
+        /// Gets the error that the request failed with, if any.
+        /// </summary>
+        public Exception Error { get; private set; }
+
+        public S3RequestCompletedArgs(S3Request request, TimeSpan signingTime, TimeSpan responseTime,
+            HttpStatusCode statusCode, Exception error)
+            : base(request)
+        {
+            this.SigningTime = signingTime;
+            this.ResponseTime = responseTime;
+            this.StatusCode = statusCode;
+            this.Error = error;
+        }
+    }
+
     /// <summary>
     /// Common base class for all concrete S3Requests, pairs each one tightly with its S3Response
     /// counterpart.
@@ -187,6 +282,7 @@ namespace LitS3
             try
             {
                 var response = (HttpWebResponse)WebRequest.GetResponse();
+                ReportCompletion(response, null);
 
                 //if (response.StatusCode == HttpStatusCode.TemporaryRedirect)
 
@@ -195,6 +291,7 @@ namespace LitS3
             }
             catch (WebException exception)
             {
+                ReportCompletion((HttpWebResponse)exception.Response, exception);
                 TryThrowS3Exception(exception);
                 throw;
             }
@@ -216,10 +313,13 @@ namespace LitS3
         {
             try
             {
-                return new TResponse { WebResponse = (HttpWebResponse)WebRequest.EndGetResponse(asyncResult) };
+                var response = (HttpWebResponse)WebRequest.EndGetResponse(asyncResult);
+                ReportCompletion(response, null);
+                return new TResponse { WebResponse = response };
             }
             catch (WebException exception)
             {
+                ReportCompletion((HttpWebResponse)exception.Response, exception);
                 TryThrowS3Exception(exception);
                 throw;
             }
@@ -3,7 +3,9 @@ using System.Collections.Generic;
 using System.IO;
 using System.Linq;
 using System.Net;
+using System.Security.Cryptography;
 using System.Text;
+using System.Threading;
 
 namespace LitS3
 {
@@ -14,6 +16,7 @@ namespace LitS3
     {
         string secretAccessKey;
         S3Authorizer authorizer;
+        readonly Dictionary<string, string> bucketHosts = new Dictionary<string, string>();
 
         /// <summary>
         /// Reports progress for any operation that adds an object to a bucket.
@@ -32,6 +35,28 @@ namespace LitS3
         /// </summary>
         public event EventHandler<S3RequestArgs> BeforeAuthorize;
 
+        /// <summary>
+        /// Fired when the response to an S3Request operating against this service arrives, or
+        /// the request fails. This is a good opportunity to collect timings for every request.
+        /// Handlers may be called on any thread.
+        /// </summary>
+        public event EventHandler<S3RequestCompletedArgs> RequestCompleted;
+
+        /// <summary>
+        /// Fired when a part of a multipart upload, or segment of a segmented download, failed
+        /// with a transient error and is about to be attempted again. Handlers may be called on
+        /// any thread.
+        /// </summary>
+        public event EventHandler<S3PartRetryEventArgs> PartRetry;
+
+        /// <summary>
+        /// Fired when S3 answered a request for a bucket from, or pointed it to, a host other
+        /// than the one it was sent to. The new host has already been set for the bucket through
+        /// SetBucketHost() when this fires, so later requests go straight to it. Handlers may be
+        /// called on any thread.
+        /// </summary>
+        public event EventHandler<S3BucketRedirectedArgs> BucketRedirected;
+
         /// <summary>
         /// Gets or sets the hostname of the s3 server, usually "s3.amazonaws.com" unless you
         /// are using a 3rd party S3 implementation.
@@ -80,6 +105,22 @@ namespace LitS3
         /// </summary>
         public string DefaultDelimiter { get; set; }
 
+        /// <summary>
+        /// Gets or sets the number of times a single part of a multipart upload, or segment of
+        /// a segmented download, is attempted before the whole transfer is abandoned.
+        /// The default is 3.
+        /// </summary>
+        public int PartTransferAttempts { get; set; }
+
+        /// <summary>
+        /// Gets or sets what runs each part of a multipart upload, or segment of a segmented
+        /// download. It is given the transfer of one part, must run it and may retry it as it
+        /// sees fit, for instance to fit the part into a limit on requests in flight; an error
+        /// it lets out stops the whole transfer. When null, the default, each part is attempted
+        /// up to PartTransferAttempts times.
+        /// </summary>
+        public Action<Action> PartRunner { get; set; }
+
         /// <summary>
         /// Creates a new S3Service with the default values.
         /// </summary>
@@ -88,6 +129,7 @@ namespace LitS3
             this.Host = "s3.amazonaws.com";
             this.UseSsl = true;
             this.DefaultDelimiter = "/";
+            this.PartTransferAttempts = 3;
         }
 
         internal void AuthorizeRequest(S3Request request, HttpWebRequest webRequest, string bucketName)
@@ -102,6 +144,58 @@ namespace LitS3
                 authorizer.AuthorizeRequest(webRequest, bucketName);
         }
 
+        /// <summary>
+        /// Sets the hostname to use for requests to the given bucket instead of Host, for
+        /// instance the endpoint of the region the bucket is in. Pass null to go back to Host.
+        /// </summary>
+        public void SetBucketHost(string bucketName, string host)
+        {
+            lock (bucketHosts)
+            {
+                if (host != null)
+                    bucketHosts[bucketName] = host;
+                else
+                    bucketHosts.Remove(bucketName);
+            }
+        }
+
+        /// <summary>
+        /// Gets the hostname requests to the given bucket are sent to.
+        /// </summary>
+        public string GetBucketHost(string bucketName)
+        {
+            string host;
+
+            lock (bucketHosts)
+                return bucketHosts.TryGetValue(bucketName, out host) ? host : Host;
+        }
+
+        internal void OnBucketRedirected(string bucketName, string host)
+        {
+            // S3 may name the virtual host of the bucket itself
+            if (host.StartsWith(bucketName + ".", StringComparison.OrdinalIgnoreCase))
+                host = host.Substring(bucketName.Length + 1);
+
+            if (string.Equals(host, GetBucketHost(bucketName), StringComparison.OrdinalIgnoreCase))
+                return;
+
+            SetBucketHost(bucketName, host);
+
+            var handler = BucketRedirected;
+
+            if (handler != null)
+                handler(this, new S3BucketRedirectedArgs(bucketName, host));
+        }
+
+        internal void OnRequestCompleted(S3Request request, TimeSpan signingTime, TimeSpan responseTime,
+            HttpStatusCode statusCode, Exception error)
+        {
+            var handler = RequestCompleted;
+
+            if (handler != null)
+                handler(this, new S3RequestCompletedArgs(request, signingTime, responseTime, statusCode, error));
+        }
+
         #region Basic Operations
 
         /// <summary>
@@ -200,6 +294,18 @@ namespace LitS3
                 return response.IsEurope;
         }
 
+        /// <summary>
+        /// Gets the location constraint of a bucket, such as "EU" or "us-west-2", or an empty
+        /// string if the bucket is in the US Standard region.
+        /// </summary>
+        public string GetBucketLocation(string bucketName)
+        {
+            var request = new GetBucketLocationRequest(this, bucketName);
+
+            using (GetBucketLocationResponse response = request.GetResponse())
+                return response.Location;
+        }
+
         /// <summary>
         /// Queries a bucket for a listing of objects it contains. Only objects with keys
         /// beginning with the given prefix will be returned. The DefaultDelimiter will
@@ -320,6 +426,26 @@ namespace LitS3
             new DeleteObjectRequest(this, bucketName, key).GetResponse().Close();
         }
 
+        /// <summary>
+        /// The maximum number of objects that can be deleted with a single DeleteObjects request.
+        /// </summary>
+        public const int MaximumDeleteCount = 1000;
+
+        /// <summary>
+        /// Deletes the objects in the specified bucket with the specified keys using a single
+        /// request. Returns the keys that could not be deleted, if any.
+        /// </summary>
+        public IList<DeleteObjectsError> DeleteObjects(string bucketName, IEnumerable<string> keys)
+        {
+            var request = new DeleteObjectsRequest(this, bucketName);
+
+            foreach (string key in keys)
+                request.AddKey(key);
+
+            using (DeleteObjectsResponse response = request.GetResponse())
+                return response.Errors;
+        }
+
         #endregion
 
         #region Public Uri construction
@@ -454,6 +580,66 @@ namespace LitS3
                 AddObject(inputStream, inputStream.Length, bucketName, key, contentType, acl);
         }
 
+        /// <summary>
+        /// Uploads the contents of an existing local file to S3, optionally verifying that S3
+        /// received exactly what was read. See the Stream overload for how this is done.
+        /// </summary>
+        public void AddObject(string inputFile, string bucketName, string key,
+            string contentType, CannedAcl acl, bool verify)
+        {
+            using (Stream inputStream = File.OpenRead(inputFile))
+                AddObject(inputStream, inputStream.Length, bucketName, key, contentType, acl, verify);
+        }
+
+        /// <summary>
+        /// Adds an object to S3 by reading the specified amount of data from the given stream,
+        /// optionally verifying that S3 received exactly what was read. If the stream can seek,
+        /// the MD5 of the data is computed first and sent as Content-MD5, so S3 refuses damaged
+        /// data with BadDigest before it replaces anything. Otherwise it is computed as the data
+        /// is sent. Either way it is compared with the ETag S3 returns, and an S3Exception with
+        /// the BadDigest error code is thrown if they differ; the object is left as S3 stored it.
+        /// </summary>
+        public void AddObject(Stream inputStream, long bytes, string bucketName, string key,
+            string contentType, CannedAcl acl, bool verify)
+        {
+            if (!verify)
+            {
+                AddObject(inputStream, bytes, bucketName, key, contentType, acl);
+                return;
+            }
+
+            var request = new AddObjectRequest(this, bucketName, key)
+            {
+                ContentLength = bytes,
+                CannedAcl = acl
+            };
+
+            if (contentType != null) // if specified
+                request.ContentType = contentType;
+
+            byte[] digest = inputStream.CanSeek ? ComputeMD5(inputStream, bytes) : null;
+
+            if (digest != null)
+                request.ContentMD5 = Convert.ToBase64String(digest);
+
+            using (MD5 md5 = digest == null ? MD5.Create() : null)
+            {
+                using (Stream stream = request.GetRequestStream())
+                {
+                    CopyStream(inputStream, stream, bytes,
+                        CreateProgressCallback(bucketName, key, bytes, AddObjectProgress), md5);
+                    stream.Flush();
+                }
+
+                string etag;
+
+                using (AddObjectResponse response = request.GetResponse())
+                    etag = response.ETag;
+
+                VerifyETag(etag, digest != null ? ToHex(digest) : FinishHash(md5), bucketName, key);
+            }
+        }
+
         /// <summary>
         /// Uploads the contents of an existing local file to S3.
         /// </summary>
@@ -484,6 +670,192 @@ namespace LitS3
 
         #endregion
 
+        #region Multipart upload
+
+        /// <summary>
+        /// The smallest size S3 allows for any part of a multipart upload but the last.
+        /// </summary>
+        public const long MinimumPartSize = 5 * 1024 * 1024;
+
+        /// <summary>
+        /// The largest number of parts S3 allows in a multipart upload.
+        /// </summary>
+        public const int MaximumPartCount = 10000;
+
+        /// <summary>
+        /// Starts a multipart upload and returns the upload ID identifying it.
+        /// </summary>
+        public string InitiateMultipartUpload(string bucketName, string key, string contentType,
+            CannedAcl acl)
+        {
+            var request = new InitiateMultipartUploadRequest(this, bucketName, key) { CannedAcl = acl };
+
+            if (contentType != null) // if specified
+                request.ContentType = contentType;
+
+            using (InitiateMultipartUploadResponse response = request.GetResponse())
+                return response.UploadId;
+        }
+
+        /// <summary>
+        /// Uploads a part of a multipart upload by reading the specified amount of data from
+        /// the given stream. Returns the ETag of the part, which is needed to complete the upload.
+        /// </summary>
+        public string UploadPart(Stream inputStream, long bytes, string bucketName, string key,
+            string uploadId, int partNumber)
+        {
+            var request = new UploadPartRequest(this, bucketName, key, uploadId, partNumber)
+            {
+                ContentLength = bytes
+            };
+
+            return request.PerformWithRequestStream(stream =>
+            {
+                CopyStream(inputStream, stream, bytes, null);
+                stream.Flush();
+            });
+        }
+
+        /// <summary>
+        /// Completes a multipart upload given the ETags of its parts in part number order.
+        /// Returns the ETag of the completed object.
+        /// </summary>
+        public string CompleteMultipartUpload(string bucketName, string key, string uploadId,
+            IList<string> partETags)
+        {
+            var request = new CompleteMultipartUploadRequest(this, bucketName, key, uploadId);
+
+            for (int i = 0; i < partETags.Count; i++)
+                request.AddPart(i + 1, partETags[i]);
+
+            CompleteMultipartUploadResponse response = request.GetResponse();
+            response.Close();
+
+            if (response.Error != null)
+                throw response.Error;
+
+            return response.ETag;
+        }
+
+        /// <summary>
+        /// Aborts a multipart upload, discarding any parts uploaded so far.
+        /// </summary>
+        public void AbortMultipartUpload(string bucketName, string key, string uploadId)
+        {
+            new AbortMultipartUploadRequest(this, bucketName, key, uploadId).GetResponse().Close();
+        }
+
+        /// <summary>
+        /// Uploads the contents of an existing local file to S3 as a multipart upload, sending
+        /// up to the given number of parts at the same time. Each part is retried on its own
+        /// up to PartTransferAttempts times. Progress of all parts together is reported through
+        /// the AddObjectProgress event.
+        /// </summary>
+        public void AddObjectMultipart(string inputFile, string bucketName, string key,
+            string contentType, CannedAcl acl, long partSize, int parallelism)
+        {
+            AddObjectMultipart(inputFile, bucketName, key, contentType, acl, partSize, parallelism, false);
+        }
+
+        /// <summary>
+        /// Uploads the contents of an existing local file to S3 as a multipart upload, optionally
+        /// verifying that S3 received exactly what was read. The MD5 of each part is computed
+        /// before it is sent and sent along as Content-MD5, so S3 refuses a damaged part with
+        /// BadDigest, which is retried like any other failed part. The ETag of the completed
+        /// object is then checked against the digests of all parts; a mismatch is reported with
+        /// an S3Exception but the object is left as S3 stored it.
+        /// </summary>
+        public void AddObjectMultipart(string inputFile, string bucketName, string key,
+            string contentType, CannedAcl acl, long partSize, int parallelism, bool verify)
+        {
+            if (partSize < MinimumPartSize)
+                throw new ArgumentOutOfRangeException("partSize", "Parts must be at least 5 MB in size.");
+
+            if (parallelism < 1)
+                throw new ArgumentOutOfRangeException("parallelism", "At least one part must be uploaded at a time.");
+
+            long length = new FileInfo(inputFile).Length;
+            int partCount = (int)Math.Max(1, (length + partSize - 1) / partSize);
+
+            if (partCount > MaximumPartCount)
+                throw new ArgumentOutOfRangeException("partSize", "The file would need more than 10,000 parts; use a larger part size.");
+
+            string uploadId = InitiateMultipartUpload(bucketName, key, contentType, acl);
+
+            var etags = new string[partCount];
+            var digests = verify ? new byte[partCount][] : null;
+
+            Action<int, long> progressCallback =
+                CreatePartProgressCallback(bucketName, key, length, partCount, AddObjectProgress);
+
+            try
+            {
+                ForEachPartInParallel(partCount, parallelism, part =>
+                {
+                    long offset = part * partSize;
+                    long bytes = Math.Min(partSize, length - offset);
+
+                    var request = new UploadPartRequest(this, bucketName, key, uploadId, part + 1)
+                    {
+                        ContentLength = bytes
+                    };
+
+                    RaiseConnectionLimit(request, parallelism);
+
+                    using (var inputStream = new FileStream(inputFile, FileMode.Open, FileAccess.Read, FileShare.Read))
+                    {
+                        inputStream.Seek(offset, SeekOrigin.Begin);
+
+                        byte[] digest = verify ? ComputeMD5(inputStream, bytes) : null;
+
+                        if (digest != null)
+                            request.ContentMD5 = Convert.ToBase64String(digest);
+
+                        string etag = request.PerformWithRequestStream(stream =>
+                        {
+                            CopyStream(inputStream, stream, bytes, CreatePartCallback(progressCallback, part));
+                            stream.Flush();
+                        });
+
+                        if (verify)
+                        {
+                            VerifyETag(etag, ToHex(digest), bucketName, key);
+                            digests[part] = digest;
+                        }
+
+                        etags[part] = etag;
+                    }
+                });
+            }
+            catch
+            {
+                try
+                {
+                    AbortMultipartUpload(bucketName, key, uploadId);
+                }
+                catch (WebException) { } // report the original error instead
+                catch (S3Exception) { }
+
+                throw;
+            }
+
+            string objectETag = CompleteMultipartUpload(bucketName, key, uploadId, etags);
+
+            if (verify)
+            {
+                // S3 computes the ETag of a multipart object as the MD5 of the part digests
+                using (MD5 md5 = MD5.Create())
+                {
+                    foreach (byte[] digest in digests)
+                        md5.TransformBlock(digest, 0, digest.Length, null, 0);
+
+                    VerifyETag(objectETag, FinishHash(md5) + "-" + partCount, bucketName, key);
+                }
+            }
+        }
+
+        #endregion
+
         #region CopyObject
 
         /// <summary>
@@ -603,6 +975,150 @@ namespace LitS3
             GetObject(bucketName, key, outputFile, out contentType);
         }
 
+        /// <summary>
+        /// Gets an existing object in S3 and copies its data to the given Stream, optionally
+        /// verifying the data received. The MD5 of the data is computed as it arrives and
+        /// compared with the ETag of the object. If they differ, an S3Exception with the
+        /// BadDigest error code is thrown. Returns false if nothing could be verified because
+        /// the ETag of the object is not the MD5 of its content, as is the case for objects
+        /// uploaded in parts.
+        /// </summary>
+        public bool GetObject(string bucketName, string key, Stream outputStream, bool verify)
+        {
+            if (!verify)
+            {
+                GetObject(bucketName, key, outputStream);
+                return false;
+            }
+
+            using (GetObjectResponse response = new GetObjectRequest(this, bucketName, key).GetResponse())
+            using (Stream objectStream = response.GetResponseStream())
+            using (MD5 md5 = MD5.Create())
+            {
+                long contentLength = response.ContentLength;
+                string etag = response.ETag;
+                bool verifiable = IsMD5ETag(etag);
+
+                CopyStream(objectStream, outputStream, contentLength,
+                    CreateProgressCallback(bucketName, key, contentLength, GetObjectProgress),
+                    verifiable ? md5 : null);
+
+                if (verifiable)
+                    VerifyETag(etag, FinishHash(md5), bucketName, key);
+
+                return verifiable;
+            }
+        }
+
+        /// <summary>
+        /// Downloads an existing object in S3 to the given local file path, optionally verifying
+        /// the data received. See the Stream overload for how this is done. The data is written
+        /// to a temporary file that takes the place of the given one only once it has all
+        /// arrived and passed verification.
+        /// </summary>
+        public bool GetObject(string bucketName, string key, string outputFile, bool verify)
+        {
+            return WriteFileInPlace(outputFile, tempFile =>
+            {
+                using (Stream outputStream = File.Create(tempFile))
+                    return GetObject(bucketName, key, outputStream, verify);
+            });
+        }
+
+        /// <summary>
+        /// Writes a file by way of a temporary file next to it, which is moved into place only
+        /// if the write succeeds. A failed download then neither leaves behind a file that looks
+        /// complete nor destroys the one that was there before.
+        /// </summary>
+        static T WriteFileInPlace<T>(string outputFile, Func<string, T> write)
+        {
+            string tempFile = outputFile + "." + Guid.NewGuid().ToString("N") + ".tmp";
+
+            try
+            {
+                T result = write(tempFile);
+
+                if (File.Exists(outputFile))
+                    File.Replace(tempFile, outputFile, null);
+                else
+                    File.Move(tempFile, outputFile);
+
+                return result;
+            }
+            finally
+            {
+                if (File.Exists(tempFile))
+                    File.Delete(tempFile);
+            }
+        }
+
+        /// <summary>
+        /// Downloads an existing object in S3 to the given local file path by fetching ranges
+        /// of it, up to the given number at the same time. A temporary file next to the given
+        /// one is allocated up front, each range is written straight to its offset, and the
+        /// file is moved into place once all ranges are in. A range that fails is fetched again
+        /// on its own, up to PartTransferAttempts times. Progress of all ranges together is
+        /// reported through the GetObjectProgress event.
+        /// </summary>
+        public void GetObjectSegmented(string bucketName, string key, string outputFile,
+            long segmentSize, int parallelism)
+        {
+            if (segmentSize < 1)
+                throw new ArgumentOutOfRangeException("segmentSize", "Segments must be at least one byte in size.");
+
+            if (parallelism < 1)
+                throw new ArgumentOutOfRangeException("parallelism", "At least one segment must be downloaded at a time.");
+
+            long length;
+            string etag;
+
+            using (GetObjectResponse response = new GetObjectRequest(this, bucketName, key, true).GetResponse())
+            {
+                length = response.ContentLength;
+                etag = response.ETag;
+            }
+
+            int segmentCount = (int)Math.Max(1, (length + segmentSize - 1) / segmentSize);
+
+            WriteFileInPlace(outputFile, tempFile =>
+            {
+                using (Stream outputStream = File.Create(tempFile))
+                    outputStream.SetLength(length);
+
+                if (length > 0)
+                    GetSegments(bucketName, key, tempFile, etag, length, segmentSize, segmentCount, parallelism);
+
+                return true;
+            });
+        }
+
+        void GetSegments(string bucketName, string key, string outputFile, string etag,
+            long length, long segmentSize, int segmentCount, int parallelism)
+        {
+            Action<int, long> progressCallback =
+                CreatePartProgressCallback(bucketName, key, length, segmentCount, GetObjectProgress);
+
+            ForEachPartInParallel(segmentCount, parallelism, segment =>
+            {
+                long offset = segment * segmentSize;
+                long bytes = Math.Min(segmentSize, length - offset);
+
+                // make sure every segment comes from the same version of the object
+                var request = new GetObjectRequest(this, bucketName, key) { IfMatch = etag };
+                request.AddRange(offset, offset + bytes - 1);
+
+                RaiseConnectionLimit(request, parallelism);
+
+                using (GetObjectResponse response = request.GetResponse())
+                using (Stream objectStream = response.GetResponseStream())
+                using (var outputStream = new FileStream(outputFile, FileMode.Open, FileAccess.Write, FileShare.ReadWrite))
+                {
+                    outputStream.Seek(offset, SeekOrigin.Begin);
+                    CopyStream(objectStream, outputStream, bytes, CreatePartCallback(progressCallback, segment));
+                }
+            });
+        }
+
         /// <summary>
         /// Downloads an existing object in S3 and loads the entire contents into a string.
         /// This is only appropriate for very small objects and for testing.
@@ -629,9 +1145,218 @@ namespace LitS3
 
         #endregion
 
+        #region Parallel transfers
+
+        /// <summary>
+        /// Transfers each part of a larger transfer on up to the given number of threads.
+        /// A part that fails with a transient error is retried on its own, up to
+        /// PartTransferAttempts times, unless a PartRunner takes care of that. The first error that cannot be retried stops the
+        /// remaining parts and is rethrown once all threads have finished.
+        /// </summary>
+        void ForEachPartInParallel(int partCount, int parallelism, Action<int> transferPart)
+        {
+            int nextPart = -1;
+            Exception error = null;
+            var errorLock = new object();
+
+            ThreadStart worker = () =>
+            {
+                while (true)
+                {
+                    int part = Interlocked.Increment(ref nextPart);
+
+                    if (part >= partCount || error != null)
+                        break;
+
+                    var runner = PartRunner;
+
+                    if (runner != null)
+                    {
+                        try
+                        {
+                            runner(() => transferPart(part));
+                        }
+                        catch (Exception exception)
+                        {
+                            lock (errorLock)
+                                if (error == null)
+                                    error = exception;
+                            return;
+                        }
+                        continue;
+                    }
+
+                    for (int attempt = 1; ; attempt++)
+                    {
+                        try
+                        {
+                            transferPart(part);
+                            break;
+                        }
+                        catch (Exception exception)
+                        {
+                            if (attempt < PartTransferAttempts && IsTransientError(exception))
+                            {
+                                var handler = PartRetry;
+                                if (handler != null)
+                                    handler(this, new S3PartRetryEventArgs(part + 1, attempt, exception));
+                                continue;
+                            }
+
+                            lock (errorLock)
+                                if (error == null)
+                                    error = exception;
+                            return;
+                        }
+                    }
+                }
+            };
+
+            var threads = new Thread[Math.Min(parallelism, partCount)];
+
+            for (int i = 0; i < threads.Length; i++)
+            {
+                threads[i] = new Thread(worker) { IsBackground = true };
+                threads[i].Start();
+            }
+
+            foreach (Thread thread in threads)
+                thread.Join();
+
+            if (error != null)
+                throw error;
+        }
+
+        static bool IsTransientError(Exception exception)
+        {
+            var s3Exception = exception as S3Exception;
+
+            if (s3Exception != null)
+            {
+                switch (s3Exception.ErrorCode)
+                {
+                    case S3ErrorCode.BadDigest: // data damaged on the way, see VerifyETag
+                    case S3ErrorCode.InternalError:
+                    case S3ErrorCode.OperationAborted:
+                    case S3ErrorCode.RequestTimeout:
+                    case S3ErrorCode.SlowDown:
+                        return true;
+                    default:
+                        return false;
+                }
+            }
+
+            return exception is WebException || exception is IOException;
+        }
+
+        static void RaiseConnectionLimit(S3Request request, int limit)
+        {
+            // the default of 2 connections per host would serialize the parts
+            if (request.ServicePoint.ConnectionLimit < limit)
+                request.ServicePoint.ConnectionLimit = limit;
+        }
+
+        /// <summary>
+        /// Creates a callback that sums up the progress reported by each part of a parallel
+        /// transfer. A retried part starts over from zero, so only the difference from what
+        /// that part last reported is added.
+        /// </summary>
+        Action<int, long> CreatePartProgressCallback(string bucketName, string key, long length,
+            int partCount, EventHandler<S3ProgressEventArgs> handler)
+        {
+            Action<long> progressCallback = CreateProgressCallback(bucketName, key, length, handler);
+
+            if (progressCallback == null)
+                return null;
+
+            var partBytes = new long[partCount];
+            long totalBytes = 0;
+
+            progressCallback(0);
+
+            return (part, bytes) =>
+            {
+                lock (partBytes)
+                {
+                    totalBytes += bytes - partBytes[part];
+                    partBytes[part] = bytes;
+                    progressCallback(totalBytes);
+                }
+            };
+        }
+
+        static Action<long> CreatePartCallback(Action<int, long> progressCallback, int part)
+        {
+            return progressCallback != null
+                 ? bytes => progressCallback(part, bytes)
+                 : (Action<long>) null;
+        }
+
+        #endregion
+
+        #region Checksums
+
+        static string FinishHash(HashAlgorithm hash)
+        {
+            hash.TransformFinalBlock(new byte[0], 0, 0);
+            return ToHex(hash.Hash);
+        }
+
+        static string ToHex(byte[] bytes)
+        {
+            var hex = new StringBuilder(bytes.Length * 2);
+
+            foreach (byte b in bytes)
+                hex.Append(b.ToString("x2"));
+
+            return hex.ToString();
+        }
+
+        /// <summary>
+        /// Computes the MD5 of the given number of bytes from a stream that can seek, then puts
+        /// the stream back where it was so the same bytes can be sent.
+        /// </summary>
+        static byte[] ComputeMD5(Stream stream, long bytes)
+        {
+            long start = stream.Position;
+
+            using (MD5 md5 = MD5.Create())
+            {
+                CopyStream(stream, Stream.Null, bytes, null, md5);
+                md5.TransformFinalBlock(new byte[0], 0, 0);
+                stream.Position = start;
+                return md5.Hash;
+            }
+        }
+
+        /// <summary>
+        /// Returns whether an ETag is the MD5 of the object's content, which is not the case
+        /// for objects uploaded in parts.
+        /// </summary>
+        static bool IsMD5ETag(string etag)
+        {
+            return etag != null && etag.IndexOf('-') < 0;
+        }
+
+        static void VerifyETag(string etag, string expected, string bucketName, string key)
+        {
+            if (etag == null || !string.Equals(etag.Trim('"'), expected, StringComparison.OrdinalIgnoreCase))
+                throw new S3Exception(S3ErrorCode.BadDigest, bucketName, string.Format(
+                    "The data transferred for {0} has the MD5 {1}, which does not match the ETag {2} reported by S3.",
+                    key, expected, etag), null);
+        }
+
+        #endregion
+
         #region CopyStream
 
         static void CopyStream(Stream source, Stream dest, long length, Action<long> progressCallback)
+        {
+            CopyStream(source, dest, length, progressCallback, null);
+        }
+
+        static void CopyStream(Stream source, Stream dest, long length, Action<long> progressCallback,
+            HashAlgorithm hash)
         {
             var buffer = new byte[8192];
         
@@ -641,13 +1366,16 @@ namespace LitS3
             long totalBytesRead = 0;
             while (totalBytesRead < length) // reuse this local var
             {
-                int bytesRead = source.Read(buffer, 0, buffer.Length);
+                int bytesRead = source.Read(buffer, 0, (int)Math.Min(buffer.Length, length - totalBytesRead));
 
                 if (bytesRead > 0)
                     dest.Write(buffer, 0, bytesRead);
                 else
                     throw new Exception("Unexpected end of stream while copying.");
 
+                if (hash != null)
+                    hash.TransformBlock(buffer, 0, bytesRead, null, 0);
+
                 totalBytesRead += bytesRead;
                 
                 if (progressCallback != null) 